@@ -1,36 +1,96 @@
-import os
+import argparse
 import base64
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+import os
+import time
 from datetime import datetime
 import re
 import html
 import unicodedata
-from bs4 import BeautifulSoup
+from body_stream import (DEFAULT_MAX_BODY_CHARS, DEFAULT_STREAM_BYTES,
+                         BodyStats, decoded_size, extract_bounded,
+                         part_digest, truncation_note)
+from corpus_stats import CorpusStats, format_summary
+from dedup import DuplicateIndex
+from extractive_summary import iter_batches, summarize_batch
+from heavy_hitters import MailboxHeavyHitters
+from email_record import EmailRecord, ThreadRecord
+import gmail_client
+from rate_limiter import QuotaLimiter
+from job_journal import JobJournal
+from local_store import DEFAULT_DB_PATH, LocalStore
+from mail_filter import MailFilter
+from section_index import SectionIndex, content_digest
+import local_ingest
+import multi_account
+from mime_payload import decode_text, part_charset
+from raw_archive import DEFAULT_ARCHIVE_PATH, RawArchive
+from threads import strip_quoted
+from view_cache import CleanedPartCache
+import work_queue
+
+REPORT_PATH = 'email_analysis.txt'
+# Số email tối đa mỗi trang của messages().list
+MAX_PAGE_SIZE = 500
+# Thời gian worker chờ khi các lô còn lại đang do worker khác giữ
+WORKER_POLL_SECONDS = 10
+# Số người gửi được liệt kê từ khoá trong phần thống kê
+TOP_SENDER_KEYWORDS = 5
 
 
 class GmailSummarizer:
-    def __init__(self):
-        self.SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
-        self.service = self.gmail_connect()
+    def __init__(self, token_path=gmail_client.TOKEN_PATH,
+                 credentials_path=gmail_client.CREDENTIALS_PATH,
+                 interactive=True, max_concurrency=None,
+                 max_body_chars=DEFAULT_MAX_BODY_CHARS, mail_filter=None,
+                 archive_path=None, offline=False,
+                 fetch_format=gmail_client.DEFAULT_FETCH_FORMAT,
+                 stream_bytes=DEFAULT_STREAM_BYTES,
+                 store_path=DEFAULT_DB_PATH):
+        self.SCOPES = gmail_client.SCOPES
+        self.token_path = token_path
+        self.credentials_path = credentials_path
+        self.interactive = interactive
+        # Kho message thô: message đã có trong kho không phải tải lại,
+        # offline=True chỉ đọc từ kho, không kết nối Gmail
+        self.archive = RawArchive(archive_path) if archive_path else None
+        if offline and self.archive is None:
+            raise ValueError("Chế độ offline cần có kho message (--archive)")
+        self.offline = offline
+        # format='full' hoặc 'raw' khi gọi messages().get
+        self.fetch_format = fetch_format
+        self.services = None if offline else self.gmail_connect()
+        # Giới hạn quota, thử lại và số request song song khi tải email
+        self.limiter = QuotaLimiter()
+        if max_concurrency is not None:
+            self.limiter.controller.maximum = max_concurrency
+            self.limiter.controller.limit = min(
+                self.limiter.controller.limit, max_concurrency)
+        self.failed = {}
+        # Phần nội dung lớn hơn stream_bytes (sau giải mã base64) được xử lý
+        # theo luồng và chỉ giữ max_body_chars ký tự
+        self.stream_bytes = stream_bytes
+        self.max_body_chars = max_body_chars
+        # Điều kiện lọc gửi kèm request list, mặc định là toàn bộ INBOX
+        self.mail_filter = mail_filter or MailFilter()
+        # Chỉ mục email đã phân tích và cache (có giới hạn dung lượng) phần
+        # nội dung đã làm sạch
+        self.dedup = DuplicateIndex()
+        self.cleaned_parts = CleanedPartCache()
+        # Chỉ số của từng email cho phần thống kê tổng quan
+        self.corpus = CorpusStats()
+        # Top người gửi, tên miền và máy chủ liên kết với bộ nhớ cố định
+        self.heavy_hitters = MailboxHeavyHitters()
+        # Chỉ mục toàn văn cục bộ, cập nhật dần khi xử lý email
+        self.store = LocalStore(store_path)
 
     def gmail_connect(self):
-        creds = None
-        if os.path.exists('token.json'):
-            creds = Credentials.from_authorized_user_file(
-                'token.json', self.SCOPES)
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    'credentials.json', self.SCOPES)
-                creds = flow.run_local_server(port=0)
-            with open('token.json', 'w') as token:
-                token.write(creds.to_json())
-        return build('gmail', 'v1', credentials=creds)
+        return gmail_client.connect(
+            self.token_path, self.credentials_path, self.SCOPES,
+            self.interactive)
+
+    @property
+    def service(self):
+        return self.services.get()
 
     def clean_text(self, text):
         """Làm sạch và format văn bản"""
@@ -67,159 +127,797 @@ class GmailSummarizer:
 
         return '\n'.join(unique_lines)
 
-    def decode_email_part(self, part):
+    def decode_email_part(self, part, strip_quotes=False):
+        """Giải mã và làm sạch một phần MIME, trả về (văn bản, thống kê)
+
+        Thống kê chỉ có với phần lớn bị cắt bớt, còn lại là None.
+        strip_quotes bỏ phần trích dẫn thư cũ (khi xử lý theo hội thoại),
+        kể cả với phần lớn đi theo đường luồng.
+        """
         try:
             if part.get('body') and part['body'].get('data'):
-                content = base64.urlsafe_b64decode(
-                    part['body']['data']).decode('utf-8', errors='ignore')
+                data = part['body']['data']
+                mime_type = part.get('mimeType', '')
+                charset = part_charset(part)
+                # Phần nội dung giống hệt đã làm sạch trước đó thì dùng lại
+                key = (mime_type, charset, part_digest(data), strip_quotes)
+                cached = self.cleaned_parts.get(key)
+                if cached is not None:
+                    return cached
+
+                if decoded_size(data) > self.stream_bytes:
+                    result = extract_bounded(
+                        data, mime_type, self.clean_text, self.max_body_chars,
+                        charset, strip_quotes)
+                    self.cleaned_parts.put(key, result)
+                    return result
+
+                content = decode_text(base64.urlsafe_b64decode(data), charset)
+                if strip_quotes:
+                    content = strip_quoted(content, mime_type)
 
                 if 'text/html' in part.get('mimeType', ''):
+                    from bs4 import BeautifulSoup
                     soup = BeautifulSoup(content, 'html.parser')
                     # Loại bỏ các thẻ script và style
                     for script in soup(["script", "style"]):
                         script.decompose()
                     content = soup.get_text(separator='\n', strip=True)
 
-                return self.clean_text(content)
-            return ""
+                result = self.clean_text(content), None
+                self.cleaned_parts.put(key, result)
+                return result
+            return "", None
         except Exception as e:
             print(f"Lỗi khi giải mã email: {str(e)}")
-            return ""
+            return "", None
 
-    def format_email_content(self, email_data, index):
+    def format_email_content(self, email_data, index, analysis=None):
         """Format nội dung email với cấu trúc rõ ràng"""
+        if analysis is None:
+            analysis = self.analyze_content(
+                email_data.body, email_data.stats,
+                keywords=email_data.keywords)
         return f"""
 {'-'*80}
 Email #{index}
 {'-'*80}
 
-Từ: {email_data['from']}
-Tiêu đề: {email_data['subject']}
-Thời gian: {email_data['date']}
+Từ: {email_data.sender}
+Tiêu đề: {email_data.subject}
+Thời gian: {email_data.date}
 
 PHÂN TÍCH NỘI DUNG:
 {'-'*40}
-{self.analyze_content(email_data['body'])}
+{analysis}
 
 NỘI DUNG GỐC:
 {'-'*40}
-{email_data['body']}
+{email_data.body}{truncation_note(email_data.stats)}
 
 {'='*80}
 """
 
-    def analyze_content(self, content):
-        """Phân tích nội dung email"""
+    def format_duplicate_content(self, email_data, index, match):
+        """Format email trùng lặp, chỉ tham chiếu tới email gốc"""
+        if match.exact:
+            similarity = "giống hệt"
+        else:
+            similarity = f"gần giống, Jaccard ~{match.similarity:.2f}"
+        return f"""
+{'-'*80}
+Email #{index}
+{'-'*80}
+
+Từ: {email_data.sender}
+Tiêu đề: {email_data.subject}
+Thời gian: {email_data.date}
+
+TRÙNG LẶP: {similarity} với Email #{match.key}, dùng lại kết quả phân tích.
+
+{'='*80}
+"""
+
+    def format_failed_content(self, msg_id, index):
+        """Ghi lại email không tải được để không bị mất khỏi báo cáo"""
+        return f"""
+{'-'*80}
+Email #{index}
+{'-'*80}
+
+KHÔNG TẢI ĐƯỢC EMAIL (id: {msg_id})
+Lỗi: {self.failed.get(msg_id, 'Không rõ')}
+
+{'='*80}
+"""
+
+    def format_duplicate_groups(self):
+        """Liệt kê các nhóm email trùng lặp"""
+        groups = self.dedup.groups()
+        if not groups:
+            return ""
+        lines = ["Nhóm email trùng lặp:"]
+        for key, duplicates in groups.items():
+            others = ', '.join(f"#{dup}" for dup in duplicates)
+            lines.append(f"  Email #{key}: {others}")
+        return '\n'.join(lines) + '\n'
+
+    def analyze_content(self, content, stats=None, summary=None,
+                        keywords=None):
+        """Phân tích nội dung email
+
+        stats là thống kê tính sẵn trên toàn bộ nội dung khi content đã bị
+        cắt bớt; không có thì tính trực tiếp trên content. summary là các câu
+        tóm tắt đã tính theo lô bằng summarize_records, keywords là từ khoá
+        đã trích trong kho cục bộ.
+        """
+        if stats is None:
+            stats = BodyStats.from_text(content)
+        if summary is None:
+            summary = summarize_batch(
+                [content],
+                document_frequency=self.store.document_frequencies)[0]
         analysis = []
 
         # Đếm số từ
-        words = len(content.split())
-        analysis.append(f"Số từ: {words}")
+        analysis.append(f"Số từ: {stats.words}")
 
         # Đếm số câu
-        sentences = len(re.findall(r'[.!?]+', content))
-        analysis.append(f"Số câu: {sentences}")
+        analysis.append(f"Số câu: {stats.sentences}")
 
         # Phát hiện URLs
-        urls = re.findall(r'https?://\S+', content)
-        if urls:
-            analysis.append(f"Số liên kết: {len(urls)}")
+        if stats.urls:
+            analysis.append(f"Số liên kết: {stats.urls}")
 
         # Phát hiện địa chỉ email
-        emails = re.findall(r'[\w\.-]+@[\w\.-]+', content)
-        if emails:
-            analysis.append(f"Số địa chỉ email: {len(emails)}")
+        if stats.emails:
+            analysis.append(f"Số địa chỉ email: {stats.emails}")
+
+        if keywords:
+            analysis.append(f"Từ khoá: {', '.join(keywords)}")
 
-        # Phân tích chủ đề chính (dựa trên 50 từ đầu tiên)
-        first_50_words = ' '.join(content.split()[:50])
-        analysis.append(f"\nĐoạn mở đầu:\n{first_50_words}...")
+        # Tóm tắt bằng các câu tiêu biểu, không có câu nào đủ dài thì
+        # dùng 50 từ đầu tiên
+        if summary:
+            sentences = '\n'.join(f"- {sentence}" for sentence in summary)
+            analysis.append(f"\nTóm tắt:\n{sentences}")
+        else:
+            first_50_words = ' '.join(stats.opening)
+            analysis.append(f"\nĐoạn mở đầu:\n{first_50_words}...")
 
         return '\n'.join(analysis)
 
+    def build_record(self, message, strip_quotes=False):
+        """Tạo EmailRecord từ message Gmail API (format='full')"""
+        if 'parts' in message['payload']:
+            parts = [part for part in message['payload']['parts']
+                     if part['mimeType'] in ['text/plain', 'text/html']]
+        else:
+            parts = [message['payload']]
+
+        decoded = [self.decode_email_part(part, strip_quotes)
+                   for part in parts]
+        decoded = [(text, stats) for text, stats in decoded if text]
+        content = [text for text, _ in decoded]
+
+        record = EmailRecord.from_message(
+            message, '\n'.join(content), clean=self.clean_text)
+        if any(stats is not None for _, stats in decoded):
+            # Có phần bị cắt bớt: thống kê lấy trên toàn bộ nội dung
+            record.stats = BodyStats()
+            for text, stats in decoded:
+                record.stats.merge(stats or BodyStats.from_text(text))
+        return record
+
+    def fetch_message(self, msg_id):
+        """Message thô: lấy từ kho nếu có, không thì tải và lưu vào kho"""
+        if self.archive is not None:
+            message = self.archive.get(msg_id)
+            if message is not None:
+                return message
+            if self.offline:
+                raise KeyError(f"Không có trong kho: {msg_id}")
+        message = gmail_client.normalize_message(self.limiter.execute(
+            'messages.get',
+            lambda: gmail_client.message_request(
+                self.service, msg_id, self.fetch_format)))
+        if self.archive is not None:
+            self.archive.append(message)
+        return message
+
     def get_email_content(self, msg_id):
         try:
-            message = self.service.users().messages().get(
-                userId='me',
-                id=msg_id,
-                format='full'
-            ).execute()
-
-            headers = message['payload']['headers']
-            subject = next((h['value'] for h in headers if h['name'].lower(
-            ) == 'subject'), 'Không có tiêu đề')
-            sender = next((h['value'] for h in headers if h['name'].lower(
-            ) == 'from'), 'Không rõ người gửi')
-            date = next((h['value']
-                        for h in headers if h['name'].lower() == 'date'), '')
-
-            content = []
-            if 'parts' in message['payload']:
-                for part in message['payload']['parts']:
-                    if part['mimeType'] in ['text/plain', 'text/html']:
-                        part_content = self.decode_email_part(part)
-                        if part_content:
-                            content.append(part_content)
-            else:
-                part_content = self.decode_email_part(message['payload'])
-                if part_content:
-                    content.append(part_content)
-
-            return {
-                'subject': self.clean_text(subject),
-                'from': self.clean_text(sender),
-                'date': date,
-                'body': '\n'.join(content)
-            }
+            return self.build_record(self.fetch_message(msg_id))
         except Exception as e:
             print(f"Lỗi khi đọc email: {str(e)}")
+            self.failed[msg_id] = str(e)
             return None
 
-    def process_emails(self, max_emails=10):
-        try:
-            results = self.service.users().messages().list(
-                userId='me',
-                labelIds=['INBOX'],
-                maxResults=max_emails
-            ).execute()
-
-            messages = results.get('messages', [])
+    def get_thread(self, thread_id):
+        """Tải cả cuộc hội thoại bằng một lần gọi threads().get
 
-            if not messages:
-                return "Không tìm thấy email nào."
+        Phần trích dẫn thư cũ trong các email trả lời được bỏ đi, vì nội
+        dung đó đã có trong email trước của cùng hội thoại.
+        """
+        try:
+            thread = self.limiter.execute(
+                'threads.get',
+                lambda: self.service.users().threads().get(
+                    userId='me',
+                    id=thread_id,
+                    format='full'
+                ))
+            if self.archive is not None:
+                for message in thread.get('messages', []):
+                    self.archive.append(message)
+            return ThreadRecord(thread_id, [
+                self.build_record(message, strip_quotes=True)
+                for message in thread.get('messages', [])])
+        except Exception as e:
+            print(f"Lỗi khi đọc hội thoại: {str(e)}")
+            self.failed[thread_id] = str(e)
+            return None
 
-            report = f"""BÁO CÁO PHÂN TÍCH EMAIL
+    def iter_message_id_pages(self, max_emails):
+        """Lấy id email trong INBOX theo từng trang (tối đa 500 id mỗi trang)"""
+        return self.iter_id_pages('messages', max_emails)
+
+    def iter_thread_id_pages(self, max_threads):
+        """Lấy id hội thoại trong INBOX theo từng trang"""
+        return self.iter_id_pages('threads', max_threads)
+
+    def iter_id_pages(self, resource, max_items):
+        """Duyệt messages().list hoặc threads().list theo từng trang
+
+        Bộ lọc được đẩy xuống server qua labelIds và q. Ở chế độ offline id
+        lấy từ kho theo thứ tự đã lưu, không áp dụng bộ lọc.
+        """
+        if self.offline:
+            if resource != 'messages':
+                raise ValueError(
+                    "Chế độ offline chỉ hỗ trợ phân tích theo email")
+            ids = self.archive.ids()[:max_items]
+            for start in range(0, len(ids), MAX_PAGE_SIZE):
+                yield ids[start:start + MAX_PAGE_SIZE]
+            return
+        count = 0
+        page_token = None
+        params = self.mail_filter.list_params()
+        while count < max_items:
+            results = self.limiter.execute(
+                f'{resource}.list',
+                lambda: getattr(self.service.users(), resource)().list(
+                    userId='me',
+                    maxResults=min(max_items - count, MAX_PAGE_SIZE),
+                    pageToken=page_token,
+                    **params
+                ))
+            ids = [item['id'] for item in results.get(resource, [])]
+            count += len(ids)
+            if ids:
+                yield ids
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                break
+
+    def list_message_ids(self, max_emails):
+        return [msg_id for page in self.iter_message_id_pages(max_emails)
+                for msg_id in page]
+
+    def list_thread_ids(self, max_threads):
+        return [thread_id for page in self.iter_thread_id_pages(max_threads)
+                for thread_id in page]
+
+    @staticmethod
+    def format_report_header(total, threads=False, description=''):
+        unit = "hội thoại" if threads else "email"
+        selection = f"Bộ lọc: {description}\n" if description else ""
+        return f"""BÁO CÁO PHÂN TÍCH EMAIL
 Thời gian tạo: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-Số lượng email phân tích: {min(len(messages), max_emails)}
-{'='*80}\n"""
-
-            for i, message in enumerate(messages, 1):
-                print(f"Đang xử lý email {i}/{len(messages)}...")
-                email_data = self.get_email_content(message['id'])
-                if email_data:
-                    report += self.format_email_content(email_data, i)
-
-            # Thêm thống kê tổng quan
-            total_stats = "\nTHỐNG KÊ TỔNG QUAN:\n" + "="*30 + "\n"
-            total_stats += f"Tổng số email đã phân tích: {len(messages)}\n"
-            total_stats += f"Thời gian hoàn thành: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-
-            return report + total_stats
+Số lượng {unit} phân tích: {total}
+{selection}{'='*80}\n"""
+
+    def format_report_footer(self, total, threads=False):
+        total_stats = "\nTHỐNG KÊ TỔNG QUAN:\n" + "="*30 + "\n"
+        if threads:
+            total_stats += f"Tổng số hội thoại đã phân tích: {total}\n"
+            total = len(self.corpus)
+        total_stats += f"Tổng số email đã phân tích: {total}\n"
+        if self.failed:
+            total_stats += f"Số email không tải được: {len(self.failed)}\n"
+        total_stats += self.format_duplicate_groups()
+        total_stats += format_summary(self.corpus.summary())
+        total_stats += self.heavy_hitters.format()
+        total_stats += self.format_sender_keywords()
+        total_stats += f"Thời gian hoàn thành: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+        return total_stats
+
+    def format_sender_keywords(self, limit=TOP_SENDER_KEYWORDS):
+        """Từ khoá nổi bật của những người gửi nhiều nhất"""
+        senders = self.heavy_hitters.streams['senders'].top(limit)
+        lines = []
+        for address, _ in senders:
+            keywords = self.store.sender_keywords(address)
+            if keywords:
+                lines.append(f"  {address}: {', '.join(keywords)}")
+        if not lines:
+            return ""
+        return "\nTừ khoá theo người gửi:\n" + '\n'.join(lines) + '\n'
+
+    def summarize_records(self, records):
+        """Tóm tắt cả lô email cùng lúc, email không tải được có danh sách rỗng
+
+        Các email được đưa vào kho cục bộ trước, để IDF lấy từ tần suất của
+        cả kho (kể cả lô này) chứ không chỉ của lô: tóm tắt không đổi theo
+        cách chia lô hay khi chạy tiếp bằng --resume.
+        """
+        for record in records:
+            if record:
+                self.store.index_email(
+                    record.msg_id, record.subject, record.sender,
+                    record.date, record.body)
+        return summarize_batch(
+            [record.body if record else '' for record in records],
+            document_frequency=self.store.document_frequencies)
+
+    def summarize_threads(self, threads):
+        """Tóm tắt mọi email của các hội thoại trong một lô
+
+        Trả về danh sách tóm tắt theo từng email cho mỗi hội thoại.
+        """
+        summaries = iter(self.summarize_records(
+            [message for thread in threads if thread
+             for message in thread.messages]))
+        return [[next(summaries) for _ in thread.messages] if thread else None
+                for thread in threads]
+
+    def format_thread_header(self, thread, index):
+        participants = ', '.join(thread.participants())
+        return f"""
+{'#'*80}
+Hội thoại #{index}: {thread.subject}
+Số email: {len(thread.messages)}
+Người tham gia: {participants}
+{'#'*80}
+"""
 
+    def process_thread(self, thread_id, index, thread, summaries=None):
+        """Phân tích một hội thoại, trả về (đoạn báo cáo, trạng thái, chỉ số)
+
+        Email thứ j của hội thoại được đánh số "index.j" trong báo cáo.
+        Trạng thái là 'duplicate' nếu có email trùng với email khác.
+        """
+        if not thread:
+            return self.format_failed_content(thread_id, index), 'failed', None
+
+        sections = [self.format_thread_header(thread, index)]
+        metrics = []
+        status = 'ok'
+        summaries = summaries or [None] * len(thread.messages)
+        for j, (email_data, summary) in enumerate(
+                zip(thread.messages, summaries), 1):
+            section, message_status = self.process_message(
+                email_data.msg_id, f"{index}.{j}", email_data, summary)
+            sections.append(section)
+            metrics.append(CorpusStats.metrics_row(email_data))
+            if message_status == 'duplicate':
+                status = 'duplicate'
+        return ''.join(sections), status, metrics
+
+    def reuse_section(self, index, item, metrics):
+        """Ghi nhận email (hoặc hội thoại) có đoạn báo cáo được dùng lại
+
+        Không phân tích lại, chỉ cộng chỉ số và đưa nội dung vào chỉ mục
+        trùng lặp để email sau vẫn được so khớp với nó.
+        """
+        self.replay_metrics(metrics)
+        messages = getattr(item, 'messages', None)
+        if messages is None:
+            self.dedup.add(index, item.body, None)
+            return
+        for j, email_data in enumerate(messages, 1):
+            self.dedup.add(f"{index}.{j}", email_data.body, None)
+
+    def replay_metrics(self, metrics):
+        """Cộng lại chỉ số đã ghi nhận (một email hoặc cả hội thoại)"""
+        rows = metrics if isinstance(metrics, list) else [metrics]
+        for row in rows:
+            self.corpus.add_row(row)
+            self.heavy_hitters.add(row['address'], row['hosts'])
+
+    def process_message(self, msg_id, index, email_data, summary=None):
+        """Phân tích một email, trả về (đoạn báo cáo, trạng thái)
+
+        Email đã được đưa vào kho cục bộ khi tóm tắt theo lô
+        (summarize_records), ở đây chỉ đọc từ khoá đã trích.
+        """
+        if not email_data:
+            return self.format_failed_content(msg_id, index), 'failed'
+
+        email_data.keywords = tuple(self.store.get_keywords(msg_id) or ())
+        if email_data.stats is None:
+            email_data.stats = BodyStats.from_text(email_data.body)
+        self.corpus.add_record(email_data)
+        self.heavy_hitters.add(email_data.address, email_data.stats.hosts)
+
+        match = self.dedup.find(email_data.body)
+        if match:
+            email_data.analysis = match.payload
+            self.dedup.add_duplicate(index, match)
+            return self.format_duplicate_content(
+                email_data, index, match), 'duplicate'
+
+        analysis = self.analyze_content(
+            email_data.body, email_data.stats, summary, email_data.keywords)
+        email_data.analysis = analysis
+        self.dedup.add(index, email_data.body, analysis)
+        return self.format_email_content(email_data, index, analysis), 'ok'
+
+    def enqueue_messages(self, queue, max_emails):
+        """Coordinator: đưa id email vào hàng đợi dùng chung theo từng trang"""
+        total = 0
+        for ids in self.iter_message_id_pages(max_emails):
+            queue.enqueue(ids)
+            total += len(ids)
+            print(f"Đã đưa {total} id vào hàng đợi...")
+        return total
+
+    def run_worker(self, queue, shards_dir=work_queue.SHARDS_DIR,
+                   worker_id=None,
+                   batch_size=work_queue.DEFAULT_BATCH_SIZE,
+                   lease_seconds=work_queue.DEFAULT_LEASE_SECONDS):
+        """Worker: thuê từng lô id, xử lý và ghi kết quả ra shard"""
+        worker_id = worker_id or work_queue.default_worker_id()
+        processed = 0
+        while True:
+            batch = queue.lease(worker_id, batch_size, lease_seconds)
+            if not batch:
+                # Còn lô đang do worker khác giữ: chờ, có thể lease hết hạn
+                if queue.counts().get('leased'):
+                    time.sleep(WORKER_POLL_SECONDS)
+                    continue
+                return processed
+
+            records = []
+            statuses = {}
+            fetched = []
+            for email_data in self.limiter.map(
+                    self.get_email_content, [msg_id for _, msg_id in batch]):
+                fetched.append(email_data)
+                # Gia hạn theo từng email tải xong để lô tải chậm không bị
+                # worker khác thu hồi giữa chừng
+                queue.renew(worker_id, lease_seconds)
+            summaries = self.summarize_records(fetched)
+            for (position, msg_id), email_data, summary in zip(
+                    batch, fetched, summaries):
+                section, status = self.process_message(
+                    msg_id, position, email_data, summary)
+                records.append({
+                    'id': msg_id,
+                    'position': position,
+                    'status': status,
+                    'section': section,
+                    'metrics': (CorpusStats.metrics_row(email_data)
+                                if email_data else None)
+                })
+                statuses[msg_id] = status
+                queue.renew(worker_id, lease_seconds)
+
+            work_queue.write_shard(shards_dir, worker_id, records)
+            queue.complete(worker_id, statuses)
+            processed += len(batch)
+            print(f"[{worker_id}] đã xử lý {processed} email")
+
+    def process_emails(self, max_emails=10, report_path=REPORT_PATH,
+                       resume=False, threads=False):
+        """Phân tích email và ghi báo cáo dần ra file
+
+        Mỗi email xử lý xong được ghi nhận trong journal, nên nếu lượt chạy
+        bị dừng giữa chừng thì resume=True sẽ chạy tiếp từ email kế tiếp.
+        threads=True xử lý theo hội thoại: max_emails là số hội thoại.
+        Email có nội dung không đổi so với báo cáo trước được chép lại đoạn
+        cũ thay vì phân tích lại (xem section_index).
+        """
+        journal = JobJournal(report_path)
+        sections = SectionIndex(report_path)
+        try:
+            if resume and journal.exists():
+                state = journal.load()
+                if state.finished:
+                    return "Lượt chạy trước đã hoàn tất, không có gì để chạy tiếp."
+                journal.reopen()
+                report = open(report_path, 'r+b')
+                # Bỏ phần ghi dở sau lần ghi nhận cuối cùng
+                report.truncate(state.offset)
+                report.seek(state.offset)
+                sections.resume(state.offset)
+                threads = state.params.get('threads', False)
+                for metrics in state.metrics.values():
+                    self.replay_metrics(metrics)
+                print(f"Chạy tiếp: còn {len(state.pending())}/{len(state.ids)} email")
+            else:
+                if threads:
+                    ids = self.list_thread_ids(max_emails)
+                else:
+                    ids = self.list_message_ids(max_emails)
+                if not ids:
+                    return "Không tìm thấy email nào."
+                state = journal.start(ids, max_emails=max_emails,
+                                      threads=threads,
+                                      query=self.mail_filter.to_query())
+                sections.start()
+                report = open(report_path, 'wb')
+                report.write(self.format_report_header(
+                    len(ids), threads,
+                    self.mail_filter.describe()).encode('utf-8'))
+                report.flush()
+                journal.commit_header(report.tell())
+
+            with report:
+                pending = state.pending()
+                # Tải song song, kết quả vẫn được xử lý theo đúng thứ tự
+                fetch = self.get_thread if threads else self.get_email_content
+                fetched = self.limiter.map(
+                    fetch, [item_id for _, item_id in pending])
+                unit = "hội thoại" if threads else "email"
+                # Tóm tắt theo lô để tính trên ma trận thưa một lần mỗi lô
+                for batch in iter_batches(zip(pending, fetched)):
+                    digests = {item_id: content_digest(item)
+                               for (_, item_id), item in batch if item}
+                    cached = {}
+                    for (i, item_id), item in batch:
+                        if item:
+                            hit = sections.lookup(
+                                item_id, digests[item_id], i)
+                            if hit:
+                                cached[item_id] = hit
+                    # Chỉ tóm tắt email cần phân tích lại
+                    items = [None if item_id in cached else item
+                             for (_, item_id), item in batch]
+                    if threads:
+                        summaries = self.summarize_threads(items)
+                    else:
+                        summaries = self.summarize_records(items)
+                    for ((i, item_id), item), summary in zip(
+                            batch, summaries):
+                        print(f"Đang xử lý {unit} {i}/{len(state.ids)}...")
+                        if item_id in cached:
+                            entry, section = cached[item_id]
+                            status, metrics = entry.status, entry.metrics
+                            self.reuse_section(i, item, metrics)
+                        elif threads:
+                            section, status, metrics = self.process_thread(
+                                item_id, i, item, summary)
+                        else:
+                            section, status = self.process_message(
+                                item_id, i, item, summary)
+                            metrics = (CorpusStats.metrics_row(item)
+                                       if item else None)
+                        offset = report.tell()
+                        data = section.encode('utf-8')
+                        report.write(data)
+                        report.flush()
+                        os.fsync(report.fileno())
+                        if item:
+                            sections.record(item_id, digests[item_id], i,
+                                            offset, len(data), status,
+                                            metrics)
+                        journal.mark_done(
+                            item_id, i, status, report.tell(), metrics)
+
+                # Thêm thống kê tổng quan
+                report.write(self.format_report_footer(
+                    len(state.ids), threads).encode('utf-8'))
+            journal.finish()
+            sections.finish()
+            if self.archive is not None:
+                self.archive.flush()
+            if sections.reused:
+                return (f"Đã phân tích {len(state.ids)} email "
+                        f"({sections.reused} dùng lại từ báo cáo trước).")
+            return f"Đã phân tích {len(state.ids)} email."
+
+        except KeyboardInterrupt:
+            return "Đã dừng. Chạy lại với --resume để tiếp tục."
         except Exception as e:
             return f"Lỗi khi xử lý email: {str(e)}"
+        finally:
+            journal.close()
+            sections.close()
+
+
+def merge_shard_reports(queue, shards_dir, report_path):
+    """Gộp các shard thành báo cáo cuối theo đúng thứ tự email"""
+    records = work_queue.read_shards(shards_dir)
+    counts = queue.counts()
+    statuses = {}
+    corpus = CorpusStats()
+    heavy_hitters = MailboxHeavyHitters()
+    with open(report_path, 'w', encoding='utf-8') as report:
+        report.write(GmailSummarizer.format_report_header(len(records)))
+        for record in records:
+            report.write(record['section'])
+            statuses[record['status']] = statuses.get(record['status'], 0) + 1
+            if record.get('metrics'):
+                corpus.add_row(record['metrics'])
+                heavy_hitters.add(record['metrics']['address'],
+                                  record['metrics']['hosts'])
+
+        report.write("\nTHỐNG KÊ TỔNG QUAN:\n" + "="*30 + "\n")
+        report.write(f"Tổng số email đã phân tích: {len(records)}\n")
+        if statuses.get('failed'):
+            report.write(f"Số email không tải được: {statuses['failed']}\n")
+        if statuses.get('duplicate'):
+            report.write(f"Số email trùng lặp: {statuses['duplicate']}\n")
+        unfinished = sum(count for state, count in counts.items()
+                         if state != 'done')
+        if unfinished:
+            report.write(f"Số email chưa xử lý xong: {unfinished}\n")
+        report.write(format_summary(corpus.summary()))
+        report.write(heavy_hitters.format())
+        report.write(f"Thời gian hoàn thành: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+    return f"Đã gộp {len(records)} email vào {report_path}"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Phân tích email Gmail")
+    parser.add_argument('-n', '--max-emails', type=int, default=10,
+                        help="Số email cần phân tích")
+    parser.add_argument('-o', '--output', default=REPORT_PATH,
+                        help="File báo cáo")
+    parser.add_argument('--resume', action='store_true',
+                        help="Chạy tiếp lượt phân tích bị dừng giữa chừng")
+    parser.add_argument('--accounts-dir',
+                        help="Thư mục chứa token của nhiều tài khoản")
+    parser.add_argument('--workers', type=int, default=multi_account.DEFAULT_WORKERS,
+                        help="Số tiến trình chạy song song (mỗi tài khoản một "
+                             "tiến trình; với --ingest là số tiến trình đọc email)")
+    parser.add_argument('--concurrency', type=int,
+                        default=multi_account.DEFAULT_CONCURRENCY,
+                        help="Tổng số request song song cho mọi tài khoản")
+    parser.add_argument('--reports-dir', default=multi_account.REPORTS_DIR,
+                        help="Thư mục chứa báo cáo riêng của từng tài khoản")
+
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--coordinator', action='store_true',
+                      help="Đưa id email vào hàng đợi dùng chung")
+    mode.add_argument('--worker', nargs='?', const='', metavar='WORKER_ID',
+                      help="Nhận và xử lý các lô email từ hàng đợi")
+    mode.add_argument('--merge', action='store_true',
+                      help="Gộp các shard thành báo cáo cuối")
+    parser.add_argument('--queue', default=work_queue.DEFAULT_QUEUE_PATH,
+                        help="File hàng đợi (SQLite) trên ổ dùng chung")
+    parser.add_argument('--shards-dir', default=work_queue.SHARDS_DIR,
+                        help="Thư mục chứa kết quả của các worker")
+    parser.add_argument('--batch-size', type=int,
+                        default=work_queue.DEFAULT_BATCH_SIZE,
+                        help="Số email mỗi lô worker nhận")
+    parser.add_argument('--lease-seconds', type=int,
+                        default=work_queue.DEFAULT_LEASE_SECONDS,
+                        help="Thời hạn lease trước khi lô bị thu hồi")
+    parser.add_argument('--max-body-chars', type=int,
+                        default=DEFAULT_MAX_BODY_CHARS,
+                        help="Số ký tự nội dung tối đa giữ lại cho mỗi phần "
+                             "email, phần dài hơn được cắt bớt")
+    parser.add_argument('--from', dest='sender', default='',
+                        help="Chỉ lấy email của người gửi này")
+    parser.add_argument('--after', default='', metavar='YYYY-MM-DD',
+                        help="Chỉ lấy email từ ngày này")
+    parser.add_argument('--before', default='', metavar='YYYY-MM-DD',
+                        help="Chỉ lấy email đến hết ngày này")
+    parser.add_argument('--has-attachment', action='store_true',
+                        help="Chỉ lấy email có file đính kèm")
+    parser.add_argument('--label', dest='labels', action='append',
+                        metavar='LABEL',
+                        help="Nhãn cần lấy (lặp lại được, mặc định INBOX, "
+                             "ALL là toàn bộ hộp thư)")
+    parser.add_argument('-q', '--query', default='',
+                        help="Truy vấn thêm theo cú pháp tìm kiếm của Gmail")
+    parser.add_argument('--archive', metavar='PATH',
+                        help="Lưu message thô vào kho nén PATH.bin/PATH.idx, "
+                             "message đã có trong kho không tải lại")
+    parser.add_argument('--offline', action='store_true',
+                        help="Chỉ phân tích message trong kho (--archive), "
+                             "không kết nối Gmail")
+    parser.add_argument('--ingest', nargs='+', metavar='PATH',
+                        help="Nạp email từ file mbox, thư mục EML hoặc bản "
+                             "xuất Google Takeout vào kho rồi phân tích "
+                             "offline")
+    parser.add_argument('--fetch-format',
+                        choices=gmail_client.FETCH_FORMATS + ('auto',),
+                        default='auto',
+                        help="Tải message dạng 'full' (JSON đã tách MIME) "
+                             "hoặc 'raw' (RFC 822, tự parse); 'auto' dùng "
+                             "kết quả của benchmarks/bench_fetch_format.py")
+    parser.add_argument('--threads', action='store_true',
+                        help="Phân tích theo hội thoại (-n là số hội thoại), "
+                             "bỏ phần trích dẫn thư cũ trong email trả lời")
+    return parser.parse_args(argv)
+
+
+def fetch_format(args):
+    if args.fetch_format == 'auto':
+        return gmail_client.preferred_fetch_format()
+    return args.fetch_format
+
+
+def build_filter(args):
+    """Bộ lọc từ tham số dòng lệnh, ngày không hợp lệ gây ValueError"""
+    return MailFilter.from_strings(
+        args.sender, args.after, args.before, args.has_attachment,
+        args.labels, args.query)
+
+
+def run_distributed(args):
+    queue = work_queue.WorkQueue(args.queue)
+    try:
+        if args.merge:
+            return merge_shard_reports(queue, args.shards_dir, args.output)
+        # Mọi worker của cùng hàng đợi dùng chung một kho riêng của hàng đợi
+        summarizer = GmailSummarizer(
+            max_body_chars=args.max_body_chars,
+            mail_filter=build_filter(args),
+            fetch_format=fetch_format(args),
+            store_path=work_queue.store_path(args.queue))
+        if args.coordinator:
+            total = summarizer.enqueue_messages(queue, args.max_emails)
+            return f"Đã đưa {total} email vào hàng đợi {args.queue}"
+        processed = summarizer.run_worker(
+            queue, args.shards_dir, args.worker or None,
+            args.batch_size, args.lease_seconds)
+        return f"Worker đã xử lý {processed} email"
+    finally:
+        queue.close()
 
 
 def main():
+    args = parse_args()
     try:
-        summarizer = GmailSummarizer()
-        result = summarizer.process_emails(10)  # Phân tích 10 email
+        mail_filter = build_filter(args)
+    except ValueError as e:
+        print(f"Lỗi: ngày không hợp lệ ({str(e)}), dùng dạng YYYY-MM-DD")
+        return
+    if args.coordinator or args.worker is not None or args.merge:
+        try:
+            print(run_distributed(args))
+        except Exception as e:
+            print(f"Lỗi: {str(e)}")
+        return
 
-        # Lưu kết quả
-        with open('email_analysis.txt', 'w', encoding='utf-8') as f:
-            f.write(result)
+    if args.ingest:
+        # Nạp vào kho (mặc định raw_archive) rồi phân tích offline từ kho
+        args.archive = args.archive or DEFAULT_ARCHIVE_PATH
+        args.offline = True
+        try:
+            with RawArchive(args.archive) as archive:
+                added, failed = local_ingest.ingest(
+                    args.ingest, archive, args.workers)
+            print(f"Đã nạp {added} email mới vào {args.archive}, "
+                  f"{failed} email lỗi")
+        except Exception as e:
+            print(f"Lỗi: {str(e)}")
+            return
+
+    if args.accounts_dir:
+        print(multi_account.run_accounts(
+            args.accounts_dir, args.max_emails, args.output,
+            reports_dir=args.reports_dir, workers=args.workers,
+            concurrency=args.concurrency, resume=args.resume,
+            max_body_chars=args.max_body_chars, threads=args.threads,
+            mail_filter=mail_filter, fetch_format=fetch_format(args)))
+        return
 
-        print("\nĐã tạo báo cáo phân tích thành công!")
-        print(f"Xem kết quả trong file: email_analysis.txt")
+    try:
+        summarizer = GmailSummarizer(max_body_chars=args.max_body_chars,
+                                     mail_filter=mail_filter,
+                                     archive_path=args.archive,
+                                     offline=args.offline,
+                                     fetch_format=fetch_format(args))
+        result = summarizer.process_emails(
+            args.max_emails, args.output, resume=args.resume,
+            threads=args.threads)
+        print(f"\n{result}")
+        print(f"Xem kết quả trong file: {args.output}")
 
     except Exception as e:
         print(f"Lỗi: {str(e)}")
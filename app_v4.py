@@ -1,18 +1,30 @@
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox, font
-import os
 import base64
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+import os
+import sys
 from datetime import datetime
-import re
-import html
-import unicodedata
-from bs4 import BeautifulSoup
 import threading
-import html2text
+from functools import partial
+import gmail_client
+from body_stream import (BodyStats, decoded_size, extract_bounded,
+                         truncation_note)
+from mime_payload import decode_text, part_charset
+from corpus_stats import CorpusStats, format_summary
+from heavy_hitters import MailboxHeavyHitters
+from raw_archive import RawArchive
+from rate_limiter import LANE_BULK, LANE_INTERACTIVE, QuotaLimiter
+from text_formatter import (ChunkedTextRenderer, format_html, marked_view,
+                            plain_view)
+from view_cache import RenderedViewCache
+from local_store import HIGHLIGHT_END, HIGHLIGHT_START, LocalStore
+from mail_filter import ALL_MAIL, MailFilter
+from result_model import EmailResultModel
+from run_control import RunCancelled, RunManager
+from email_record import EmailRecord, ThreadRecord
+from session_snapshot import load_snapshot, save_snapshot, snapshot_entry
+from threads import strip_quoted
+import sqlite3
 
 
 class Constants:
@@ -33,11 +45,33 @@ class Constants:
     WINDOW_SIZE = "1300x800"
 
     # Column widths
+    # Cột cây (mũi tên mở rộng hội thoại)
+    COLUMN_TREE_WIDTH = 30
     COLUMN_NO_WIDTH = 50
     COLUMN_FROM_WIDTH = 200
     COLUMN_SUBJECT_WIDTH = 300
     COLUMN_DATE_WIDTH = 150
 
+    # Tiêu đề cột và ký hiệu chiều sắp xếp
+    COLUMN_TITLES = {
+        'No': 'STT',
+        'From': 'Từ',
+        'Subject': 'Tiêu đề',
+        'Date': 'Ngày'
+    }
+    SORT_ASC_MARK = ' ▲'
+    SORT_DESC_MARK = ' ▼'
+    # Tiền tố iid của dòng hội thoại trong danh sách
+    THREAD_PREFIX = 'thread:'
+    FILTER_ENTRY_WIDTH = 20
+    DATE_ENTRY_WIDTH = 12
+    FILTER_DATE_FORMAT = '%Y-%m-%d'
+    # Nhãn chọn được khi tải email (ALL là toàn bộ hộp thư)
+    FETCH_LABELS = ('INBOX', 'UNREAD', 'STARRED', 'IMPORTANT', 'SENT',
+                    'ALL')
+    LABEL_COMBO_WIDTH = 10
+    QUERY_ENTRY_WIDTH = 30
+
     # Layout values
     PADDING = 10
     SMALL_PADDING = 5
@@ -45,8 +79,34 @@ class Constants:
     ROW_HEIGHT = 30
     WRAP_LENGTH = 600
 
+    # Cửa sổ thống kê
+    STATS_WINDOW_SIZE = "700x600"
+
+    # Số ký tự chèn vào Text widget trong mỗi lần render
+    RENDER_CHUNK_CHARS = 20000
+    # Phần nội dung lớn hơn STREAM_BYTES (sau giải mã base64) được tách chữ
+    # theo luồng và cắt còn MAX_BODY_CHARS ký tự khi tải
+    STREAM_BYTES = 200_000
+    MAX_BODY_CHARS = 200_000
+
+    # Dung lượng tối đa của cache nội dung đã render (byte)
+    VIEW_CACHE_BYTES = 64 * 1024 * 1024
+
+    # Kho lưu trữ cục bộ và tìm kiếm
+    STORE_PATH = 'email_store.db'
+    SEARCH_LIMIT = 100
+    SEARCH_ENTRY_WIDTH = 40
+
+    # Ảnh chụp phiên làm việc gần nhất
+    SNAPSHOT_PATH = 'last_session.snapshot'
+
+    # Kho message thô (raw_archive.bin / .idx / .lock)
+    ARCHIVE_PATH = 'raw_archive'
+
     # Font family
     FONT_FAMILY = 'Segoe UI'
+    # Font cho bảng thống kê (cần căn cột)
+    MONO_FONT_FAMILY = 'Consolas'
 
     # Colors
     COLORS = {
@@ -57,96 +117,168 @@ class Constants:
         'text_normal': '#212121',
         'text_white': '#FFFFFF',
         'background': '#F5F5F5',
-        'link': '#0000FF'
+        'link': '#0000FF',
+        'highlight': '#FFF59D'
     }
 
 
 class GmailAnalyzer:
     def __init__(self):
-        self.SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
-        self.service = None
+        self.SCOPES = gmail_client.SCOPES
+        self.services = None
+        self.limiter = QuotaLimiter()
+        self.failed = {}
+        # 'full' hoặc 'raw', theo kết quả đo của bench_fetch_format.py
+        self.fetch_format = gmail_client.preferred_fetch_format()
+        # Message đã tải được lưu nén, đọc lại được khi không có mạng. Kho
+        # chỉ được mở khi dùng lần đầu vì mở kho có thể import zstandard
+        self._archive = None
+        self._archive_lock = threading.Lock()
+
+    @property
+    def archive(self):
+        with self._archive_lock:
+            if self._archive is None:
+                self._archive = RawArchive(Constants.ARCHIVE_PATH)
+            return self._archive
+
+    def flush_archive(self):
+        """Ghi kho xuống đĩa, không làm gì nếu kho chưa được mở"""
+        with self._archive_lock:
+            if self._archive is not None:
+                self._archive.flush()
+
+    def close_archive(self):
+        with self._archive_lock:
+            if self._archive is not None:
+                self._archive.close()
+                self._archive = None
 
     def connect(self):
         try:
-            creds = None
-            if os.path.exists('token.json'):
-                creds = Credentials.from_authorized_user_file(
-                    'token.json', self.SCOPES)
-            if not creds or not creds.valid:
-                if creds and creds.expired and creds.refresh_token:
-                    creds.refresh(Request())
-                else:
-                    flow = InstalledAppFlow.from_client_secrets_file(
-                        'credentials.json', self.SCOPES)
-                    creds = flow.run_local_server(port=0)
-                with open('token.json', 'w') as token:
-                    token.write(creds.to_json())
-
-            self.service = build('gmail', 'v1', credentials=creds)
+            self.services = gmail_client.connect(scopes=self.SCOPES)
             return True
         except Exception as e:
             print(f"Lỗi kết nối: {str(e)}")
             return False
 
-    def get_emails(self, max_results=10):
+    @property
+    def service(self):
+        return self.services.get() if self.services is not None else None
+
+    def get_emails(self, max_results=10, mail_filter=None, cancel=None):
+        params = (mail_filter or MailFilter()).list_params()
         try:
-            results = self.service.users().messages().list(
-                userId='me',
-                labelIds=['INBOX'],
-                maxResults=max_results
-            ).execute()
+            results = self.limiter.execute(
+                'messages.list',
+                lambda: self.service.users().messages().list(
+                    userId='me',
+                    maxResults=max_results,
+                    **params
+                ), cancel)
             return results.get('messages', [])
+        except RunCancelled:
+            raise
         except Exception as e:
             print(f"Lỗi khi lấy email: {str(e)}")
             return []
 
-    def decode_email_content(self, payload):
+    def get_threads(self, max_results=10, mail_filter=None, cancel=None):
+        params = (mail_filter or MailFilter()).list_params()
+        try:
+            results = self.limiter.execute(
+                'threads.list',
+                lambda: self.service.users().threads().list(
+                    userId='me',
+                    maxResults=max_results,
+                    **params
+                ), cancel)
+            return results.get('threads', [])
+        except RunCancelled:
+            raise
+        except Exception as e:
+            print(f"Lỗi khi lấy hội thoại: {str(e)}")
+            return []
+
+    def build_record(self, message, strip_quotes=False):
+        """EmailRecord từ message, có thống kê nếu nội dung bị cắt bớt"""
+        payload = message['payload']
         if 'parts' in payload:
-            parts = []
-            for part in payload['parts']:
-                if part['mimeType'] in ['text/plain', 'text/html']:
-                    if 'data' in part['body']:
-                        text = base64.urlsafe_b64decode(
-                            part['body']['data']).decode('utf-8', 'ignore')
-                        if part['mimeType'] == 'text/html':
-                            text = BeautifulSoup(
-                                text, 'html.parser').prettify()
-                        parts.append(text)
-            return '\n'.join(parts)
+            parts = [part for part in payload['parts']
+                     if part['mimeType'] in ['text/plain', 'text/html']
+                     and 'data' in part['body']]
         elif 'body' in payload and 'data' in payload['body']:
-            text = base64.urlsafe_b64decode(
-                payload['body']['data']).decode('utf-8', 'ignore')
-            if payload['mimeType'] == 'text/html':
-                return BeautifulSoup(text, 'html.parser').prettify()
-            return text
-        return ""
-
-    def get_email_content(self, msg_id):
+            parts = [payload]
+        else:
+            parts = []
+        decoded = [self.decode_part(part, strip_quotes) for part in parts]
+
+        record = EmailRecord.from_message(
+            message, '\n'.join(text for text, _ in decoded))
+        if any(stats is not None for _, stats in decoded):
+            # Có phần bị cắt bớt: ghi chú cắt bớt được thêm khi hiển thị
+            record.stats = BodyStats()
+            for text, stats in decoded:
+                record.stats.merge(stats or BodyStats.from_text(text))
+        return record
+
+    def decode_part(self, part, strip_quotes=False):
+        """Trả về (văn bản, thống kê), thống kê chỉ có với phần bị cắt bớt"""
+        data = part['body']['data']
+        if decoded_size(data) > Constants.STREAM_BYTES:
+            # Phần quá lớn: tách chữ theo luồng và chỉ giữ phần đầu
+            return extract_bounded(
+                data, part['mimeType'], max_chars=Constants.MAX_BODY_CHARS,
+                charset=part_charset(part), strip_quotes=strip_quotes)
+        text = decode_text(base64.urlsafe_b64decode(data), part_charset(part))
+        if strip_quotes:
+            # Bỏ phần trích dẫn thư cũ, đã có trong email trước của hội thoại
+            text = strip_quoted(text, part['mimeType'])
+        if part['mimeType'] == 'text/html':
+            from bs4 import BeautifulSoup
+            return BeautifulSoup(text, 'html.parser').prettify(), None
+        return text, None
+
+    def get_email_content(self, msg_id, cancel=None, lane=LANE_BULK):
         try:
-            message = self.service.users().messages().get(
-                userId='me',
-                id=msg_id,
-                format='full'
-            ).execute()
-
-            headers = message['payload']['headers']
-            subject = next((h['value'] for h in headers if h['name'].lower(
-            ) == 'subject'), 'Không có tiêu đề')
-            sender = next((h['value'] for h in headers if h['name'].lower(
-            ) == 'from'), 'Không rõ người gửi')
-            date = next((h['value']
-                        for h in headers if h['name'].lower() == 'date'), '')
-
-            content = self.decode_email_content(message['payload'])
-
-            return {
-                'subject': subject,
-                'from': sender,
-                'date': date,
-                'body': content
-            }
+            message = self.archive.get(msg_id)
+            if message is None:
+                message = gmail_client.normalize_message(
+                    self.limiter.execute(
+                        'messages.get',
+                        lambda: gmail_client.message_request(
+                            self.service, msg_id, self.fetch_format),
+                        cancel, lane))
+                self.archive.append(message)
+
+            return self.build_record(message)
+        except RunCancelled:
+            raise
         except Exception as e:
             print(f"Lỗi khi đọc email: {str(e)}")
+            self.failed[msg_id] = str(e)
+            return None
+
+    def get_thread(self, thread_id, cancel=None):
+        """Tải cả hội thoại bằng một lần gọi threads().get"""
+        try:
+            thread = self.limiter.execute(
+                'threads.get',
+                lambda: self.service.users().threads().get(
+                    userId='me',
+                    id=thread_id,
+                    format='full'
+                ), cancel)
+            for message in thread.get('messages', []):
+                self.archive.append(message)
+            return ThreadRecord(thread_id, [
+                self.build_record(message, strip_quotes=True)
+                for message in thread.get('messages', [])])
+        except RunCancelled:
+            raise
+        except Exception as e:
+            print(f"Lỗi khi đọc hội thoại: {str(e)}")
+            self.failed[thread_id] = str(e)
             return None
 
 
@@ -156,16 +288,61 @@ class EmailAnalyzerGUI:
         self.root.title("Gmail Analyzer")
         self.root.geometry(Constants.WINDOW_SIZE)
 
-        # Khởi tạo HTML converter
-        self.html_converter = html2text.HTML2Text()
-        self.html_converter.ignore_links = False
-        self.html_converter.body_width = 0
-        self.html_converter.ignore_images = False
-        self.html_converter.ignore_tables = False
+        # HTML converter được tạo khi format email lần đầu
+        self._html_converter = None
+
+        # Email đã tải và cache nội dung đã render theo msg_id
+        self.emails = {}
+        self.view_cache = RenderedViewCache(Constants.VIEW_CACHE_BYTES)
+        # Kho cục bộ (SQLite, FTS) chỉ được mở khi dùng lần đầu, không làm
+        # chậm lúc hiện cửa sổ
+        self._store = None
+        self._store_lock = threading.Lock()
+
+        # Mô hình danh sách: email của phiên, thứ tự đang hiển thị,
+        # sắp xếp và bộ lọc đang áp dụng
+        self.result_model = EmailResultModel()
+        # Thống kê tổng quan của các email đã phân tích trong phiên
+        self.corpus = CorpusStats()
+        self.heavy_hitters = MailboxHeavyHitters()
+        self.stats_window = None
+        self.session_ids = []
+        self.base_ids = self.session_ids
+        self.sort_state = None
+        self.filter_params = {}
+        self.analysis_started = False
+        # Chế độ hội thoại: id email theo từng hội thoại, theo thứ tự
+        self.threads = {}
+        # Lần chạy nền (phân tích, đồng bộ) duy nhất của cửa sổ, và lần tải
+        # email người dùng vừa chọn (chạy song song với phân tích)
+        self.runs = RunManager()
+        self.selection_runs = RunManager()
+        # Có worker kẹt trong request khi đóng cửa sổ: thoát ngay sau mainloop
+        self.force_exit = False
 
         self.setup_styles()
         self.analyzer = GmailAnalyzer()
         self.setup_gui()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        # Hiển thị kết quả phiên trước trong khi chưa kết nối
+        self.root.after_idle(self.load_session)
+
+    @property
+    def html_converter(self):
+        if self._html_converter is None:
+            self._html_converter = self.create_html_converter()
+        return self._html_converter
+
+    @staticmethod
+    def create_html_converter():
+        import html2text
+        converter = html2text.HTML2Text()
+        converter.ignore_links = False
+        converter.body_width = 0
+        converter.ignore_images = False
+        converter.ignore_tables = False
+        return converter
 
     def setup_styles(self):
         self.style = ttk.Style()
@@ -254,6 +431,14 @@ class EmailAnalyzerGUI:
         self.email_count.set(Constants.DEFAULT_EMAIL_COUNT)
         self.email_count.pack(side=tk.LEFT, padx=Constants.SMALL_PADDING)
 
+        # Phân tích theo hội thoại (số email là số hội thoại)
+        self.thread_mode = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            controls_frame,
+            text="Theo hội thoại",
+            variable=self.thread_mode
+        ).pack(side=tk.LEFT, padx=Constants.SMALL_PADDING)
+
         # Nút phân tích
         self.analyze_btn = ttk.Button(
             controls_frame,
@@ -265,6 +450,26 @@ class EmailAnalyzerGUI:
         self.analyze_btn.pack(side=tk.LEFT, padx=Constants.PADDING)
         self.analyze_btn['state'] = 'disabled'
 
+        # Nút huỷ lần phân tích đang chạy
+        self.cancel_btn = ttk.Button(
+            controls_frame,
+            text="Huỷ",
+            style='Accent.TButton',
+            command=self.cancel_analysis,
+            width=Constants.BUTTON_WIDTH
+        )
+        self.cancel_btn.pack(side=tk.LEFT, padx=Constants.SMALL_PADDING)
+        self.cancel_btn['state'] = 'disabled'
+
+        # Nút thống kê
+        ttk.Button(
+            controls_frame,
+            text="Thống kê",
+            style='Accent.TButton',
+            command=self.show_stats,
+            width=Constants.BUTTON_WIDTH
+        ).pack(side=tk.LEFT, padx=Constants.SMALL_PADDING)
+
         # Progress bar
         self.progress = ttk.Progressbar(
             controls_frame,
@@ -274,6 +479,134 @@ class EmailAnalyzerGUI:
         self.progress.pack(side=tk.LEFT, fill=tk.X,
                            expand=True, padx=Constants.PADDING)
 
+        # Điều kiện lọc gửi lên Gmail khi tải (cùng người gửi và khoảng
+        # ngày ở thanh lọc bên dưới), email không khớp không bị tải về
+        fetch_frame = ttk.Frame(main_frame, style='Custom.TFrame')
+        fetch_frame.pack(fill=tk.X, pady=(0, Constants.PADDING))
+
+        ttk.Label(
+            fetch_frame,
+            text="Nhãn:",
+            style='Custom.TLabel'
+        ).pack(side=tk.LEFT, padx=Constants.PADDING)
+
+        self.fetch_label = ttk.Combobox(
+            fetch_frame,
+            values=Constants.FETCH_LABELS,
+            width=Constants.LABEL_COMBO_WIDTH,
+            font=(Constants.FONT_FAMILY, Constants.FONT_SIZE_NORMAL)
+        )
+        self.fetch_label.set(Constants.FETCH_LABELS[0])
+        self.fetch_label.pack(side=tk.LEFT, padx=Constants.SMALL_PADDING)
+
+        self.fetch_attachment = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            fetch_frame,
+            text="Có đính kèm",
+            variable=self.fetch_attachment
+        ).pack(side=tk.LEFT, padx=Constants.SMALL_PADDING)
+
+        ttk.Label(
+            fetch_frame,
+            text="Truy vấn Gmail:",
+            style='Custom.TLabel'
+        ).pack(side=tk.LEFT, padx=Constants.SMALL_PADDING)
+
+        self.fetch_query = ttk.Entry(
+            fetch_frame,
+            width=Constants.QUERY_ENTRY_WIDTH,
+            font=(Constants.FONT_FAMILY, Constants.FONT_SIZE_NORMAL)
+        )
+        self.fetch_query.pack(side=tk.LEFT, padx=Constants.SMALL_PADDING)
+
+        # Search frame
+        search_frame = ttk.Frame(main_frame, style='Custom.TFrame')
+        search_frame.pack(fill=tk.X, pady=(0, Constants.PADDING))
+
+        ttk.Label(
+            search_frame,
+            text="Tìm kiếm:",
+            style='Custom.TLabel'
+        ).pack(side=tk.LEFT, padx=Constants.PADDING)
+
+        self.search_var = tk.StringVar()
+        self.search_entry = ttk.Entry(
+            search_frame,
+            textvariable=self.search_var,
+            width=Constants.SEARCH_ENTRY_WIDTH,
+            font=(Constants.FONT_FAMILY, Constants.FONT_SIZE_NORMAL)
+        )
+        self.search_entry.pack(side=tk.LEFT, padx=Constants.SMALL_PADDING)
+        self.search_entry.bind('<Return>', self.search_emails)
+
+        self.search_btn = ttk.Button(
+            search_frame,
+            text="Tìm",
+            style='Accent.TButton',
+            command=self.search_emails,
+            width=Constants.BUTTON_WIDTH
+        )
+        self.search_btn.pack(side=tk.LEFT, padx=Constants.PADDING)
+
+        # Filter bar
+        ttk.Label(
+            search_frame,
+            text="Người gửi:",
+            style='Custom.TLabel'
+        ).pack(side=tk.LEFT, padx=Constants.SMALL_PADDING)
+
+        self.filter_sender = ttk.Entry(
+            search_frame,
+            width=Constants.FILTER_ENTRY_WIDTH,
+            font=(Constants.FONT_FAMILY, Constants.FONT_SIZE_NORMAL)
+        )
+        self.filter_sender.pack(side=tk.LEFT, padx=Constants.SMALL_PADDING)
+
+        ttk.Label(
+            search_frame,
+            text="Từ ngày:",
+            style='Custom.TLabel'
+        ).pack(side=tk.LEFT, padx=Constants.SMALL_PADDING)
+
+        self.filter_start = ttk.Entry(
+            search_frame,
+            width=Constants.DATE_ENTRY_WIDTH,
+            font=(Constants.FONT_FAMILY, Constants.FONT_SIZE_NORMAL)
+        )
+        self.filter_start.pack(side=tk.LEFT, padx=Constants.SMALL_PADDING)
+
+        ttk.Label(
+            search_frame,
+            text="Đến ngày:",
+            style='Custom.TLabel'
+        ).pack(side=tk.LEFT, padx=Constants.SMALL_PADDING)
+
+        self.filter_end = ttk.Entry(
+            search_frame,
+            width=Constants.DATE_ENTRY_WIDTH,
+            font=(Constants.FONT_FAMILY, Constants.FONT_SIZE_NORMAL)
+        )
+        self.filter_end.pack(side=tk.LEFT, padx=Constants.SMALL_PADDING)
+
+        for entry in (self.filter_sender, self.filter_start, self.filter_end):
+            entry.bind('<Return>', self.apply_filter)
+
+        ttk.Button(
+            search_frame,
+            text="Lọc",
+            style='Accent.TButton',
+            command=self.apply_filter,
+            width=Constants.BUTTON_WIDTH
+        ).pack(side=tk.LEFT, padx=Constants.PADDING)
+
+        ttk.Button(
+            search_frame,
+            text="Bỏ lọc",
+            style='Accent.TButton',
+            command=self.clear_filter,
+            width=Constants.BUTTON_WIDTH
+        ).pack(side=tk.LEFT, padx=Constants.SMALL_PADDING)
+
         # Content area
         paned = ttk.PanedWindow(main_frame, orient=tk.HORIZONTAL)
         paned.pack(fill=tk.BOTH, expand=True, pady=Constants.PADDING)
@@ -287,15 +620,17 @@ class EmailAnalyzerGUI:
         self.email_list = ttk.Treeview(
             list_frame,
             columns=('No', 'From', 'Subject', 'Date'),
-            show='headings',
+            show=('tree', 'headings'),
             style='Custom.Treeview'
         )
 
-        self.email_list.heading('No', text='STT')
-        self.email_list.heading('From', text='Từ')
-        self.email_list.heading('Subject', text='Tiêu đề')
-        self.email_list.heading('Date', text='Ngày')
+        for column, title in Constants.COLUMN_TITLES.items():
+            self.email_list.heading(
+                column, text=title,
+                command=lambda c=column: self.sort_by_column(c))
 
+        self.email_list.column(
+            '#0', width=Constants.COLUMN_TREE_WIDTH, stretch=False)
         self.email_list.column(
             'No', width=Constants.COLUMN_NO_WIDTH, anchor='center')
         self.email_list.column('From', width=Constants.COLUMN_FROM_WIDTH)
@@ -344,6 +679,10 @@ class EmailAnalyzerGUI:
         self.content_text.tag_configure('link',
                                         foreground=Constants.COLORS['link'],
                                         underline=True)
+        self.content_text.tag_configure('highlight',
+                                        background=Constants.COLORS['highlight'])
+        self.content_renderer = ChunkedTextRenderer(
+            self.content_text, Constants.RENDER_CHUNK_CHARS)
 
         # Menu chuột phải
         self.content_text_menu = tk.Menu(self.content_text, tearoff=0)
@@ -364,44 +703,13 @@ class EmailAnalyzerGUI:
         )
         self.status_bar.pack(fill=tk.X, pady=(Constants.PADDING, 0))
 
-    def format_html_content(self, content):
+    def format_html_content(self, content, converter=None):
         """Format nội dung HTML thành văn bản có định dạng"""
         try:
-            # Chuyển đổi HTML thành Markdown
-            text = self.html_converter.handle(content)
-
-            # Xử lý các ký tự đặc biệt
-            text = html.unescape(text)
-
-            # Loại bỏ khoảng trắng thừa
-            text = re.sub(r'\n\s*\n', '\n\n', text)
-
-            return text
+            return format_html(converter or self.html_converter, content)
         except Exception as e:
             print(f"Lỗi khi format HTML: {str(e)}")
-            return content
-
-    def apply_text_formatting(self):
-        """Áp dụng định dạng cho văn bản"""
-        content = self.content_text.get('1.0', tk.END)
-
-        # Định dạng cho tiêu đề
-        for match in re.finditer(r'^#.*$', content, re.MULTILINE):
-            start = f"1.0+{match.start()}c"
-            end = f"1.0+{match.end()}c"
-            self.content_text.tag_add('bold', start, end)
-
-        # Định dạng cho text in nghiêng
-        for match in re.finditer(r'\*(.*?)\*', content):
-            start = f"1.0+{match.start()}c"
-            end = f"1.0+{match.end()}c"
-            self.content_text.tag_add('italic', start, end)
-
-        # Định dạng cho links
-        for match in re.finditer(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', content):
-            start = f"1.0+{match.start()}c"
-            end = f"1.0+{match.end()}c"
-            self.content_text.tag_add('link', start, end)
+            return plain_view(content)
 
     def connect_gmail(self):
         self.status_var.set("Đang kết nối...")
@@ -418,6 +726,8 @@ class EmailAnalyzerGUI:
     def connection_success(self):
         self.status_var.set("Đã kết nối thành công")
         self.analyze_btn['state'] = 'normal'
+        if self.session_ids and not self.analysis_started:
+            self.reconcile_session()
         messagebox.showinfo("Kết nối", "Kết nối Gmail thành công!")
 
     def connection_failed(self):
@@ -425,36 +735,263 @@ class EmailAnalyzerGUI:
         self.connect_btn['state'] = 'normal'
         messagebox.showerror("Lỗi", "Không thể kết nối với Gmail!")
 
+    def build_fetch_filter(self):
+        """Bộ lọc gửi lên Gmail từ các ô nhập, None nếu ngày không hợp lệ"""
+        label = self.fetch_label.get().strip() or ALL_MAIL
+        try:
+            return MailFilter.from_strings(
+                self.filter_sender.get(), self.filter_start.get(),
+                self.filter_end.get(), self.fetch_attachment.get(),
+                [label], self.fetch_query.get())
+        except ValueError:
+            messagebox.showerror(
+                "Lỗi", "Ngày không hợp lệ, hãy nhập theo dạng YYYY-MM-DD")
+            return None
+
+    def post(self, token, callback, *args):
+        """Chuyển callback về main thread, bỏ qua nếu lần chạy đã bị huỷ"""
+        def run():
+            if not token.cancelled:
+                callback(*args)
+
+        try:
+            self.root.after(0, run)
+        except (RuntimeError, tk.TclError):
+            # Cửa sổ đã đóng
+            token.cancel()
+
     def start_analysis(self):
+        mail_filter = self.build_fetch_filter()
+        if mail_filter is None:
+            return
         self.analyze_btn['state'] = 'disabled'
+        self.cancel_btn['state'] = 'normal'
+        self.analysis_started = True
         self.email_list.delete(*self.email_list.get_children())
+        self.emails.clear()
+        self.result_model.clear()
+        self.corpus = CorpusStats()
+        self.heavy_hitters = MailboxHeavyHitters()
+        self.session_ids = []
+        self.threads = {}
+        if not self.search_var.get().strip():
+            self.base_ids = self.session_ids
+        self.content_renderer.cancel()
         self.content_text.delete('1.0', tk.END)
         self.progress['value'] = 0
+        self.analyzer.failed.clear()
         count = int(self.email_count.get())
-
-        def analyze_thread():
-            messages = self.analyzer.get_emails(count)
+        if self.thread_mode.get():
+            self.start_thread_analysis(count, mail_filter)
+            return
+
+        def analyze_thread(token):
+            # html2text không an toàn khi dùng chung giữa các thread
+            converter = self.create_html_converter()
+            messages = self.analyzer.get_emails(count, mail_filter, token)
             total = len(messages)
 
-            for i, msg in enumerate(messages, 1):
-                email_data = self.analyzer.get_email_content(msg['id'])
+            # Tải song song trong giới hạn quota, xử lý theo đúng thứ tự
+            fetched = self.analyzer.limiter.map(
+                partial(self.analyzer.get_email_content, cancel=token),
+                [msg['id'] for msg in messages], token)
+            for i, (msg, email_data) in enumerate(zip(messages, fetched), 1):
+                token.check()
                 if email_data:
-                    self.root.after(0, self.add_email_to_list,
-                                    email_data, msg['id'], i)
+                    self.prepare_email(msg['id'], email_data, converter)
+                    self.post(token, self.add_email_to_list,
+                              email_data, msg['id'], i)
                 progress = int((i / total) * 100)
-                self.root.after(0, self.update_progress, progress)
-
-            self.root.after(0, self.analysis_complete)
-
-        threading.Thread(target=analyze_thread).start()
-
-    def add_email_to_list(self, email_data, msg_id, index):
-        self.email_list.insert('', 'end', iid=msg_id, values=(
-            index,
-            email_data['from'],
-            email_data['subject'],
-            email_data['date']
-        ))
+                self.post(token, self.update_progress, progress)
+
+            self.post(token, self.analysis_complete)
+
+        # Lần chạy trước (ví dụ đồng bộ phiên cũ) bị huỷ và thay thế
+        self.runs.start(analyze_thread)
+
+    def start_thread_analysis(self, count, mail_filter=None):
+        """Tải count hội thoại, mỗi hội thoại một request threads().get"""
+        def analyze_thread(token):
+            converter = self.create_html_converter()
+            threads = self.analyzer.get_threads(count, mail_filter, token)
+            total = len(threads)
+
+            fetched = self.analyzer.limiter.map(
+                partial(self.analyzer.get_thread, cancel=token),
+                [item['id'] for item in threads], token)
+            for i, thread in enumerate(fetched, 1):
+                token.check()
+                if thread and thread.messages:
+                    for email_data in thread.messages:
+                        self.prepare_email(
+                            email_data.msg_id, email_data, converter)
+                    self.post(token, self.add_thread_to_list, thread, i)
+                progress = int((i / total) * 100)
+                self.post(token, self.update_progress, progress)
+
+            self.post(token, self.analysis_complete)
+
+        self.runs.start(analyze_thread)
+
+    def add_thread_to_list(self, thread, index):
+        """Thêm dòng hội thoại và các email của nó (dòng con)"""
+        parent = Constants.THREAD_PREFIX + thread.thread_id
+        last = thread.last
+        self.threads[thread.thread_id] = [
+            email_data.msg_id for email_data in thread.messages]
+        if not self.email_list.exists(parent):
+            self.email_list.insert('', 'end', iid=parent, values=(
+                index, ', '.join(thread.participants()),
+                f"{thread.subject} ({len(thread.messages)})", last.date))
+        for email_data in thread.messages:
+            self.add_email_to_list(
+                email_data, email_data.msg_id, len(self.session_ids) + 1,
+                parent)
+        if self.base_ids is not self.session_ids:
+            # Đang xem kết quả tìm kiếm: dòng hội thoại chưa hiển thị
+            self.email_list.detach(parent)
+
+    def thread_view_active(self):
+        """Danh sách hiển thị theo hội thoại khi không sắp xếp, lọc, tìm kiếm"""
+        return (bool(self.threads) and self.base_ids is self.session_ids
+                and self.sort_state is None and not self.filter_params)
+
+    def prepare_email(self, msg_id, email_data, converter):
+        """Render sẵn vào cache và cập nhật kho cục bộ (chạy ở thread nền)"""
+        view = self.view_cache.get_or_render(
+            msg_id, lambda: self.format_html_content(
+                email_data.body, converter))
+        self.store.index_email(
+            msg_id, email_data.subject, email_data.sender,
+            email_data.date, view.text)
+        if email_data.stats is None:
+            email_data.stats = BodyStats.from_text(view.text)
+
+    def add_email_to_list(self, email_data, msg_id, index, parent=''):
+        self.emails[msg_id] = email_data
+        row = self.result_model.add_record(email_data, index)
+        if msg_id not in self.session_ids:
+            self.session_ids.append(msg_id)
+            if email_data.stats is not None:
+                self.corpus.add_record(email_data)
+                self.heavy_hitters.add(
+                    email_data.address, email_data.stats.hosts)
+        # Đang xem kết quả tìm kiếm thì chỉ cập nhật mô hình
+        if self.base_ids is not self.session_ids:
+            return
+        if self.sort_state is None and not self.filter_params:
+            self.email_list.insert(
+                parent, 'end', iid=msg_id, values=row.values())
+        else:
+            self.refresh_list()
+
+    def show_stats(self):
+        """Mở (hoặc cập nhật) cửa sổ thống kê tổng quan"""
+        if self.stats_window is None or not self.stats_window.winfo_exists():
+            self.stats_window = tk.Toplevel(self.root)
+            self.stats_window.title("Thống kê tổng quan")
+            self.stats_window.geometry(Constants.STATS_WINDOW_SIZE)
+            self.stats_text = scrolledtext.ScrolledText(
+                self.stats_window,
+                wrap=tk.NONE,
+                font=(Constants.MONO_FONT_FAMILY, Constants.FONT_SIZE_NORMAL),
+                padx=Constants.PADDING,
+                pady=Constants.PADDING
+            )
+            self.stats_text.pack(fill=tk.BOTH, expand=True)
+        else:
+            self.stats_window.lift()
+
+        text = f"Số email đã phân tích: {len(self.corpus)}\n\n"
+        text += format_summary(self.corpus.summary())
+        text += self.heavy_hitters.format()
+        self.stats_text.configure(state='normal')
+        self.stats_text.delete('1.0', tk.END)
+        self.stats_text.insert('1.0', text)
+        self.stats_text.configure(state='disabled')
+
+    def refresh_list(self):
+        """Hiển thị lại danh sách theo thứ tự sắp xếp và bộ lọc hiện tại"""
+        if self.thread_view_active():
+            self.refresh_thread_list()
+            return
+        ids = self.base_ids
+        keep = self.result_model.filter_ids(**self.filter_params)
+        if keep is not None:
+            ids = [msg_id for msg_id in ids if msg_id in keep]
+        if self.sort_state is not None:
+            column, descending = self.sort_state
+            visible = set(ids)
+            ids = [msg_id for msg_id in self.result_model.sorted_ids(
+                column, descending) if msg_id in visible]
+
+        for msg_id in ids:
+            if not self.email_list.exists(msg_id):
+                self.email_list.insert(
+                    '', 'end', iid=msg_id,
+                    values=self.result_model.get(msg_id).values())
+        # Các dòng không có trong ids được tách ra (detach) chứ không bị xoá
+        self.email_list.set_children('', *ids)
+
+    def refresh_thread_list(self):
+        """Dựng lại cây hội thoại (sau khi bỏ lọc hoặc tìm kiếm)"""
+        parents = []
+        for thread_id, msg_ids in self.threads.items():
+            parent = Constants.THREAD_PREFIX + thread_id
+            for msg_id in msg_ids:
+                if not self.email_list.exists(msg_id):
+                    self.email_list.insert(
+                        '', 'end', iid=msg_id,
+                        values=self.result_model.get(msg_id).values())
+            self.email_list.set_children(parent, *msg_ids)
+            parents.append(parent)
+        self.email_list.set_children('', *parents)
+
+    def sort_by_column(self, column):
+        if self.sort_state is not None and self.sort_state[0] == column:
+            self.sort_state = (column, not self.sort_state[1])
+        else:
+            self.sort_state = (column, False)
+
+        for name, title in Constants.COLUMN_TITLES.items():
+            if name == column:
+                title += (Constants.SORT_DESC_MARK if self.sort_state[1]
+                          else Constants.SORT_ASC_MARK)
+            self.email_list.heading(name, text=title)
+        self.refresh_list()
+
+    def apply_filter(self, event=None):
+        params = {}
+        sender = self.filter_sender.get().strip()
+        if sender:
+            params['sender'] = sender
+        try:
+            start = self.filter_start.get().strip()
+            if start:
+                params['start'] = datetime.strptime(
+                    start, Constants.FILTER_DATE_FORMAT).timestamp()
+            end = self.filter_end.get().strip()
+            if end:
+                # Tính đến hết ngày kết thúc
+                params['end'] = datetime.strptime(
+                    end, Constants.FILTER_DATE_FORMAT).timestamp() + 86399
+        except ValueError:
+            messagebox.showerror(
+                "Lỗi", "Ngày không hợp lệ, hãy nhập theo dạng YYYY-MM-DD")
+            return
+
+        self.filter_params = params
+        self.refresh_list()
+        self.status_var.set(
+            f"Hiển thị {len(self.email_list.get_children())} email")
+
+    def clear_filter(self):
+        for entry in (self.filter_sender, self.filter_start, self.filter_end):
+            entry.delete(0, tk.END)
+        self.filter_params = {}
+        self.refresh_list()
+        self.status_var.set(
+            f"Hiển thị {len(self.email_list.get_children())} email")
 
     def update_progress(self, value):
         self.progress['value'] = value
@@ -462,25 +999,251 @@ class EmailAnalyzerGUI:
 
     def analysis_complete(self):
         self.analyze_btn['state'] = 'normal'
-        self.status_var.set("Phân tích hoàn tất")
+        self.cancel_btn['state'] = 'disabled'
+        self.analyzer.flush_archive()
+        if self.analyzer.failed:
+            self.status_var.set(
+                f"Phân tích hoàn tất, {len(self.analyzer.failed)} email không tải được")
+        else:
+            self.status_var.set("Phân tích hoàn tất")
+        self.save_session()
         messagebox.showinfo("Hoàn thành", "Đã phân tích xong email!")
 
+    def cancel_analysis(self):
+        """Dừng lần phân tích đang chạy, giữ các email đã phân tích xong"""
+        self.runs.cancel()
+        self.analyze_btn['state'] = 'normal'
+        self.cancel_btn['state'] = 'disabled'
+        self.analyzer.flush_archive()
+        self.status_var.set(
+            f"Đã huỷ, giữ {len(self.session_ids)} email đã phân tích")
+        self.save_session()
+
     def on_select_email(self, event):
         selection = self.email_list.selection()
         if selection:
             msg_id = selection[0]
-            email_data = self.analyzer.get_email_content(msg_id)
+            thread_info = ""
+            if msg_id.startswith(Constants.THREAD_PREFIX):
+                # Dòng hội thoại: hiển thị email mới nhất của hội thoại
+                msg_ids = self.threads.get(
+                    msg_id[len(Constants.THREAD_PREFIX):])
+                if not msg_ids:
+                    return
+                thread_info = f"Hội thoại gồm {len(msg_ids)} email\n"
+                msg_id = msg_ids[-1]
+            email_data, view = self.load_email(msg_id)
             if email_data:
-                info_text = f"""Từ: {email_data['from']}
-Tiêu đề: {email_data['subject']}
-Ngày: {email_data['date']}"""
+                # Chọn email khác thì bỏ lần tải của email chọn trước
+                self.selection_runs.cancel()
+                self.show_email(msg_id, email_data, view, thread_info)
+            else:
+                self.fetch_email(msg_id, thread_info)
+
+    def show_email(self, msg_id, email_data, view, thread_info=""):
+        info_text = thread_info + f"""Từ: {email_data.sender}
+Tiêu đề: {email_data.subject}
+Ngày: {email_data.date}"""
+        # Từ khoá đã trích sẵn khi email được đưa vào kho cục bộ
+        keywords = self.store.get_keywords(msg_id)
+        if keywords:
+            info_text += f"\nTừ khoá: {', '.join(keywords)}"
+        sender_keywords = self.store.sender_keywords(email_data.sender)
+        if sender_keywords:
+            info_text += (f"\nTừ khoá của người gửi: "
+                          f"{', '.join(sender_keywords)}")
+        # Nội dung bị cắt bớt: ghi chú chỉ hiển thị, không nằm trong body
+        info_text += truncation_note(email_data.stats)
+
+        self.email_info.config(text=info_text)
+        self.content_renderer.render(view)
+
+    def load_email(self, msg_id):
+        """Email và view đã render từ bộ nhớ hoặc kho cục bộ
+
+        Trả về (None, None) nếu phải tải từ Gmail (xem fetch_email).
+        """
+        email_data = self.emails.get(msg_id)
+        if email_data is None:
+            # Email từ phiên trước: thông tin lấy từ danh sách, nội dung từ cache
+            row = self.result_model.get(msg_id)
+            view = self.view_cache.get(msg_id)
+            if row is not None and view is not None:
+                return EmailRecord.from_headers(
+                    msg_id, row.subject, row.sender, row.date), view
+            email_data = self.store.get_email(msg_id)
+            if email_data is not None:
+                # Nội dung trong kho đã là văn bản, không cần qua html2text
+                return email_data, self.view_cache.get_or_render(
+                    msg_id, lambda: plain_view(email_data.body))
+            return None, None
+        view = self.view_cache.get_or_render(
+            msg_id, lambda: self.format_html_content(email_data.body))
+        return email_data, view
+
+    def fetch_email(self, msg_id, thread_info=""):
+        """Tải email từ kho message thô hoặc Gmail ở thread nền
+
+        Giao diện không bị treo khi request chậm; chọn email khác hoặc đóng
+        cửa sổ thì lần tải này bị huỷ.
+        """
+        self.content_renderer.cancel()
+        self.content_text.delete('1.0', tk.END)
+        self.email_info.config(text=thread_info + "Đang tải email...")
+
+        def fetch_thread(token):
+            if (self.analyzer.services is None
+                    and msg_id not in self.analyzer.archive):
+                self.post(token, partial(
+                    self.email_info.config,
+                    text=thread_info + "Chưa kết nối Gmail"))
+                return
+            # Người dùng đang chờ: đi trước các request của lượt phân tích
+            email_data = self.analyzer.get_email_content(
+                msg_id, token, LANE_INTERACTIVE)
+            if email_data is None:
+                self.post(token, partial(
+                    self.email_info.config,
+                    text=thread_info + "Không tải được email"))
+                return
+            converter = self.create_html_converter()
+            view = self.view_cache.get_or_render(
+                msg_id, lambda: self.format_html_content(
+                    email_data.body, converter))
+            self.post(token, self.show_email,
+                      msg_id, email_data, view, thread_info)
+
+        self.selection_runs.start(fetch_thread)
+
+    def search_emails(self, event=None):
+        """Tìm kiếm trong kho cục bộ, không gọi Gmail API"""
+        query = self.search_var.get().strip()
+        if not query:
+            self.base_ids = self.session_ids
+            self.refresh_list()
+            self.status_var.set(f"Hiển thị {len(self.session_ids)} email")
+            return
 
-                self.email_info.config(text=info_text)
-                formatted_content = self.format_html_content(
-                    email_data['body'])
-                self.content_text.delete('1.0', tk.END)
-                self.content_text.insert('1.0', formatted_content)
-                self.apply_text_formatting()
+        try:
+            hits = self.store.search(query, Constants.SEARCH_LIMIT)
+        except sqlite3.Error as e:
+            self.status_var.set(f"Lỗi tìm kiếm: {str(e)}")
+            return
+
+        for rank, hit in enumerate(hits, 1):
+            self.result_model.add(
+                hit.msg_id, rank, hit.sender, hit.subject, hit.date)
+        self.base_ids = [hit.msg_id for hit in hits]
+        self.refresh_list()
+        self.email_info.config(text=f"Kết quả tìm kiếm: {query}")
+        self.content_renderer.render(self.format_search_results(hits))
+        self.status_var.set(f"Tìm thấy {len(hits)} email")
+
+    def format_search_results(self, hits):
+        """Danh sách kết quả kèm đoạn trích, phần khớp được tô sáng"""
+        blocks = [f"{rank}. {hit.subject}\n{hit.sender} - {hit.date}\n"
+                  f"{hit.snippet}\n"
+                  for rank, hit in enumerate(hits, 1)]
+        return marked_view('\n'.join(blocks), HIGHLIGHT_START,
+                           HIGHLIGHT_END, 'highlight')
+
+    def load_session(self):
+        """Đọc ảnh chụp phiên trước ở thread nền"""
+        def load_thread():
+            entries = load_snapshot(Constants.SNAPSHOT_PATH)
+            if entries:
+                self.view_cache.warm_up(
+                    (entry['id'], entry['text'], entry['spans'])
+                    for entry in entries if 'text' in entry)
+                self.root.after(0, self.show_session, entries)
+
+        threading.Thread(target=load_thread, daemon=True).start()
+
+    def show_session(self, entries):
+        # Người dùng đã bắt đầu phân tích thì không hiển thị phiên cũ nữa
+        if self.analysis_started:
+            return
+        for entry in entries:
+            self.result_model.add(
+                entry['id'], entry['index'], entry['from'],
+                entry['subject'], entry['date'])
+            self.session_ids.append(entry['id'])
+        self.refresh_list()
+        self.status_var.set(f"Đã tải {len(entries)} email từ phiên trước")
+
+    def reconcile_session(self):
+        """Đồng bộ danh sách phiên trước với những thay đổi trên server"""
+        known = set(self.session_ids)
+        count = max(int(self.email_count.get()), len(known))
+        self.status_var.set("Đang đồng bộ với Gmail...")
+
+        def reconcile_thread(token):
+            converter = self.create_html_converter()
+            messages = self.analyzer.get_emails(count, cancel=token)
+            if not messages:
+                self.post(token, self.status_var.set,
+                          "Không đồng bộ được, đang dùng dữ liệu phiên trước")
+                return
+
+            server_ids = [msg['id'] for msg in messages]
+            for i, msg_id in enumerate(server_ids, 1):
+                token.check()
+                if msg_id in known:
+                    continue
+                email_data = self.analyzer.get_email_content(msg_id, token)
+                if email_data:
+                    self.prepare_email(msg_id, email_data, converter)
+                    self.post(token, self.add_email_to_list,
+                              email_data, msg_id, i)
+            self.post(token, self.reconcile_complete, server_ids)
+
+        # Bấm "Phân tích" trong lúc đồng bộ thì lần đồng bộ bị huỷ
+        self.runs.start(reconcile_thread)
+
+    def reconcile_complete(self, server_ids):
+        if self.analysis_started:
+            return
+        rows = [self.result_model.get(msg_id) for msg_id in server_ids
+                if msg_id in self.result_model]
+        on_server = set(server_ids)
+        removed = [msg_id for msg_id in self.session_ids
+                   if msg_id not in on_server]
+
+        # Đánh số lại theo thứ tự trên server
+        self.result_model.clear()
+        for index, row in enumerate(rows, 1):
+            row = self.result_model.add(
+                row.msg_id, index, row.sender, row.subject, row.date)
+            if self.email_list.exists(row.msg_id):
+                self.email_list.item(row.msg_id, values=row.values())
+        for msg_id in removed:
+            self.emails.pop(msg_id, None)
+            if self.email_list.exists(msg_id):
+                self.email_list.delete(msg_id)
+
+        self.session_ids[:] = [row.msg_id for row in rows]
+        self.refresh_list()
+        self.save_session()
+        self.status_var.set(
+            f"Đã đồng bộ: {len(self.session_ids)} email, bỏ {len(removed)} email")
+
+    def save_session(self):
+        """Ghi ảnh chụp danh sách hiện tại và nội dung đã render"""
+        entries = []
+        for msg_id in self.session_ids:
+            row = self.result_model.get(msg_id)
+            if row is not None:
+                entries.append(snapshot_entry(
+                    msg_id, row.index, row.subject, row.sender, row.date,
+                    self.view_cache.get(msg_id)))
+
+        def save_thread():
+            try:
+                save_snapshot(entries, Constants.SNAPSHOT_PATH)
+            except OSError as e:
+                print(f"Không lưu được ảnh chụp phiên: {str(e)}")
+
+        threading.Thread(target=save_thread).start()
 
     def copy_text(self):
         """Copy text đã chọn"""
@@ -501,8 +1264,43 @@ Ngày: {email_data['date']}"""
         """Hiển thị menu chuột phải"""
         self.content_text_menu.tk_popup(event.x_root, event.y_root)
 
+    @property
+    def store(self):
+        with self._store_lock:
+            if self._store is None:
+                self._store = LocalStore(Constants.STORE_PATH)
+            return self._store
+
+    def close_store(self):
+        with self._store_lock:
+            if self._store is not None:
+                self._store.close()
+                self._store = None
+
+    def on_close(self):
+        """Huỷ lần chạy nền, chờ worker dừng rồi đóng cửa sổ"""
+        self.status_var.set("Đang dừng...")
+        self.root.update_idletasks()
+        self.content_renderer.cancel()
+        self.selection_runs.cancel()
+        if self.runs.shutdown() and self.selection_runs.shutdown():
+            self.analyzer.close_archive()
+            self.close_store()
+        else:
+            # Worker còn kẹt trong một request. Các luồng của QuotaLimiter.map
+            # (ThreadPoolExecutor) không phải daemon và được join khi thoát,
+            # nên tiến trình có thể treo đến hết REQUEST_TIMEOUT: chỉ ghi
+            # xuống đĩa phần kho đã có rồi thoát hẳn sau mainloop
+            print("Worker chưa dừng kịp, bỏ qua khi thoát")
+            self.analyzer.flush_archive()
+            self.force_exit = True
+        self.root.destroy()
+
     def run(self):
         self.root.mainloop()
+        if self.force_exit:
+            sys.stdout.flush()
+            os._exit(0)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,104 @@
+"""Kiểm tra phát hiện email gần giống nhau trên các thông báo mẫu.
+
+Các thông báo Google Cloud chỉ khác nhau ở id dự án và ngày giờ phải được
+gom vào cùng một nhóm; các email khác (trong email_analysis.txt) không được
+khớp nhầm vào nhóm đó.
+
+Chạy từ thư mục gốc của repo:
+
+    python benchmarks/bench_dedup.py
+
+Trả về mã lỗi khác 0 nếu các thông báo không gom được thành một nhóm hoặc
+có email không liên quan bị coi là trùng.
+"""
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from dedup import DuplicateIndex, similarity, minhash  # noqa: E402
+
+SAMPLE_REPORT = os.path.join(ROOT, 'email_analysis.txt')
+BODY_PATTERN = re.compile(
+    r'NỘI DUNG GỐC:\n-+\n(.*?)\n\n={80}', re.DOTALL)
+
+NOTICE_TEMPLATE = (
+    "Project Permanent Deletion WarningDear Developer,Your Google Cloud "
+    "project {project} was shut down on {shutdown} UTC.Shut-down projects "
+    "and the data stored in them may be recovered for a limited time before "
+    "the projects are permanently deleted.\n"
+    "If you'd like to recover your project, you must cancel the project's "
+    "permanent deletion before {deletion} UTC.To recover your shut-down "
+    "project:Visit the Resources pending deletion page.Select the project "
+    "you want to recover, and click Restore.In the confirmation dialog, "
+    "click Restore.If you cannot recover your project by following the "
+    "instructions above, you can try restoring it using the gcloud undelete "
+    "command.If you take no action by {deletion} UTC, you will be unable to "
+    "recover your project.If you have any questions, please visit Google "
+    "Cloud Platform Resource Manager Documentation or contact Google Cloud "
+    "Platform Support.Cordially,The Google Cloud Platform Team© 2024 Google "
+    "LLC.\n1600 Amphitheatre Parkway, Mountain View, CA 94043You have "
+    "received this mandatory email service announcement to update you about "
+    "important changes to your Google project, product or account.")
+NOTICE_VALUES = (
+    ('email-summarizer-443002', 'November 27, 2024 2:22:03 AM',
+     'December 27, 2024 2:22:03 AM'),
+    ('my-app-123456', 'October 3, 2024 9:15:44 AM',
+     'November 2, 2024 9:15:44 AM'),
+    ('test-project-998877', 'January 14, 2025 11:02:10 PM',
+     'February 13, 2025 11:02:10 PM'),
+    ('data-pipeline-202411', 'March 1, 2025 4:40:59 AM',
+     'March 31, 2025 4:40:59 AM'),
+    ('ml-sandbox-555111', 'May 19, 2025 7:07:07 PM',
+     'June 18, 2025 7:07:07 PM'),
+    ('gmail-reader-71', 'July 2, 2025 1:00:00 AM',
+     'August 1, 2025 1:00:00 AM'),
+)
+
+
+def sample_notices():
+    return [NOTICE_TEMPLATE.format(project=project, shutdown=shutdown,
+                                   deletion=deletion)
+            for project, shutdown, deletion in NOTICE_VALUES]
+
+
+def main():
+    notices = sample_notices()
+    with open(SAMPLE_REPORT, encoding='utf-8') as f:
+        # Email #1 của báo cáo mẫu cũng là một thông báo như vậy
+        others = BODY_PATTERN.findall(f.read())[1:]
+
+    first = minhash(notices[0])
+    print("Jaccard ước lượng với thông báo đầu tiên:",
+          ', '.join(f"{similarity(first, minhash(notice)):.2f}"
+                    for notice in notices[1:]))
+
+    index = DuplicateIndex()
+    failed = False
+    start = time.perf_counter()
+    for i, notice in enumerate(notices):
+        match = index.find(notice)
+        if i == 0:
+            index.add('notice-0', notice, None)
+        elif match is None or match.key != 'notice-0':
+            print(f"Thông báo {i} không được nhận là trùng")
+            failed = True
+    for i, body in enumerate(others):
+        match = index.find(body)
+        if match is not None and match.key == 'notice-0':
+            print(f"Email mẫu {i + 2} bị khớp nhầm với thông báo "
+                  f"(Jaccard {match.similarity:.2f})")
+            failed = True
+        index.add(f"sample-{i + 2}", body, None)
+    elapsed = time.perf_counter() - start
+    count = len(notices) + len(others)
+    print(f"{count} email, {elapsed / count * 1000:.2f} ms/email")
+    print("Thất bại" if failed else "Các thông báo được gom thành một nhóm")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,181 @@
+"""So sánh tải message bằng format='full' và format='raw'.
+
+Đo trên một corpus đã ghi sẵn (JSON lines, mỗi dòng là response của cả hai
+cách tải cho cùng một message):
+
+- số byte trên đường truyền: JSON của response, và sau khi nén gzip như
+  khi API trả về
+- thời gian từ response đến EmailRecord: parse JSON, với 'raw' là thêm
+  parse MIME bằng thư viện email, rồi giải mã và làm sạch nội dung
+
+Chạy từ thư mục gốc của repo:
+
+    python benchmarks/bench_fetch_format.py --record 50         # từ Gmail
+    python benchmarks/bench_fetch_format.py --from-mail a.mbox  # từ file
+    python benchmarks/bench_fetch_format.py --save
+
+--save ghi cách nhanh hơn (tính cả thời gian truyền theo --bandwidth) vào
+.cache/fetch_format.json để app.py --fetch-format auto và GUI dùng.
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import tempfile
+import time
+import zlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import gmail_client  # noqa: E402
+from mime_payload import gmail_message  # noqa: E402
+from view_cache import CleanedPartCache  # noqa: E402
+
+CORPUS_PATH = os.path.join('.cache', 'fetch_corpus.jsonl')
+RUNS = 5
+DEFAULT_LIMIT = 200
+# Băng thông giả định khi cộng thời gian truyền (Mbit/s)
+DEFAULT_BANDWIDTH = 20.0
+
+
+def record_from_gmail(count, corpus_path):
+    """Tải count message trong INBOX bằng cả hai cách và ghi vào corpus"""
+    service = gmail_client.connect().get()
+    messages = service.users().messages().list(
+        userId='me', labelIds=['INBOX'], maxResults=count).execute()
+    with open(corpus_path, 'w', encoding='utf-8') as corpus:
+        for item in messages.get('messages', []):
+            entry = {fetch_format: gmail_client.message_request(
+                         service, item['id'], fetch_format).execute()
+                     for fetch_format in gmail_client.FETCH_FORMATS}
+            corpus.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    return len(messages.get('messages', []))
+
+
+def record_from_mail(paths, corpus_path, limit):
+    """Dựng corpus từ file mbox/EML: response 'full' tạo như khi nạp file"""
+    from local_ingest import iter_raw_messages
+
+    count = 0
+    with open(corpus_path, 'w', encoding='utf-8') as corpus:
+        for raw in (raw for path in paths for raw in iter_raw_messages(path)):
+            full = gmail_message(raw)
+            entry = {
+                'full': full,
+                'raw': {
+                    'id': full['id'],
+                    'threadId': full['threadId'],
+                    'labelIds': full['labelIds'],
+                    'raw': base64.urlsafe_b64encode(raw).decode('ascii'),
+                    'sizeEstimate': len(raw),
+                }
+            }
+            corpus.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            count += 1
+            if count == limit:
+                break
+    return count
+
+
+def load_corpus(corpus_path):
+    """Response của từng cách tải, giữ dạng văn bản JSON như trên đường truyền"""
+    responses = {fetch_format: [] for fetch_format in gmail_client.FETCH_FORMATS}
+    with open(corpus_path, encoding='utf-8') as corpus:
+        for line in corpus:
+            entry = json.loads(line)
+            for fetch_format in gmail_client.FETCH_FORMATS:
+                responses[fetch_format].append(json.dumps(
+                    entry[fetch_format], separators=(',', ':')))
+    return responses
+
+
+def measure_parse(summarizer, texts):
+    """Thời gian (giây, trung vị) từ văn bản JSON đến EmailRecord"""
+    times = []
+    for _ in range(RUNS):
+        # Không dùng lại phần nội dung đã làm sạch từ lần đo trước
+        summarizer.cleaned_parts = CleanedPartCache()
+        start = time.perf_counter()
+        for text in texts:
+            summarizer.build_record(
+                gmail_client.normalize_message(json.loads(text)))
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return times[len(times) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--corpus', default=CORPUS_PATH)
+    parser.add_argument('--record', type=int, metavar='N',
+                        help="Ghi corpus từ N message trong INBOX")
+    parser.add_argument('--from-mail', nargs='+', metavar='PATH',
+                        help="Ghi corpus từ file mbox, EML hoặc thư mục")
+    parser.add_argument('--limit', type=int, default=DEFAULT_LIMIT,
+                        help="Số message tối đa lấy từ --from-mail")
+    parser.add_argument('--bandwidth', type=float, default=DEFAULT_BANDWIDTH,
+                        help="Băng thông giả định (Mbit/s)")
+    parser.add_argument('--save', action='store_true',
+                        help="Ghi cách nhanh hơn cho --fetch-format auto")
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(args.corpus) or '.', exist_ok=True)
+    if args.record:
+        count = record_from_gmail(args.record, args.corpus)
+        print(f"Đã ghi {count} message vào {args.corpus}")
+    elif args.from_mail:
+        count = record_from_mail(args.from_mail, args.corpus, args.limit)
+        print(f"Đã ghi {count} message vào {args.corpus}")
+    if not os.path.exists(args.corpus):
+        print(f"Chưa có corpus {args.corpus}, dùng --record hoặc --from-mail")
+        return 1
+
+    from app import GmailSummarizer
+
+    responses = load_corpus(args.corpus)
+    count = len(responses['full'])
+    if not count:
+        print("Corpus rỗng")
+        return 1
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Chế độ offline: không kết nối Gmail, chỉ dùng phần giải mã
+        summarizer = GmailSummarizer(
+            archive_path=os.path.join(temp_dir, 'bench'), offline=True)
+
+        results = {}
+        print(f"{count} message, băng thông giả định {args.bandwidth} Mbit/s")
+        for fetch_format, texts in responses.items():
+            wire = sum(len(text.encode('utf-8')) for text in texts)
+            compressed = sum(len(zlib.compress(text.encode('utf-8'), 6))
+                             for text in texts)
+            parse = measure_parse(summarizer, texts)
+            transfer = compressed * 8 / (args.bandwidth * 1_000_000)
+            results[fetch_format] = {
+                'wire_bytes': wire,
+                'gzip_bytes': compressed,
+                'parse_seconds': parse,
+                'total_seconds': parse + transfer,
+            }
+            print(f"{fetch_format:>4}: {wire / count / 1024:8.1f} KB/message, "
+                  f"gzip {compressed / count / 1024:7.1f} KB, "
+                  f"parse {parse / count * 1000:7.3f} ms, "
+                  f"tổng {(parse + transfer) / count * 1000:7.3f} ms/message")
+        summarizer.archive.close()
+
+    winner = min(results, key=lambda name: results[name]['total_seconds'])
+    print(f"Nhanh hơn: {winner}")
+    if args.save:
+        os.makedirs(os.path.dirname(gmail_client.FETCH_FORMAT_PATH),
+                    exist_ok=True)
+        with open(gmail_client.FETCH_FORMAT_PATH, 'w', encoding='utf-8') as f:
+            json.dump({'format': winner, 'messages': count,
+                       'bandwidth_mbit': args.bandwidth,
+                       'results': results}, f, indent=2)
+        print(f"Đã ghi {gmail_client.FETCH_FORMAT_PATH}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
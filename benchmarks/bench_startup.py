@@ -0,0 +1,107 @@
+"""Đo thời gian import và thời gian đến khi cửa sổ đầu tiên hiện ra.
+
+Chạy từ thư mục gốc của repo:
+
+    python benchmarks/bench_startup.py
+
+Trả về mã lỗi khác 0 nếu vượt ngân sách thời gian hoặc nếu các thư viện
+nặng bị import ngay khi khởi động.
+"""
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Ngân sách thời gian (giây)
+IMPORT_BUDGET = 0.5
+FIRST_WINDOW_BUDGET = 1.0
+RUNS = 5
+
+# Các module không được phép import khi khởi động
+HEAVY_MODULES = (
+    'googleapiclient',
+    'google_auth_oauthlib',
+    'google.oauth2',
+    'bs4',
+    'html2text',
+    'numpy',
+    'scipy',
+    'zstandard',
+)
+
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(json.dumps({{'elapsed': elapsed, 'heavy': heavy}}))
+"""
+
+WINDOW_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import tkinter
+try:
+    import app_v4
+    app = app_v4.EmailAnalyzerGUI()
+    app.root.update()
+except tkinter.TclError as e:
+    print(json.dumps({'error': str(e)}))
+    sys.exit(0)
+elapsed = time.perf_counter() - start
+heavy = [name for name in %r if name in sys.modules]
+app.root.destroy()
+print(json.dumps({'elapsed': elapsed, 'heavy': heavy}))
+"""
+
+
+def run_script(script):
+    # Mỗi lần đo chạy một tiến trình mới để không bị ảnh hưởng bởi cache module
+    output = subprocess.run(
+        [sys.executable, '-c', script], cwd=ROOT, check=True,
+        capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure(script):
+    results = [run_script(script) for _ in range(RUNS)]
+    if 'error' in results[0]:
+        return results[0]
+    times = sorted(result['elapsed'] for result in results)
+    return {'elapsed': times[len(times) // 2], 'heavy': results[0]['heavy']}
+
+
+def main():
+    failed = False
+
+    for module in ('app', 'app_v4'):
+        result = measure(IMPORT_SCRIPT.format(
+            module=module, heavy=HEAVY_MODULES))
+        print(f"import {module}: {result['elapsed'] * 1000:.1f} ms")
+        if result['elapsed'] > IMPORT_BUDGET:
+            print(f"  vượt ngân sách {IMPORT_BUDGET * 1000:.0f} ms")
+            failed = True
+        if result['heavy']:
+            print(f"  import sớm: {', '.join(result['heavy'])}")
+            failed = True
+
+    result = measure(WINDOW_SCRIPT % (HEAVY_MODULES,))
+    if 'error' in result:
+        print(f"Bỏ qua đo cửa sổ (không có màn hình): {result['error']}")
+    else:
+        print(f"cửa sổ đầu tiên: {result['elapsed'] * 1000:.1f} ms")
+        if result['elapsed'] > FIRST_WINDOW_BUDGET:
+            print(f"  vượt ngân sách {FIRST_WINDOW_BUDGET * 1000:.0f} ms")
+            failed = True
+        if result['heavy']:
+            print(f"  import sớm: {', '.join(result['heavy'])}")
+            failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,243 @@
+"""Xử lý nội dung email rất lớn với bộ nhớ giới hạn.
+
+Phần nội dung lớn được giải mã base64 theo từng khúc, HTML được tách chữ
+bằng parser dạng luồng (không dựng cây DOM), văn bản được làm sạch theo
+từng khối dòng. Chỉ giữ lại tối đa max_chars ký tự, còn thống kê (số từ,
+số câu, liên kết...) vẫn được tính trên toàn bộ văn bản. Văn bản trả về
+không kèm dòng ghi chú cắt bớt (để không lọt vào chỉ mục và từ khoá), ghi
+chú được thêm khi hiển thị bằng truncation_note.
+"""
+import base64
+import codecs
+import hashlib
+import re
+from html.parser import HTMLParser
+
+from mime_payload import resolve_charset
+from threads import iter_unquoted
+
+# Phần có dữ liệu (sau giải mã base64) lớn hơn ngưỡng này thì đi theo
+# đường luồng
+DEFAULT_STREAM_BYTES = 200_000
+# Số ký tự tối đa giữ lại của một phần đi theo đường luồng
+DEFAULT_MAX_BODY_CHARS = 200_000
+# Số ký tự base64 mỗi khúc giải mã (bội số của 4)
+DECODE_CHUNK_CHARS = 64 * 1024
+# Kích thước khối dòng đưa qua hàm làm sạch mỗi lần
+CLEAN_BLOCK_CHARS = 64 * 1024
+OPENING_WORDS = 50
+
+TRUNCATION_MARKER = "\n[... Đã cắt bớt {omitted} ký tự, nội dung gốc có {total} ký tự ...]"
+
+SENTENCE_PATTERN = re.compile(r'[.!?]+')
+URL_PATTERN = re.compile(r'https?://\S+')
+HOST_PATTERN = re.compile(r'https?://([^/\s:?#]+)')
+EMAIL_PATTERN = re.compile(r'[\w\.-]+@[\w\.-]+')
+
+SKIPPED_TAGS = frozenset(('script', 'style'))
+
+
+class BodyStats:
+    """Thống kê nội dung, cộng dồn được qua nhiều khối văn bản"""
+    __slots__ = ('chars', 'words', 'sentences', 'urls', 'emails', 'opening',
+                 'hosts', 'omitted')
+
+    def __init__(self):
+        self.chars = 0
+        self.words = 0
+        self.sentences = 0
+        self.urls = 0
+        self.emails = 0
+        self.opening = []
+        # Số liên kết theo tên máy chủ
+        self.hosts = {}
+        # Số ký tự bị cắt bớt khỏi văn bản giữ lại
+        self.omitted = 0
+
+    @classmethod
+    def from_text(cls, text):
+        stats = cls()
+        stats.update(text)
+        return stats
+
+    def update(self, text):
+        words = text.split()
+        self.chars += len(text)
+        self.words += len(words)
+        self.sentences += len(SENTENCE_PATTERN.findall(text))
+        urls = URL_PATTERN.findall(text)
+        self.urls += len(urls)
+        for url in urls:
+            host = HOST_PATTERN.match(url)
+            if host:
+                host = host.group(1).lower()
+                self.hosts[host] = self.hosts.get(host, 0) + 1
+        self.emails += len(EMAIL_PATTERN.findall(text))
+        if len(self.opening) < OPENING_WORDS:
+            self.opening.extend(words[:OPENING_WORDS - len(self.opening)])
+
+    def merge(self, other):
+        """Gộp thống kê của phần nội dung nằm sau (ví dụ phần MIME kế tiếp)"""
+        self.chars += other.chars
+        self.words += other.words
+        self.sentences += other.sentences
+        self.urls += other.urls
+        self.emails += other.emails
+        self.omitted += other.omitted
+        for host, count in other.hosts.items():
+            self.hosts[host] = self.hosts.get(host, 0) + count
+        if len(self.opening) < OPENING_WORDS:
+            self.opening.extend(
+                other.opening[:OPENING_WORDS - len(self.opening)])
+        return self
+
+
+class BoundedText:
+    """Giữ tối đa max_chars ký tự đầu, thống kê trên toàn bộ văn bản"""
+
+    def __init__(self, max_chars=DEFAULT_MAX_BODY_CHARS):
+        self.max_chars = max_chars
+        self.stats = BodyStats()
+        self._blocks = []
+        self._kept = 0
+
+    def append(self, text):
+        if not text:
+            return
+        if self._kept:
+            # Các khối được nối với nhau bằng xuống dòng
+            text = '\n' + text
+        self.stats.update(text)
+        room = self.max_chars - self._kept
+        if room > 0:
+            kept = text[:room]
+            self._blocks.append(kept)
+            self._kept += len(kept)
+        self.stats.omitted = self.stats.chars - self._kept
+
+    def text(self):
+        return ''.join(self._blocks)
+
+
+def truncation_note(stats):
+    """Dòng ghi chú khi hiển thị nội dung bị cắt bớt, không bị cắt thì rỗng"""
+    if stats is None or not stats.omitted:
+        return ''
+    return TRUNCATION_MARKER.format(omitted=stats.omitted, total=stats.chars)
+
+
+class _TextExtractor(HTMLParser):
+    """Tách chữ từ HTML theo luồng, bỏ qua script và style"""
+
+    def __init__(self, emit):
+        super().__init__(convert_charrefs=True)
+        self._emit = emit
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self._skip_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        data = data.strip()
+        if data:
+            # Khoảng trắng trước xuống dòng: hàm làm sạch bỏ '\n' (ký tự
+            # điều khiển) nhưng giữ khoảng trắng, nên chữ và câu của hai khối
+            # liền nhau không bị dính vào nhau
+            self._emit(data + ' \n')
+
+
+def decoded_size(data):
+    """Số byte sau khi giải mã chuỗi base64, ước lượng không cần giải mã"""
+    return len(data) * 3 // 4
+
+
+def iter_base64_chunks(data, chunk_chars=DECODE_CHUNK_CHARS):
+    """Giải mã base64 (urlsafe) theo từng khúc, trả về bytes"""
+    chunk_chars -= chunk_chars % 4
+    for start in range(0, len(data), chunk_chars):
+        chunk = data[start:start + chunk_chars]
+        if start + chunk_chars >= len(data):
+            # Gmail đôi khi bỏ ký tự '=' ở cuối
+            chunk += '=' * (-len(chunk) % 4)
+        yield base64.urlsafe_b64decode(chunk)
+
+
+def iter_text_chunks(data, chunk_chars=DECODE_CHUNK_CHARS, charset=None):
+    """Giải mã base64 rồi charset (mặc định UTF-8) theo từng khúc, trả về str"""
+    codec = resolve_charset(charset) or 'utf-8'
+    decoder = codecs.getincrementaldecoder(codec)(errors='replace')
+    for chunk in iter_base64_chunks(data, chunk_chars):
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def part_digest(data, chunk_chars=DECODE_CHUNK_CHARS):
+    """SHA-256 của dữ liệu base64, băm theo khúc để không sao chép cả chuỗi"""
+    digest = hashlib.sha256()
+    for start in range(0, len(data), chunk_chars):
+        digest.update(data[start:start + chunk_chars].encode('ascii'))
+    return digest.digest()
+
+
+def extract_bounded(data, mime_type, clean=None,
+                    max_chars=DEFAULT_MAX_BODY_CHARS, charset=None,
+                    strip_quotes=False):
+    """Giải mã và tách chữ một phần MIME lớn, trả về (văn bản, thống kê)
+
+    clean là hàm làm sạch tuỳ chọn, được gọi trên từng khối dòng hoàn chỉnh
+    nên bộ nhớ dùng thêm chỉ cỡ CLEAN_BLOCK_CHARS. charset là charset khai
+    báo của phần này. strip_quotes bỏ phần trích dẫn thư cũ như
+    threads.strip_quoted.
+    """
+    result = BoundedText(max_chars)
+    pending = []
+    pending_chars = 0
+
+    def flush(final=False):
+        nonlocal pending_chars
+        block = ''.join(pending)
+        pending.clear()
+        if not final:
+            # Giữ lại dòng chưa kết thúc cho khối sau
+            block, newline, rest = block.rpartition('\n')
+            if not newline:
+                block, rest = rest, ''
+            if rest:
+                pending.append(rest)
+        pending_chars = len(pending[0]) if pending else 0
+        if clean is not None:
+            block = clean(block)
+        result.append(block.strip('\n'))
+
+    def emit(text):
+        nonlocal pending_chars
+        pending.append(text)
+        pending_chars += len(text)
+        if pending_chars >= CLEAN_BLOCK_CHARS:
+            flush()
+
+    texts = iter_text_chunks(data, charset=charset)
+    if strip_quotes:
+        texts = iter_unquoted(texts, mime_type)
+    if 'text/html' in mime_type:
+        parser = _TextExtractor(emit)
+        for text in texts:
+            parser.feed(text)
+        parser.close()
+    else:
+        for text in texts:
+            emit(text)
+    flush(final=True)
+
+    return result.text(), result.stats
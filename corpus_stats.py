@@ -0,0 +1,172 @@
+"""Thống kê tổng quan trên toàn bộ các email đã phân tích.
+
+Chỉ số của từng email được cộng dồn vào các mảng array.array gọn nhẹ, còn
+các phép tổng hợp (tổng, phân vị, phân bố theo thứ/giờ) được tính một lần
+bằng NumPy khi cần hiển thị, nên vẫn nhanh với hàng trăm nghìn email. NumPy
+chỉ được import khi tính tổng hợp. Top người gửi và tên miền do
+heavy_hitters.MailboxHeavyHitters theo dõi với bộ nhớ cố định, không đếm ở
+đây.
+"""
+import math
+from array import array
+
+from result_model import MISSING_TIMESTAMP
+
+PERCENTILES = (50, 90, 99)
+WEEKDAYS = ('T2', 'T3', 'T4', 'T5', 'T6', 'T7', 'CN')
+HISTOGRAM_WIDTH = 30
+SECONDS_PER_DAY = 86400
+# 1970-01-01 là thứ Năm, dịch để thứ Hai có chỉ số 0
+EPOCH_WEEKDAY = 3
+
+
+class CorpusSummary:
+    __slots__ = ('count', 'totals', 'word_percentiles',
+                 'sentence_percentiles', 'weekdays', 'hours', 'dated', 'first', 'last',
+                 'links_per_1000_words', 'with_links', 'addresses_per_email')
+
+
+class CorpusStats:
+    """Bộ cộng dồn chỉ số của từng email"""
+
+    def __init__(self):
+        self.words = array('q')
+        self.sentences = array('q')
+        self.urls = array('q')
+        self.emails = array('q')
+        self.chars = array('q')
+        self.timestamps = array('d')
+
+    def __len__(self):
+        return len(self.words)
+
+    def add(self, words, sentences, urls, emails, chars, timestamp):
+        """Thêm chỉ số của một email"""
+        self.words.append(words)
+        self.sentences.append(sentences)
+        self.urls.append(urls)
+        self.emails.append(emails)
+        self.chars.append(chars)
+        self.timestamps.append(timestamp)
+
+    def add_record(self, record):
+        """Thêm EmailRecord đã có thống kê nội dung (record.stats)"""
+        stats = record.stats
+        self.add(stats.words, stats.sentences, stats.urls, stats.emails,
+                 stats.chars, record.timestamp)
+
+    @staticmethod
+    def metrics_row(record):
+        """Chỉ số của một email dạng dict để lưu vào journal và shard"""
+        stats = record.stats
+        timestamp = record.timestamp
+        return {
+            'words': stats.words,
+            'sentences': stats.sentences,
+            'urls': stats.urls,
+            'emails': stats.emails,
+            'chars': stats.chars,
+            'timestamp': timestamp if math.isfinite(timestamp) else None,
+            'address': record.address,
+            'hosts': stats.hosts
+        }
+
+    def add_row(self, row):
+        """Thêm lại chỉ số đã lưu bằng metrics_row (khi chạy tiếp)"""
+        timestamp = row['timestamp']
+        if timestamp is None:
+            timestamp = MISSING_TIMESTAMP
+        self.add(row['words'], row['sentences'], row['urls'], row['emails'],
+                 row['chars'], timestamp)
+
+    def summary(self):
+        """Tính các chỉ số tổng hợp, trả về None nếu chưa có email nào"""
+        if not self.words:
+            return None
+        import numpy as np
+
+        words = np.frombuffer(self.words, dtype=np.int64)
+        sentences = np.frombuffer(self.sentences, dtype=np.int64)
+        urls = np.frombuffer(self.urls, dtype=np.int64)
+        emails = np.frombuffer(self.emails, dtype=np.int64)
+        chars = np.frombuffer(self.chars, dtype=np.int64)
+        timestamps = np.frombuffer(self.timestamps, dtype=np.float64)
+
+        summary = CorpusSummary()
+        summary.count = len(words)
+        summary.totals = {
+            'words': int(words.sum()),
+            'sentences': int(sentences.sum()),
+            'urls': int(urls.sum()),
+            'emails': int(emails.sum()),
+            'chars': int(chars.sum()),
+        }
+        summary.word_percentiles = np.percentile(words, PERCENTILES).tolist()
+        summary.sentence_percentiles = np.percentile(
+            sentences, PERCENTILES).tolist()
+        dated = timestamps[np.isfinite(timestamps)]
+        summary.dated = len(dated)
+        if len(dated):
+            seconds = dated.astype(np.int64)
+            days = np.floor_divide(seconds, SECONDS_PER_DAY)
+            summary.weekdays = np.bincount(
+                (days + EPOCH_WEEKDAY) % 7, minlength=7).tolist()
+            summary.hours = np.bincount(
+                np.remainder(seconds, SECONDS_PER_DAY) // 3600,
+                minlength=24).tolist()
+            summary.first = float(dated.min())
+            summary.last = float(dated.max())
+        else:
+            summary.weekdays = [0] * 7
+            summary.hours = [0] * 24
+            summary.first = summary.last = None
+
+        total_words = summary.totals['words']
+        summary.links_per_1000_words = (
+            1000 * summary.totals['urls'] / total_words if total_words else 0.0)
+        summary.with_links = float(np.count_nonzero(urls)) / summary.count
+        summary.addresses_per_email = float(emails.mean())
+        return summary
+
+
+def _histogram_lines(labels, counts):
+    peak = max(counts) or 1
+    width = max(len(label) for label in labels)
+    return [f"  {label:>{width}} | {'#' * round(HISTOGRAM_WIDTH * count / peak):<{HISTOGRAM_WIDTH}} {count}"
+            for label, count in zip(labels, counts)]
+
+
+def format_summary(summary):
+    """Trình bày thống kê tổng hợp dạng văn bản cho báo cáo và GUI"""
+    if summary is None:
+        return "Chưa có email nào để thống kê.\n"
+    from datetime import datetime, timezone
+
+    totals = summary.totals
+    percentile_names = ' / '.join(f"p{p}" for p in PERCENTILES)
+    lines = [
+        f"Tổng số từ: {totals['words']}",
+        f"Tổng số câu: {totals['sentences']}",
+        f"Tổng số liên kết: {totals['urls']}",
+        f"Tổng số địa chỉ email trong nội dung: {totals['emails']}",
+        f"Số từ mỗi email ({percentile_names}): "
+        + ' / '.join(f"{value:.0f}" for value in summary.word_percentiles),
+        f"Số câu mỗi email ({percentile_names}): "
+        + ' / '.join(f"{value:.0f}" for value in summary.sentence_percentiles),
+        f"Mật độ liên kết: {summary.links_per_1000_words:.1f} liên kết / 1000 từ",
+        f"Tỉ lệ email có liên kết: {summary.with_links:.1%}",
+        f"Địa chỉ email trung bình mỗi email: {summary.addresses_per_email:.2f}",
+    ]
+
+    if summary.dated:
+        first = datetime.fromtimestamp(summary.first, timezone.utc)
+        last = datetime.fromtimestamp(summary.last, timezone.utc)
+        lines.append("")
+        lines.append(f"Khoảng thời gian: {first:%Y-%m-%d} đến {last:%Y-%m-%d}"
+                     f" ({summary.dated}/{summary.count} email có ngày hợp lệ)")
+        lines.append("Phân bố theo thứ trong tuần (UTC):")
+        lines.extend(_histogram_lines(WEEKDAYS, summary.weekdays))
+        lines.append("Phân bố theo giờ trong ngày (UTC):")
+        lines.extend(_histogram_lines(
+            [f"{hour:02d}h" for hour in range(24)], summary.hours))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,166 @@
+"""Phát hiện email trùng lặp bằng hash nội dung và MinHash.
+
+Email giống hệt nhau (sau khi chuẩn hoá) được nhận ra bằng SHA-256, email
+gần giống nhau được nhận ra bằng độ tương đồng Jaccard giữa hai tập shingle,
+ước lượng bằng chữ ký MinHash và tra ứng viên bằng LSH theo băng.
+
+Các thông báo tự động (ví dụ Google Cloud) chỉ khác nhau ở id dự án và ngày
+giờ; từ có chứa chữ số được thay bằng một ký hiệu chung trước khi tạo
+shingle nên các thông báo này có Jaccard cao.
+"""
+import hashlib
+import re
+import unicodedata
+
+SHINGLE_SIZE = 3
+MINHASH_PERMUTATIONS = 64
+# 16 băng x 4 hàng: cặp có Jaccard 0.6 gần như chắc chắn trùng ít nhất một băng
+DEFAULT_BANDS = 16
+# Jaccard ước lượng tối thiểu để coi là gần giống nhau
+DEFAULT_THRESHOLD = 0.6
+MINHASH_SEED = 0x5EED
+
+WORD_PATTERN = re.compile(r'\w+')
+DIGIT_PATTERN = re.compile(r'\d')
+# Từ có chữ số (id, ngày, giờ) được thay bằng ký hiệu này
+NUMBER_TOKEN = '0'
+
+# Hệ số hàm băm (multiply-shift) cho từng hoán vị, tạo khi dùng lần đầu
+_coefficients = None
+
+
+def normalize_body(text):
+    """Chuẩn hoá nội dung trước khi hash"""
+    text = unicodedata.normalize('NFC', text).casefold()
+    return ' '.join(text.split())
+
+
+def content_hash(text):
+    return hashlib.sha256(normalize_body(text).encode('utf-8')).hexdigest()
+
+
+def shingles(text):
+    """Tập các shingle gồm SHINGLE_SIZE từ liên tiếp"""
+    words = [NUMBER_TOKEN if DIGIT_PATTERN.search(word) else word
+             for word in WORD_PATTERN.findall(normalize_body(text))]
+    if len(words) < SHINGLE_SIZE:
+        return {' '.join(words)} if words else set()
+    return {' '.join(words[i:i + SHINGLE_SIZE])
+            for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def _permutations():
+    global _coefficients
+    if _coefficients is None:
+        import numpy as np
+        rng = np.random.default_rng(MINHASH_SEED)
+        multipliers = rng.integers(
+            0, 2 ** 63, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+        offsets = rng.integers(
+            0, 2 ** 63, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+        # Hệ số nhân phải lẻ để phép nhân modulo 2^64 là hoán vị
+        _coefficients = (multipliers * 2 + 1, offsets)
+    return _coefficients
+
+
+def minhash(text):
+    """Chữ ký MinHash (bytes, 4 byte mỗi hoán vị), None nếu không có từ nào"""
+    import numpy as np
+
+    items = shingles(text)
+    if not items:
+        return None
+    values = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(
+            item.encode('utf-8'), digest_size=8).digest(), 'big')
+         for item in items),
+        dtype=np.uint64, count=len(items))
+    multipliers, offsets = _permutations()
+    # (a * x + b) mod 2^64, lấy 32 bit cao
+    hashed = (values[:, None] * multipliers + offsets) >> np.uint64(32)
+    return hashed.min(axis=0).astype(np.uint32).tobytes()
+
+
+def similarity(a, b):
+    """Jaccard ước lượng từ hai chữ ký MinHash"""
+    import numpy as np
+    return float(np.count_nonzero(
+        np.frombuffer(a, dtype=np.uint32) == np.frombuffer(b, dtype=np.uint32)
+    )) / MINHASH_PERMUTATIONS
+
+
+class DuplicateMatch:
+    """Kết quả tra cứu: email gốc đã phân tích và mức độ trùng lặp"""
+    __slots__ = ('key', 'payload', 'exact', 'similarity')
+
+    def __init__(self, key, payload, exact, similarity):
+        self.key = key
+        self.payload = payload
+        self.exact = exact
+        self.similarity = similarity
+
+
+class DuplicateIndex:
+    """Chỉ mục các email đã phân tích để tái sử dụng kết quả"""
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, bands=DEFAULT_BANDS):
+        if MINHASH_PERMUTATIONS % bands:
+            raise ValueError("Số hoán vị phải chia hết cho số băng")
+        self.threshold = threshold
+        self.bands = bands
+        self.band_bytes = MINHASH_PERMUTATIONS // bands * 4
+        self._by_hash = {}
+        self._signatures = {}
+        self._payloads = {}
+        self._band_tables = [{} for _ in range(bands)]
+        self._groups = {}
+
+    def _band_keys(self, signature):
+        return [signature[i * self.band_bytes:(i + 1) * self.band_bytes]
+                for i in range(self.bands)]
+
+    def find(self, text):
+        """Tìm email đã phân tích giống hệt hoặc gần giống với text"""
+        digest = content_hash(text)
+        key = self._by_hash.get(digest)
+        if key is not None:
+            return DuplicateMatch(key, self._payloads[key], True, 1.0)
+
+        signature = minhash(text)
+        if signature is None:
+            return None
+        best = None
+        seen = set()
+        for table, band in zip(self._band_tables,
+                               self._band_keys(signature)):
+            for candidate in table.get(band, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                score = similarity(signature, self._signatures[candidate])
+                if score >= self.threshold and (
+                        best is None or score > best[1]):
+                    best = (candidate, score)
+        if best is None:
+            return None
+        return DuplicateMatch(best[0], self._payloads[best[0]], False, best[1])
+
+    def add(self, key, text, payload):
+        """Thêm email gốc cùng kết quả phân tích của nó"""
+        self._by_hash.setdefault(content_hash(text), key)
+        self._payloads[key] = payload
+        signature = minhash(text)
+        if signature is None:
+            return
+        self._signatures[key] = signature
+        for table, band in zip(self._band_tables,
+                               self._band_keys(signature)):
+            table.setdefault(band, []).append(key)
+
+    def add_duplicate(self, key, match):
+        """Ghi nhận key là bản trùng của email match.key"""
+        self._groups.setdefault(match.key, []).append(key)
+
+    def groups(self):
+        """Các nhóm trùng lặp: {email gốc: [các bản trùng]}"""
+        return dict(self._groups)
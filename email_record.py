@@ -0,0 +1,126 @@
+"""Bản ghi email gọn nhẹ dùng chung cho bản CLI và GUI."""
+import sys
+from dataclasses import dataclass
+
+from result_model import MISSING_TIMESTAMP, normalize_sender, parse_timestamp
+
+DEFAULT_SUBJECT = 'Không có tiêu đề'
+DEFAULT_SENDER = 'Không rõ người gửi'
+
+# Header cần lấy, tra theo tên đã chuyển chữ thường
+WANTED_HEADERS = frozenset(('subject', 'from', 'date'))
+
+
+@dataclass(slots=True)
+class PartRef:
+    """Tham chiếu tới một phần MIME (nội dung hoặc file đính kèm)"""
+    part_id: str
+    mime_type: str
+    filename: str
+    size: int
+    attachment_id: str
+
+
+@dataclass(slots=True)
+class EmailRecord:
+    msg_id: str
+    thread_id: str = ''
+    subject: str = DEFAULT_SUBJECT
+    sender: str = DEFAULT_SENDER
+    date: str = ''
+    timestamp: float = MISSING_TIMESTAMP
+    address: str = ''
+    label_ids: tuple = ()
+    body: str = ''
+    parts: tuple = ()
+    analysis: object = None
+    # Thống kê trên toàn bộ nội dung (kể cả phần body đã bị cắt bớt)
+    stats: object = None
+    keywords: tuple = ()
+
+    @property
+    def domain(self):
+        return self.address.rpartition('@')[2]
+
+    @property
+    def has_attachments(self):
+        return any(part.filename for part in self.parts)
+
+    @classmethod
+    def from_headers(cls, msg_id, subject, sender, date, **fields):
+        """Tạo bản ghi từ các header đã biết (kho cục bộ, ảnh chụp phiên)"""
+        return cls(
+            msg_id=msg_id,
+            subject=subject,
+            sender=sender,
+            date=date,
+            timestamp=parse_timestamp(date),
+            address=sys.intern(normalize_sender(sender)[0]),
+            **fields)
+
+    @classmethod
+    def from_message(cls, message, body='', clean=None):
+        """Tạo bản ghi từ message Gmail API (format='full')
+
+        Các header được lấy trong một lần duyệt danh sách header. clean là
+        hàm làm sạch tuỳ chọn áp dụng cho subject và người gửi.
+        """
+        payload = message.get('payload', {})
+        found = {}
+        for header in payload.get('headers', ()):
+            name = header['name'].lower()
+            if name in WANTED_HEADERS and name not in found:
+                found[name] = header['value']
+                if len(found) == len(WANTED_HEADERS):
+                    break
+
+        subject = found.get('subject', DEFAULT_SUBJECT)
+        sender = found.get('from', DEFAULT_SENDER)
+        if clean is not None:
+            subject = clean(subject)
+            sender = clean(sender)
+
+        return cls.from_headers(
+            message['id'], subject, sender, found.get('date', ''),
+            thread_id=message.get('threadId', ''),
+            label_ids=tuple(sys.intern(label)
+                            for label in message.get('labelIds', ())),
+            body=body,
+            parts=tuple(iter_part_refs(payload)))
+
+
+def iter_part_refs(payload):
+    """Duyệt cây MIME, trả về PartRef cho từng phần lá"""
+    stack = [payload]
+    while stack:
+        part = stack.pop()
+        children = part.get('parts')
+        if children:
+            stack.extend(reversed(children))
+            continue
+        body = part.get('body', {})
+        yield PartRef(
+            part.get('partId', ''),
+            sys.intern(part.get('mimeType', '')),
+            part.get('filename', ''),
+            body.get('size', 0),
+            body.get('attachmentId', ''))
+
+
+@dataclass(slots=True)
+class ThreadRecord:
+    """Một cuộc hội thoại: các email theo thứ tự thời gian của Gmail"""
+    thread_id: str
+    messages: list
+
+    @property
+    def subject(self):
+        return self.messages[0].subject if self.messages else DEFAULT_SUBJECT
+
+    @property
+    def last(self):
+        return self.messages[-1] if self.messages else None
+
+    def participants(self):
+        """Người gửi theo thứ tự xuất hiện đầu tiên, không lặp lại"""
+        return list(dict.fromkeys(message.sender for message in self.messages))
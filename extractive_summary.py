@@ -0,0 +1,157 @@
+"""Tóm tắt trích xuất: chọn các câu tiêu biểu nhất của mỗi email.
+
+Mỗi câu được biểu diễn bằng vector TF-IDF, điểm của câu là độ tương đồng
+cosine với vector trung bình (centroid) của email chứa nó, nhân thêm trọng
+số theo vị trí (câu càng ở đầu càng được ưu tiên). IDF lấy từ bảng tần
+suất tài liệu của cả kho (document_frequency) nếu có, không thì tính trên
+lô email đang tóm tắt, nên các câu khuôn mẫu lặp lại ở nhiều email (chân
+trang, thông báo tự động) bị hạ điểm. Dùng tần suất của kho thì kết quả
+không phụ thuộc cách chia lô (chạy một lượt hay chạy tiếp bằng --resume).
+Từ được tách giống keywords.extract_terms (bỏ stopword và số) để khớp với
+bảng tần suất đó.
+
+Cả lô email được xử lý cùng lúc bằng ma trận thưa (scipy.sparse), chỉ phần
+tách từ là chạy vòng lặp Python. NumPy và SciPy chỉ được import khi tóm tắt.
+"""
+import re
+from itertools import islice
+
+from keywords import MIN_TERM_LENGTH, STOPWORDS, TOKEN_PATTERN, normalize_text
+
+DEFAULT_SENTENCES = 3
+DEFAULT_BATCH_SIZE = 32
+# Câu ngắn hơn số từ này (tiêu đề, lời chào) không được chọn
+MIN_SENTENCE_WORDS = 4
+# Câu dài hơn (thường là cả khối văn bản không có dấu câu) bị cắt khi hiển thị
+MAX_SENTENCE_WORDS = 60
+# Điểm của câu đầu tiên được nhân tối đa (1 + POSITION_WEIGHT)
+POSITION_WEIGHT = 0.5
+
+# Một câu kết thúc bằng dấu câu theo sau là khoảng trắng, hoặc xuống dòng;
+# dấu chấm nằm giữa chữ (tên miền, số thập phân) không tách câu
+SENTENCE_PATTERN = re.compile(r'(?:[^.!?\n]+|[.!?]+(?=[^\s.!?]))+[.!?]*')
+# Dòng chỉ chứa liên kết do clean_text tách ra
+URL_LINE_PATTERN = re.compile(r'^(URL:\s*)?https?://\S+$')
+# Ký tự vô hình dùng để đệm trong email quảng cáo
+FILLER_PATTERN = re.compile('[\u034f\u00ad\u200b\u200c\u200d\ufeff]')
+
+
+def split_sentences(text):
+    """Tách văn bản thành các câu đủ dài để đưa vào tóm tắt"""
+    sentences = []
+    for sentence in SENTENCE_PATTERN.findall(FILLER_PATTERN.sub('', text)):
+        words = sentence.split()
+        if len(words) < MIN_SENTENCE_WORDS:
+            continue
+        sentence = ' '.join(words)
+        if URL_LINE_PATTERN.match(sentence):
+            continue
+        if len(words) > MAX_SENTENCE_WORDS:
+            sentence = ' '.join(words[:MAX_SENTENCE_WORDS]) + ' ...'
+        sentences.append(sentence)
+    return sentences
+
+
+def tokenize(text):
+    return [token for token in TOKEN_PATTERN.findall(normalize_text(text))
+            if len(token) >= MIN_TERM_LENGTH and token not in STOPWORDS]
+
+
+def iter_batches(iterable, size=DEFAULT_BATCH_SIZE):
+    """Chia một iterable thành các list tối đa size phần tử"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def summarize_batch(texts, k=DEFAULT_SENTENCES, document_frequency=None):
+    """Trả về danh sách các câu tóm tắt (theo thứ tự gốc) cho từng văn bản
+
+    document_frequency(terms) trả về (số email, {từ: số email chứa từ}) của
+    cả kho, ví dụ LocalStore.document_frequencies; None thì IDF tính trên lô.
+    """
+    # Tách câu và từ, gán mã số cho từng từ trong từ vựng của lô
+    vocabulary = {}
+    indices = []
+    indptr = [0]
+    owners = []
+    positions = []
+    sentences = []
+    for owner, text in enumerate(texts):
+        for position, sentence in enumerate(split_sentences(text or '')):
+            for word in tokenize(sentence):
+                indices.append(vocabulary.setdefault(word, len(vocabulary)))
+            indptr.append(len(indices))
+            owners.append(owner)
+            positions.append(position)
+            sentences.append(sentence)
+
+    result = [[] for _ in texts]
+    if not sentences:
+        return result
+
+    import numpy as np
+    from scipy import sparse
+
+    n_sentences = len(sentences)
+    n_docs = len(texts)
+    owners = np.asarray(owners)
+    positions = np.asarray(positions, dtype=np.float64)
+
+    # Ma trận câu x từ (số lần xuất hiện) và ma trận email x câu
+    counts = sparse.csr_matrix(
+        (np.ones(len(indices)), np.asarray(indices, dtype=np.int64),
+         np.asarray(indptr, dtype=np.int64)),
+        shape=(n_sentences, len(vocabulary)))
+    counts.sum_duplicates()
+    membership = sparse.csr_matrix(
+        (np.ones(n_sentences), (owners, np.arange(n_sentences))),
+        shape=(n_docs, n_sentences))
+
+    # IDF theo số email chứa từ (làm trơn như sklearn)
+    if document_frequency is None:
+        doc_terms = membership @ counts
+        df = np.bincount(doc_terms.indices, minlength=len(vocabulary))
+        total = n_docs
+    else:
+        # Thứ tự của vocabulary là thứ tự mã số từ
+        total, frequencies = document_frequency(vocabulary)
+        df = np.fromiter((frequencies.get(term, 0) for term in vocabulary),
+                         dtype=np.float64, count=len(vocabulary))
+    idf = np.log((1 + total) / (1 + df)) + 1
+
+    # TF-IDF của câu, chuẩn hoá L2 theo từng câu
+    weights = counts.multiply(idf).tocsr()
+    weights = _normalize_rows(weights)
+
+    # Centroid của từng email và cosine giữa câu với centroid của email đó
+    centroids = _normalize_rows(membership @ weights)
+    similarity = np.asarray(
+        weights.multiply(centroids[owners]).sum(axis=1)).ravel()
+
+    # Trọng số vị trí: giảm tuyến tính từ câu đầu đến câu cuối của email
+    lengths = np.bincount(owners, minlength=n_docs)
+    relative = positions / np.maximum(lengths[owners] - 1, 1)
+    scores = similarity * (1 + POSITION_WEIGHT * (1 - relative))
+
+    # Chọn k câu điểm cao nhất của mỗi email, sau đó xếp lại theo vị trí
+    order = np.lexsort((positions, -scores, owners))
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    rank = np.arange(n_sentences) - starts[owners[order]]
+    chosen = order[rank < k]
+    chosen = chosen[np.lexsort((positions[chosen], owners[chosen]))]
+    for index in chosen.tolist():
+        result[owners[index]].append(sentences[index])
+    return result
+
+
+def _normalize_rows(matrix):
+    import numpy as np
+    from scipy import sparse
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms) @ matrix
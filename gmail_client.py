@@ -0,0 +1,164 @@
+"""Kết nối Gmail API dùng chung cho bản CLI và GUI.
+
+Các thư viện Google chỉ được import khi thực sự kết nối, và discovery
+document của Gmail API được lưu trên đĩa để những lần kết nối sau không
+phải tải và parse lại.
+"""
+import json
+import os
+import threading
+
+from mime_payload import from_raw_response
+
+SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
+TOKEN_PATH = 'token.json'
+CREDENTIALS_PATH = 'credentials.json'
+DISCOVERY_CACHE_PATH = os.path.join('.cache', 'gmail_v1_discovery.json')
+
+# Cách tải message: 'full' (Gmail tách sẵn cây MIME thành JSON) hoặc 'raw'
+# (bytes RFC 822, tự parse bằng thư viện email)
+FETCH_FORMATS = ('full', 'raw')
+DEFAULT_FETCH_FORMAT = 'full'
+# Lựa chọn nhanh hơn do benchmarks/bench_fetch_format.py --save ghi lại
+FETCH_FORMAT_PATH = os.path.join('.cache', 'fetch_format.json')
+
+# Thời gian chờ tối đa của mỗi request HTTP (giây); quá hạn thì
+# socket.timeout, QuotaLimiter coi là lỗi tạm thời và thử lại
+REQUEST_TIMEOUT = 60
+
+# Discovery document đã parse, dùng chung trong tiến trình
+_discovery_documents = {}
+_discovery_lock = threading.Lock()
+
+
+def load_credentials(token_path=TOKEN_PATH, credentials_path=CREDENTIALS_PATH,
+                     scopes=SCOPES, interactive=True):
+    """Đọc token đã lưu, làm mới hoặc chạy OAuth flow nếu cần
+
+    Với interactive=False (chạy nền, nhiều tài khoản) thì không mở trình
+    duyệt mà báo lỗi nếu token không làm mới được.
+    """
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+
+    creds = None
+    if os.path.exists(token_path):
+        creds = Credentials.from_authorized_user_file(token_path, scopes)
+    if not creds or not creds.valid:
+        if creds and creds.expired and creds.refresh_token:
+            creds.refresh(Request())
+        elif not interactive:
+            raise RuntimeError(
+                f"Token {token_path} không hợp lệ và không làm mới được")
+        else:
+            from google_auth_oauthlib.flow import InstalledAppFlow
+            flow = InstalledAppFlow.from_client_secrets_file(
+                credentials_path, scopes)
+            creds = flow.run_local_server(port=0)
+        with open(token_path, 'w') as token:
+            token.write(creds.to_json())
+    return creds
+
+
+def load_discovery_document(cache_path=DISCOVERY_CACHE_PATH):
+    """Discovery document từ bộ nhớ hoặc file cache, None nếu chưa có"""
+    with _discovery_lock:
+        document = _discovery_documents.get(cache_path)
+        if document is None and os.path.exists(cache_path):
+            try:
+                with open(cache_path, encoding='utf-8') as f:
+                    document = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Bỏ qua discovery cache lỗi: {str(e)}")
+                return None
+            _discovery_documents[cache_path] = document
+        return document
+
+
+def save_discovery_document(document, cache_path=DISCOVERY_CACHE_PATH):
+    with _discovery_lock:
+        _discovery_documents[cache_path] = document
+        directory = os.path.dirname(cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Ghi ra file tạm rồi đổi tên để không để lại file cache hỏng
+        tmp_path = cache_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(document, f)
+        os.replace(tmp_path, cache_path)
+
+
+def authorized_http(creds, timeout=REQUEST_TIMEOUT):
+    """httplib2.Http có timeout, để một request treo không chặn mãi"""
+    import httplib2
+    from google_auth_httplib2 import AuthorizedHttp
+
+    return AuthorizedHttp(creds, http=httplib2.Http(timeout=timeout))
+
+
+def build_service(creds, cache_path=DISCOVERY_CACHE_PATH,
+                  timeout=REQUEST_TIMEOUT):
+    """Tạo Gmail service, dùng discovery document đã cache nếu có"""
+    from googleapiclient.discovery import build, build_from_document
+
+    http = authorized_http(creds, timeout)
+    document = load_discovery_document(cache_path)
+    if document is not None:
+        return build_from_document(document, http=http)
+
+    service = build('gmail', 'v1', http=http, cache_discovery=False)
+    try:
+        save_discovery_document(service._rootDesc, cache_path)
+    except OSError as e:
+        print(f"Không lưu được discovery cache: {str(e)}")
+    return service
+
+
+class ThreadLocalService:
+    """Mỗi thread dùng một service riêng vì httplib2 không an toàn đa luồng"""
+
+    def __init__(self, creds, cache_path=DISCOVERY_CACHE_PATH,
+                 timeout=REQUEST_TIMEOUT):
+        self.creds = creds
+        self.cache_path = cache_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def get(self):
+        service = getattr(self._local, 'service', None)
+        if service is None:
+            service = build_service(self.creds, self.cache_path, self.timeout)
+            self._local.service = service
+        return service
+
+
+def preferred_fetch_format(path=FETCH_FORMAT_PATH):
+    """Cách tải đã đo là nhanh hơn, mặc định 'full' nếu chưa đo"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            fetch_format = json.load(f).get('format')
+    except (OSError, ValueError, AttributeError):
+        return DEFAULT_FETCH_FORMAT
+    if fetch_format in FETCH_FORMATS:
+        return fetch_format
+    return DEFAULT_FETCH_FORMAT
+
+
+def message_request(service, msg_id, fetch_format=DEFAULT_FETCH_FORMAT):
+    return service.users().messages().get(
+        userId='me', id=msg_id, format=fetch_format)
+
+
+def normalize_message(message):
+    """Message tải bằng format='raw' chuyển về dạng của format='full'"""
+    if 'raw' in message:
+        return from_raw_response(message)
+    return message
+
+
+def connect(token_path=TOKEN_PATH, credentials_path=CREDENTIALS_PATH,
+            scopes=SCOPES, interactive=True, timeout=REQUEST_TIMEOUT):
+    """Kết nối và trả về ThreadLocalService dùng được từ nhiều thread"""
+    return ThreadLocalService(load_credentials(
+        token_path, credentials_path, scopes, interactive),
+        timeout=timeout)
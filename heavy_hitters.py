@@ -0,0 +1,250 @@
+"""Theo dõi người gửi, tên miền và máy chủ liên kết xuất hiện nhiều nhất.
+
+Dùng bộ nhớ cố định bất kể số email:
+
+- CountMinSketch: ước lượng số lần xuất hiện của một khoá bất kỳ (chỉ có
+  thể ước lượng cao hơn, không bao giờ thấp hơn).
+- SpaceSaving: giữ tối đa capacity khoá ứng viên cho top-k.
+
+Hàm băm là blake2b nên kết quả giống nhau giữa các tiến trình và các lần
+chạy, nhờ vậy các bản tóm tắt cùng tham số gộp được với nhau (theo shard,
+tiến trình hay tài khoản).
+"""
+import base64
+import hashlib
+import heapq
+from array import array
+
+DEFAULT_WIDTH = 2048
+DEFAULT_DEPTH = 4
+DEFAULT_CAPACITY = 200
+TOP_K = 10
+# Số phần tử tối đa của heap so với capacity trước khi dựng lại
+HEAP_SLACK = 4
+
+
+def _hash_pair(key, seed):
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16,
+                             key=seed).digest()
+    return (int.from_bytes(digest[:8], 'little'),
+            int.from_bytes(digest[8:], 'little') | 1)
+
+
+class CountMinSketch:
+    def __init__(self, width=DEFAULT_WIDTH, depth=DEFAULT_DEPTH, seed=b''):
+        self.width = width
+        self.depth = depth
+        self.seed = seed
+        self.total = 0
+        self.table = array('q', bytes(8 * width * depth))
+
+    def _cells(self, key):
+        # Double hashing: hàng i dùng h1 + i * h2
+        h1, h2 = _hash_pair(key, self.seed)
+        width = self.width
+        return [row * width + (h1 + row * h2) % width
+                for row in range(self.depth)]
+
+    def add(self, key, count=1):
+        self.total += count
+        table = self.table
+        for cell in self._cells(key):
+            table[cell] += count
+
+    def estimate(self, key):
+        table = self.table
+        return min(table[cell] for cell in self._cells(key))
+
+    def merge(self, other):
+        if (self.width, self.depth, self.seed) != (
+                other.width, other.depth, other.seed):
+            raise ValueError("Không gộp được CountMinSketch khác tham số")
+        table = self.table
+        for cell, count in enumerate(other.table):
+            table[cell] += count
+        self.total += other.total
+        return self
+
+    def to_dict(self):
+        return {
+            'width': self.width,
+            'depth': self.depth,
+            'seed': self.seed.hex(),
+            'total': self.total,
+            'table': base64.b64encode(self.table.tobytes()).decode('ascii')
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['width'], data['depth'], bytes.fromhex(data['seed']))
+        sketch.total = data['total']
+        sketch.table = array('q')
+        sketch.table.frombytes(base64.b64decode(data['table']))
+        return sketch
+
+
+class SpaceSaving:
+    """Top-k theo thuật toán Space-Saving (Metwally và cộng sự)"""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        # khoá -> [số lần, sai số tối đa]
+        self.counters = {}
+        self._heap = []
+
+    def add(self, key, count=1):
+        counter = self.counters.get(key)
+        if counter is not None:
+            counter[0] += count
+        elif len(self.counters) < self.capacity:
+            counter = self.counters[key] = [count, 0]
+        else:
+            # Thay khoá có số lần nhỏ nhất, khoá mới thừa hưởng số lần đó
+            minimum = self._pop_min()
+            floor = self.counters.pop(minimum)[0]
+            counter = self.counters[key] = [floor + count, floor]
+        heapq.heappush(self._heap, (counter[0], key))
+        if len(self._heap) > HEAP_SLACK * self.capacity:
+            self._rebuild_heap()
+
+    def _pop_min(self):
+        # Heap có thể chứa số lần cũ của khoá, bỏ qua các mục đã lỗi thời
+        while True:
+            count, key = heapq.heappop(self._heap)
+            counter = self.counters.get(key)
+            if counter is not None and counter[0] == count:
+                return key
+
+    def _rebuild_heap(self):
+        self._heap = [(counter[0], key)
+                      for key, counter in self.counters.items()]
+        heapq.heapify(self._heap)
+
+    def min_count(self):
+        """Số lần nhỏ nhất khi đã đầy (khoá không được theo dõi <= giá trị này)"""
+        if len(self.counters) < self.capacity:
+            return 0
+        return min(counter[0] for counter in self.counters.values())
+
+    def merge(self, other):
+        """Gộp hai bản tóm tắt theo cách của Agarwal và cộng sự"""
+        own_floor = self.min_count()
+        other_floor = other.min_count()
+        merged = {}
+        for key in self.counters.keys() | other.counters.keys():
+            count, error = self.counters.get(key, (own_floor, own_floor))
+            other_count, other_error = other.counters.get(
+                key, (other_floor, other_floor))
+            merged[key] = [count + other_count, error + other_error]
+        top = heapq.nlargest(self.capacity, merged.items(),
+                             key=lambda item: item[1][0])
+        self.counters = dict(top)
+        self._rebuild_heap()
+        return self
+
+    def top(self, k=TOP_K):
+        """k khoá nhiều nhất dạng [(khoá, số lần, sai số)]"""
+        items = heapq.nlargest(k, self.counters.items(),
+                               key=lambda item: (item[1][0], item[0]))
+        return [(key, count, error) for key, (count, error) in items]
+
+    def to_dict(self):
+        return {'capacity': self.capacity, 'counters': self.counters}
+
+    @classmethod
+    def from_dict(cls, data):
+        summary = cls(data['capacity'])
+        summary.counters = {key: list(counter)
+                            for key, counter in data['counters'].items()}
+        summary._rebuild_heap()
+        return summary
+
+
+class HeavyHitters:
+    """Count-Min Sketch và Space-Saving cho cùng một luồng khoá"""
+
+    def __init__(self, width=DEFAULT_WIDTH, depth=DEFAULT_DEPTH,
+                 capacity=DEFAULT_CAPACITY, seed=b''):
+        self.sketch = CountMinSketch(width, depth, seed)
+        self.summary = SpaceSaving(capacity)
+
+    def add(self, key, count=1):
+        self.sketch.add(key, count)
+        self.summary.add(key, count)
+
+    def estimate(self, key):
+        return self.sketch.estimate(key)
+
+    def top(self, k=TOP_K):
+        """k khoá nhiều nhất dạng [(khoá, số lần ước lượng)]
+
+        Cả hai cấu trúc đều chỉ ước lượng cao hơn thực tế nên lấy giá trị
+        nhỏ hơn.
+        """
+        result = [(key, min(count, self.sketch.estimate(key)))
+                  for key, count, _ in self.summary.top(k)]
+        result.sort(key=lambda item: (-item[1], item[0]))
+        return result
+
+    def merge(self, other):
+        self.sketch.merge(other.sketch)
+        self.summary.merge(other.summary)
+        return self
+
+    def to_dict(self):
+        return {'sketch': self.sketch.to_dict(),
+                'summary': self.summary.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data):
+        hitters = cls.__new__(cls)
+        hitters.sketch = CountMinSketch.from_dict(data['sketch'])
+        hitters.summary = SpaceSaving.from_dict(data['summary'])
+        return hitters
+
+
+class MailboxHeavyHitters:
+    """Top người gửi, tên miền người gửi và máy chủ liên kết của hộp thư"""
+    STREAMS = ('senders', 'domains', 'hosts')
+    TITLES = {
+        'senders': "Người gửi nhiều nhất (ước lượng):",
+        'domains': "Tên miền gửi nhiều nhất (ước lượng):",
+        'hosts': "Máy chủ được liên kết nhiều nhất (ước lượng):",
+    }
+
+    def __init__(self, **params):
+        self.streams = {name: HeavyHitters(**params) for name in self.STREAMS}
+
+    def add(self, address, hosts=None):
+        """Thêm một email: địa chỉ người gửi và {máy chủ: số liên kết}"""
+        self.streams['senders'].add(address)
+        self.streams['domains'].add(address.rpartition('@')[2])
+        for host, count in (hosts or {}).items():
+            self.streams['hosts'].add(host, count)
+
+    def merge(self, other):
+        for name in self.STREAMS:
+            self.streams[name].merge(other.streams[name])
+        return self
+
+    def to_dict(self):
+        return {name: hitters.to_dict()
+                for name, hitters in self.streams.items()}
+
+    @classmethod
+    def from_dict(cls, data):
+        mailbox = cls.__new__(cls)
+        mailbox.streams = {name: HeavyHitters.from_dict(data[name])
+                           for name in cls.STREAMS}
+        return mailbox
+
+    def format(self, k=TOP_K):
+        lines = []
+        for name in self.STREAMS:
+            top = self.streams[name].top(k)
+            if not top:
+                continue
+            lines.append(self.TITLES[name])
+            lines.extend(f"  {key}: ~{count}" for key, count in top)
+        # Dòng trống ngăn cách với phần thống kê phía trên
+        return '\n' + '\n'.join(lines) + '\n' if lines else ""
@@ -0,0 +1,107 @@
+"""Nhật ký (journal) cho các lượt phân tích dài để có thể chạy tiếp.
+
+Journal là file JSON lines ghi kèm báo cáo:
+
+- dòng đầu tiên: danh sách id email của lượt chạy
+- mỗi email xử lý xong: id, số thứ tự và kích thước báo cáo sau khi ghi
+- dòng cuối: đánh dấu lượt chạy đã hoàn tất
+
+Khi chạy tiếp, báo cáo được cắt về vị trí đã ghi nhận cuối cùng nên phần
+ghi dở của email đang xử lý lúc bị dừng không bị lặp lại.
+"""
+import json
+import os
+import time
+
+JOURNAL_SUFFIX = '.journal'
+
+
+class JobState:
+    __slots__ = ('ids', 'done', 'metrics', 'offset', 'finished', 'params')
+
+    def __init__(self, ids, params):
+        self.ids = ids
+        self.params = params
+        self.done = {}
+        # Chỉ số thống kê của email đã xử lý, để tính lại phần tổng quan
+        self.metrics = {}
+        self.offset = 0
+        self.finished = False
+
+    def pending(self):
+        """Các (số thứ tự, id) chưa xử lý, theo đúng thứ tự ban đầu"""
+        return [(index, msg_id) for index, msg_id in enumerate(self.ids, 1)
+                if msg_id not in self.done]
+
+
+class JobJournal:
+    def __init__(self, report_path):
+        self.path = report_path + JOURNAL_SUFFIX
+        self._file = None
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def start(self, ids, **params):
+        """Bắt đầu lượt chạy mới, ghi đè journal cũ"""
+        self.close()
+        self._file = open(self.path, 'w', encoding='utf-8')
+        self._append({'type': 'job', 'ids': ids, 'params': params,
+                      'created': time.time()})
+        return JobState(ids, params)
+
+    def load(self):
+        """Đọc lại trạng thái, bỏ qua dòng cuối ghi dở nếu có"""
+        state = None
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if record['type'] == 'job':
+                    state = JobState(record['ids'], record.get('params', {}))
+                elif state is None:
+                    break
+                elif record['type'] == 'header':
+                    state.offset = record['offset']
+                elif record['type'] == 'done':
+                    state.done[record['id']] = record['status']
+                    if 'metrics' in record:
+                        state.metrics[record['id']] = record['metrics']
+                    state.offset = record['offset']
+                elif record['type'] == 'finished':
+                    state.finished = True
+        if state is None:
+            raise ValueError(f"Journal không hợp lệ: {self.path}")
+        return state
+
+    def reopen(self):
+        """Mở journal để ghi tiếp sau khi load()"""
+        self.close()
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def commit_header(self, offset):
+        self._append({'type': 'header', 'offset': offset})
+
+    def mark_done(self, msg_id, index, status, offset, metrics=None):
+        """Ghi nhận email đã được ghi vào báo cáo đến vị trí offset"""
+        record = {'type': 'done', 'id': msg_id, 'index': index,
+                  'status': status, 'offset': offset}
+        if metrics is not None:
+            record['metrics'] = metrics
+        self._append(record)
+
+    def finish(self):
+        self._append({'type': 'finished', 'time': time.time()})
+        self.close()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _append(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
@@ -0,0 +1,124 @@
+"""Trích từ khoá theo TF-IDF với bảng tần suất tài liệu cập nhật dần.
+
+Văn bản được chuẩn hoá NFC và thống nhất cách bỏ dấu thanh kiểu cũ/mới
+(hòa/hoà, thúy/thuý) trước khi tách từ, nên cùng một từ gõ bằng bộ gõ khác
+nhau vẫn được đếm chung. Dấu tiếng Việt được giữ lại vì mang nghĩa (bán/bạn).
+Ngoài từ đơn còn lấy cặp hai âm tiết liền nhau (tài khoản, bảo mật) vì phần
+lớn từ tiếng Việt là từ ghép.
+"""
+import math
+import re
+import unicodedata
+
+DEFAULT_KEYWORDS = 8
+MIN_TERM_LENGTH = 2
+# Cặp từ được ưu tiên hơn từ đơn có cùng điểm
+PAIR_BOOST = 1.5
+
+TOKEN_PATTERN = re.compile(r'[^\W\d_]+')
+# Tham số trong URL sinh ra nhiều "từ" vô nghĩa nên bỏ URL trước khi tách từ
+URL_PATTERN = re.compile(r'https?://\S+|www\.\S+')
+
+VIETNAMESE_STOPWORDS = frozenset("""
+ai anh bị bởi các cái cần chỉ cho chúng chưa có còn của cũng đã đang đây
+để đến đều điều do đó được gì hay hoặc hơn khi không là lại lên lúc mà
+mình mỗi một mọi nào này nên nếu nhiều như nhưng những nơi ở qua ra rằng
+rất rồi sau sẽ so sự tại thì theo thế trên trong trước từ và vào vẫn về vì
+với bạn tôi chị em họ ta đi làm năm ngày tháng giờ nay hôm xin cảm ơn
+kính gửi quý vị thêm
+""".split())
+
+ENGLISH_STOPWORDS = frozenset("""
+a about all also an and any are as at be been but by can could do does for
+from had has have he her here his how i if in into is it its just me more
+my no not now of on one or our out so some than that the their them then
+there these they this those to up us was we were what when which who will
+with would you your view email http https www com url unsubscribe click
+here please hi dear px pt em nbsp
+""".split())
+
+STOPWORDS = frozenset(
+    unicodedata.normalize('NFC', word)
+    for word in VIETNAMESE_STOPWORDS | ENGLISH_STOPWORDS)
+
+# Dấu thanh: huyền, sắc, hỏi, ngã, nặng
+TONE_MARKS = '\u0300\u0301\u0309\u0303\u0323'
+
+
+def _tone_placement_table():
+    """Ánh xạ cách bỏ dấu kiểu cũ sang kiểu mới cho vần mở oa, oe, uy"""
+    table = {}
+    for first, second in ('oa', 'oe', 'uy'):
+        for mark in TONE_MARKS:
+            old = unicodedata.normalize('NFC', first + mark + second)
+            new = unicodedata.normalize('NFC', first + second + mark)
+            table[old] = new
+    return table
+
+
+TONE_PLACEMENT = _tone_placement_table()
+TONE_PLACEMENT_PATTERN = re.compile(
+    '(' + '|'.join(TONE_PLACEMENT) + r')\b')
+
+
+def normalize_text(text):
+    text = unicodedata.normalize('NFC', text).casefold()
+    return TONE_PLACEMENT_PATTERN.sub(
+        lambda match: TONE_PLACEMENT[match.group(1)], text)
+
+
+def extract_terms(text):
+    """Đếm số lần xuất hiện của từ đơn và cặp từ (bỏ stopword)
+
+    Cặp từ chỉ ghép hai từ liền nhau trên cùng một dòng.
+    """
+    counts = {}
+    text = URL_PATTERN.sub(' ', normalize_text(text))
+    for line in text.splitlines():
+        previous = None
+        for token in TOKEN_PATTERN.findall(line):
+            if len(token) < MIN_TERM_LENGTH or token in STOPWORDS:
+                previous = None
+                continue
+            counts[token] = counts.get(token, 0) + 1
+            if previous is not None:
+                pair = f"{previous} {token}"
+                counts[pair] = counts.get(pair, 0) + 1
+            previous = token
+    return counts
+
+
+def idf(df, n_docs):
+    """IDF làm trơn, luôn dương kể cả khi từ có trong mọi email"""
+    return math.log((1 + n_docs) / (1 + df)) + 1
+
+
+def rank_keywords(counts, df, n_docs, limit=DEFAULT_KEYWORDS):
+    """limit từ khoá có điểm TF-IDF cao nhất, dạng [(từ, điểm)]
+
+    df là dict tần suất tài liệu của các từ trong counts. Từ đơn nằm trong
+    một cặp từ đã chọn thì không lặp lại.
+    """
+    scored = []
+    for term, count in counts.items():
+        score = (1 + math.log(count)) * idf(df.get(term, 0), n_docs)
+        if ' ' in term:
+            score *= PAIR_BOOST
+        scored.append((term, score))
+    scored.sort(key=lambda item: (-item[1], item[0]))
+
+    chosen = {}
+    covered = set()
+    for term, score in scored:
+        if term in covered or term in chosen:
+            continue
+        words = term.split()
+        if len(words) > 1:
+            # Bỏ các từ đơn đã chọn trước đó nay nằm trong cặp từ này
+            for word in words:
+                chosen.pop(word, None)
+            covered.update(words)
+        chosen[term] = score
+        if len(chosen) == limit:
+            break
+    return list(chosen.items())
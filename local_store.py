@@ -0,0 +1,303 @@
+"""Kho lưu trữ email cục bộ (SQLite) kèm chỉ mục toàn văn FTS5.
+
+Chỉ mục bỏ dấu (remove_diacritics) nhưng tokenizer unicode61 không coi "đ"
+là "d" có dấu, nên "đ/Đ" được đổi thành "d/D" trong văn bản đưa vào chỉ mục
+và trong câu truy vấn: "hoa don" tìm được "hoá đơn". Văn bản gốc trong bảng
+messages giữ nguyên để hiển thị snippet.
+
+Kho cũng giữ bảng tần suất tài liệu (document frequency) của các từ, được
+cập nhật dần mỗi khi một email được thêm hoặc đổi nội dung, cùng với từ khoá
+đã trích của từng email và từng người gửi.
+"""
+import json
+import re
+import sqlite3
+import threading
+
+from keywords import DEFAULT_KEYWORDS, extract_terms, rank_keywords
+from result_model import normalize_sender
+
+DEFAULT_DB_PATH = 'email_store.db'
+# Thời gian chờ (giây) khi kho đang bị tiến trình khác khoá
+BUSY_TIMEOUT = 30
+
+# Ký tự đánh dấu đoạn khớp trong snippet, GUI dùng để tô sáng
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+# Trọng số bm25 cho các cột subject, sender, body
+RANK_WEIGHTS = (5.0, 3.0, 1.0)
+SNIPPET_TOKENS = 16
+# Số từ tối đa trong một câu truy vấn IN (...)
+SQL_BATCH = 500
+# Điểm từ khoá của người gửi nhỏ hơn ngưỡng này (sau khi trừ) thì bị xoá
+WEIGHT_EPSILON = 1e-9
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    msg_id TEXT PRIMARY KEY,
+    subject TEXT NOT NULL DEFAULT '',
+    sender TEXT NOT NULL DEFAULT '',
+    date TEXT NOT NULL DEFAULT '',
+    body TEXT NOT NULL DEFAULT ''
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    subject, sender, body,
+    content='messages', content_rowid='rowid',
+    tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TABLE IF NOT EXISTS store_meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS term_df (
+    term TEXT PRIMARY KEY,
+    df INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS message_keywords (
+    msg_id TEXT PRIMARY KEY,
+    keywords TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sender_keywords (
+    address TEXT NOT NULL,
+    term TEXT NOT NULL,
+    weight REAL NOT NULL,
+    PRIMARY KEY (address, term)
+) WITHOUT ROWID;
+"""
+
+
+def _fold_sql(column):
+    return f"replace(replace({column}, 'đ', 'd'), 'Đ', 'D')"
+
+
+def _fts_values(prefix):
+    return ', '.join(_fold_sql(f'{prefix}{column}')
+                     for column in ('subject', 'sender', 'body'))
+
+
+# Trigger giữ chỉ mục đồng bộ với bảng messages. Lệnh 'delete' phải truyền
+# đúng giá trị đã đưa vào chỉ mục nên cũng dùng văn bản đã đổi "đ"
+FTS_TRIGGERS = f"""
+CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts(rowid, subject, sender, body)
+    VALUES (new.rowid, {_fts_values('new.')});
+END;
+CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts(messages_fts, rowid, subject, sender, body)
+    VALUES ('delete', old.rowid, {_fts_values('old.')});
+END;
+CREATE TRIGGER IF NOT EXISTS messages_au AFTER UPDATE ON messages BEGIN
+    INSERT INTO messages_fts(messages_fts, rowid, subject, sender, body)
+    VALUES ('delete', old.rowid, {_fts_values('old.')});
+    INSERT INTO messages_fts(rowid, subject, sender, body)
+    VALUES (new.rowid, {_fts_values('new.')});
+END;
+"""
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def fold_text(text):
+    """Đổi "đ/Đ" thành "d/D" như văn bản trong chỉ mục FTS"""
+    return text.replace('đ', 'd').replace('Đ', 'D')
+
+
+def build_match_query(text):
+    """Chuyển chuỗi người dùng nhập thành biểu thức MATCH an toàn
+
+    Mỗi từ được đặt trong dấu nháy và tìm theo tiền tố, các từ nối bằng AND.
+    """
+    tokens = TOKEN_PATTERN.findall(fold_text(text))
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+class SearchHit:
+    __slots__ = ('msg_id', 'subject', 'sender', 'date', 'snippet', 'rank')
+
+    def __init__(self, msg_id, subject, sender, date, snippet, rank):
+        self.msg_id = msg_id
+        self.subject = subject
+        self.sender = sender
+        self.date = date
+        self.snippet = snippet
+        self.rank = rank
+
+
+class LocalStore:
+    """Lưu email đã xử lý và tìm kiếm toàn văn không cần gọi Gmail API"""
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        # Nhiều tiến trình (nhiều tài khoản) có thể cùng ghi vào một kho
+        self._conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT,
+                                     check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript(SCHEMA + FTS_TRIGGERS)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def index_email(self, msg_id, subject, sender, date, body):
+        """Thêm hoặc cập nhật một email, chỉ ghi lại khi nội dung thay đổi
+
+        Khi subject hoặc body thay đổi, bảng tần suất và từ khoá của email
+        được cập nhật trong cùng transaction.
+        """
+        with self._lock, self._conn:
+            old = self._conn.execute(
+                'SELECT subject, body, sender FROM messages WHERE msg_id = ?',
+                (msg_id,)).fetchone()
+            self._conn.execute("""
+                INSERT INTO messages (msg_id, subject, sender, date, body)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(msg_id) DO UPDATE SET
+                    subject = excluded.subject,
+                    sender = excluded.sender,
+                    date = excluded.date,
+                    body = excluded.body
+                WHERE messages.subject IS NOT excluded.subject
+                   OR messages.sender IS NOT excluded.sender
+                   OR messages.date IS NOT excluded.date
+                   OR messages.body IS NOT excluded.body
+            """, (msg_id, subject, sender, date, body))
+            if old is None or old[:2] != (subject, body):
+                self._update_keywords(
+                    msg_id, sender, f"{subject}\n{body}",
+                    None if old is None else f"{old[0]}\n{old[1]}",
+                    None if old is None else old[2])
+
+    def _update_keywords(self, msg_id, sender, text, old_text,
+                         old_sender=None):
+        """Cập nhật tần suất tài liệu theo phần chênh lệch rồi trích từ khoá"""
+        conn = self._conn
+        counts = extract_terms(text)
+        terms = set(counts)
+        if old_text is None:
+            old_terms = set()
+            conn.execute("""
+                INSERT INTO store_meta (key, value) VALUES ('documents', 1)
+                ON CONFLICT(key) DO UPDATE SET value = value + 1
+            """)
+        else:
+            old_terms = set(extract_terms(old_text))
+        conn.executemany("""
+            INSERT INTO term_df (term, df) VALUES (?, 1)
+            ON CONFLICT(term) DO UPDATE SET df = df + 1
+        """, [(term,) for term in terms - old_terms])
+        conn.executemany(
+            'UPDATE term_df SET df = df - 1 WHERE term = ?',
+            [(term,) for term in old_terms - terms])
+
+        n_docs, df = self._document_frequencies(terms)
+        keywords = rank_keywords(counts, df, n_docs)
+        if old_text is not None:
+            # Trừ điểm từ khoá cũ của email khỏi người gửi trước khi cộng
+            # điểm mới, để sửa nội dung không làm điểm bị cộng dồn
+            self._remove_sender_keywords(msg_id, old_sender or sender)
+        conn.execute("""
+            INSERT OR REPLACE INTO message_keywords (msg_id, keywords)
+            VALUES (?, ?)
+        """, (msg_id, json.dumps([[term, score] for term, score in keywords],
+                                 ensure_ascii=False)))
+        address = normalize_sender(sender)[0]
+        conn.executemany("""
+            INSERT INTO sender_keywords (address, term, weight)
+            VALUES (?, ?, ?)
+            ON CONFLICT(address, term) DO UPDATE SET
+                weight = weight + excluded.weight
+        """, [(address, term, score) for term, score in keywords])
+
+    def document_frequencies(self, terms):
+        """(số email trong kho, {từ: số email chứa từ}) cho các từ đã cho
+
+        Từ không có trong bảng tần suất thì không có trong dict.
+        """
+        with self._lock:
+            return self._document_frequencies(terms)
+
+    def _document_frequencies(self, terms):
+        row = self._conn.execute(
+            "SELECT value FROM store_meta WHERE key = 'documents'").fetchone()
+        df = {}
+        ordered = list(terms)
+        for start in range(0, len(ordered), SQL_BATCH):
+            chunk = ordered[start:start + SQL_BATCH]
+            placeholders = ', '.join('?' * len(chunk))
+            df.update(self._conn.execute(
+                f'SELECT term, df FROM term_df WHERE term IN ({placeholders})',
+                chunk).fetchall())
+        return (row[0] if row else 0), df
+
+    def _remove_sender_keywords(self, msg_id, sender):
+        row = self._conn.execute(
+            'SELECT keywords FROM message_keywords WHERE msg_id = ?',
+            (msg_id,)).fetchone()
+        if row is None:
+            return
+        address = normalize_sender(sender)[0]
+        scored = [(score, address, term)
+                  for term, score in json.loads(row[0])]
+        self._conn.executemany("""
+            UPDATE sender_keywords SET weight = weight - ?
+            WHERE address = ? AND term = ?
+        """, scored)
+        self._conn.execute(
+            'DELETE FROM sender_keywords WHERE address = ? AND weight <= ?',
+            (address, WEIGHT_EPSILON))
+
+    def get_keywords(self, msg_id):
+        """Từ khoá đã trích của email, None nếu email chưa có trong kho"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT keywords FROM message_keywords WHERE msg_id = ?',
+                (msg_id,)).fetchone()
+        if row is None:
+            return None
+        return [term for term, _ in json.loads(row[0])]
+
+    def sender_keywords(self, sender, limit=DEFAULT_KEYWORDS):
+        """Từ khoá nổi bật nhất trong các email của một người gửi"""
+        address = normalize_sender(sender)[0]
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT term FROM sender_keywords
+                WHERE address = ?
+                ORDER BY weight DESC
+                LIMIT ?
+            """, (address, limit)).fetchall()
+        return [row[0] for row in rows]
+
+    def get_email(self, msg_id):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT subject, sender, date, body FROM messages '
+                'WHERE msg_id = ?', (msg_id,)).fetchone()
+        if row is None:
+            return None
+        from email_record import EmailRecord
+        return EmailRecord.from_headers(
+            msg_id, row[0], row[1], row[2], body=row[3])
+
+    def search(self, text, limit=50):
+        """Tìm email theo subject, sender và body, xếp hạng theo bm25"""
+        query = build_match_query(text)
+        if not query:
+            return []
+        weights = ', '.join(str(weight) for weight in RANK_WEIGHTS)
+        with self._lock:
+            rows = self._conn.execute(f"""
+                SELECT m.msg_id, m.subject, m.sender, m.date,
+                       snippet(messages_fts, -1, ?, ?, '…', ?),
+                       bm25(messages_fts, {weights}) AS rank
+                FROM messages_fts
+                JOIN messages m ON m.rowid = messages_fts.rowid
+                WHERE messages_fts MATCH ?
+                ORDER BY rank
+                LIMIT ?
+            """, (HIGHLIGHT_START, HIGHLIGHT_END, SNIPPET_TOKENS,
+                  query, limit)).fetchall()
+        return [SearchHit(*row) for row in rows]
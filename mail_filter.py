@@ -0,0 +1,112 @@
+"""Bộ lọc email được dịch sang cú pháp tìm kiếm của Gmail.
+
+Bộ lọc được gửi kèm messages().list / threads().list (tham số q và
+labelIds) nên server chỉ trả về email cần phân tích, email không khớp không
+bao giờ được tải về.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+DATE_FORMAT = '%Y-%m-%d'
+# Gmail dùng dấu / trong after: và before:
+QUERY_DATE_FORMAT = '%Y/%m/%d'
+DEFAULT_LABELS = ('INBOX',)
+# Nhãn hệ thống truyền được trực tiếp qua labelIds; nhãn người dùng đặt
+# được lọc bằng label: trong q để khỏi phải tra id qua labels.list
+SYSTEM_LABELS = frozenset((
+    'INBOX', 'SENT', 'DRAFT', 'SPAM', 'TRASH', 'UNREAD', 'STARRED',
+    'IMPORTANT', 'CATEGORY_PERSONAL', 'CATEGORY_SOCIAL',
+    'CATEGORY_PROMOTIONS', 'CATEGORY_UPDATES', 'CATEGORY_FORUMS'))
+# Giá trị đặc biệt: không giới hạn theo nhãn (toàn bộ hộp thư)
+ALL_MAIL = 'ALL'
+
+
+def parse_date(value):
+    """Chuỗi YYYY-MM-DD thành date, chuỗi rỗng thành None"""
+    value = (value or '').strip()
+    if not value:
+        return None
+    return datetime.strptime(value, DATE_FORMAT).date()
+
+
+def _quote(value):
+    """Đặt giá trị có khoảng trắng hoặc ký tự đặc biệt trong ngoặc kép"""
+    if any(char.isspace() or char in '(){}"' for char in value):
+        return '"' + value.replace('"', '') + '"'
+    return value
+
+
+@dataclass(slots=True)
+class MailFilter:
+    sender: str = ''
+    # Khoảng ngày (date), tính cả hai đầu
+    start: object = None
+    end: object = None
+    has_attachment: bool = False
+    labels: tuple = DEFAULT_LABELS
+    # Truy vấn tự do theo cú pháp Gmail, nối thêm vào cuối
+    query: str = ''
+
+    @classmethod
+    def from_strings(cls, sender='', start='', end='', has_attachment=False,
+                     labels=None, query=''):
+        """Tạo bộ lọc từ giá trị nhập tay (CLI, GUI), ngày dạng YYYY-MM-DD
+
+        Ngày không hợp lệ gây ValueError.
+        """
+        if labels is None:
+            labels = DEFAULT_LABELS
+        return cls(
+            sender=(sender or '').strip(),
+            start=parse_date(start),
+            end=parse_date(end),
+            has_attachment=bool(has_attachment),
+            labels=tuple(label.strip() for label in labels if label.strip()),
+            query=(query or '').strip())
+
+    def label_ids(self):
+        return [label.upper() for label in self.labels
+                if label.upper() in SYSTEM_LABELS]
+
+    def to_query(self):
+        """Chuỗi tìm kiếm Gmail (tham số q), rỗng nếu không lọc gì"""
+        terms = []
+        if self.sender:
+            terms.append(f"from:{_quote(self.sender)}")
+        if self.start is not None:
+            terms.append(f"after:{self.start.strftime(QUERY_DATE_FORMAT)}")
+        if self.end is not None:
+            # before: không tính ngày đó nên lùi sang ngày hôm sau
+            end = self.end + timedelta(days=1)
+            terms.append(f"before:{end.strftime(QUERY_DATE_FORMAT)}")
+        if self.has_attachment:
+            terms.append('has:attachment')
+        for label in self.labels:
+            if label.upper() in SYSTEM_LABELS or label.upper() == ALL_MAIL:
+                continue
+            # Gmail thay khoảng trắng trong tên nhãn bằng dấu gạch ngang
+            terms.append(f"label:{label.replace(' ', '-')}")
+        if self.query:
+            terms.append(self.query)
+        return ' '.join(terms)
+
+    def list_params(self):
+        """Tham số cho messages().list / threads().list"""
+        params = {}
+        label_ids = self.label_ids()
+        if label_ids:
+            params['labelIds'] = label_ids
+        query = self.to_query()
+        if query:
+            params['q'] = query
+        return params
+
+    def describe(self):
+        """Mô tả ngắn cho tiêu đề báo cáo"""
+        parts = []
+        if self.labels != DEFAULT_LABELS:
+            parts.append(f"nhãn {', '.join(self.labels) or ALL_MAIL}")
+        query = self.to_query()
+        if query:
+            parts.append(f"truy vấn '{query}'")
+        return '; '.join(parts)
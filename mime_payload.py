@@ -0,0 +1,205 @@
+"""Chuyển email RFC 822 (bytes) sang cấu trúc message của Gmail API.
+
+Kết quả có cùng dạng với messages().get(format='full'): cây payload với
+partId, mimeType, filename, headers và body.data (base64url), nên đi
+thẳng vào decode_email_part (app.py) / decode_part (app_v4.py) như email
+tải từ Gmail. Dùng cho email nạp từ file và cho message tải bằng
+format='raw'.
+
+Giống Gmail, body.data giữ nguyên bytes theo charset gốc của từng phần;
+phía đọc giải mã bằng decode_text với charset lấy từ header Content-Type
+của phần đó (part_charset). Phần đính kèm chỉ giữ kích thước, không kèm
+dữ liệu.
+"""
+import base64
+import codecs
+import hashlib
+import re
+from email import message_from_bytes
+from email.header import decode_header, make_header
+from email.utils import parsedate_to_datetime
+
+# Charset khai báo sai hoặc là tập con của bảng mã rộng hơn
+CHARSET_ALIASES = {
+    'us-ascii': 'cp1252',
+    'iso-8859-1': 'cp1252',
+    'latin1': 'cp1252',
+    'gb2312': 'gb18030',
+    'gbk': 'gb18030',
+    'ks_c_5601-1987': 'cp949',
+    'windows-874': 'cp874',
+    'x-sjis': 'shift_jis',
+    'unicode-1-1-utf-7': 'utf-7',
+    'utf8': 'utf-8',
+}
+# Thử lần lượt khi phần nội dung không khai báo charset
+FALLBACK_CHARSETS = ('utf-8', 'cp1252')
+CHARSET_PATTERN = re.compile(r'charset\s*=\s*"?([^";\s]+)', re.IGNORECASE)
+
+# Nhãn trong X-GM-LABELS của Google Takeout và id nhãn hệ thống tương ứng
+TAKEOUT_LABELS = {
+    'inbox': 'INBOX',
+    'sent': 'SENT',
+    'starred': 'STARRED',
+    'important': 'IMPORTANT',
+    'unread': 'UNREAD',
+    'spam': 'SPAM',
+    'trash': 'TRASH',
+    'drafts': 'DRAFT',
+    'draft': 'DRAFT',
+    'category personal': 'CATEGORY_PERSONAL',
+    'category social': 'CATEGORY_SOCIAL',
+    'category promotions': 'CATEGORY_PROMOTIONS',
+    'category updates': 'CATEGORY_UPDATES',
+    'category forums': 'CATEGORY_FORUMS',
+}
+# Nhãn Takeout không có ý nghĩa với Gmail API
+IGNORED_LABELS = frozenset(('opened', 'archived'))
+
+
+def message_id_for(raw, header_id=None):
+    """Id 16 ký tự hex (giống id Gmail) suy ra từ Message-ID hoặc nội dung"""
+    source = header_id.strip().encode('utf-8') if header_id else raw
+    return hashlib.blake2b(source, digest_size=8).hexdigest()
+
+
+def resolve_charset(charset):
+    """Tên codec Python cho charset khai báo, None nếu không nhận ra"""
+    if not charset:
+        return None
+    charset = charset.strip().strip('"').lower()
+    try:
+        return codecs.lookup(CHARSET_ALIASES.get(charset, charset)).name
+    except LookupError:
+        return None
+
+
+def decode_text(data, charset=None):
+    """Giải mã bytes theo charset khai báo, thử charset dự phòng nếu không có
+
+    Charset khai báo hợp lệ thì tin theo nó (byte lỗi được thay bằng U+FFFD).
+    """
+    codec = resolve_charset(charset)
+    if codec is not None:
+        return data.decode(codec, errors='replace')
+    for candidate in FALLBACK_CHARSETS:
+        try:
+            return data.decode(candidate)
+        except UnicodeDecodeError:
+            continue
+    return data.decode('utf-8', errors='replace')
+
+
+def part_charset(part):
+    """Charset trong header Content-Type của một phần payload Gmail"""
+    for header in part.get('headers', ()):
+        if header['name'].lower() == 'content-type':
+            match = CHARSET_PATTERN.search(header['value'])
+            return match.group(1) if match else None
+    return None
+
+
+def decode_header_value(value):
+    """Giải mã encoded-word (=?utf-8?B?...?=) trong giá trị header"""
+    value = str(value)
+    if '=?' not in value:
+        return value
+    try:
+        return str(make_header(decode_header(value)))
+    except (LookupError, UnicodeDecodeError, ValueError):
+        return value
+
+
+def _encode_body(data):
+    return {'size': len(data),
+            'data': base64.urlsafe_b64encode(data).decode('ascii')}
+
+
+def part_payload(part, part_id=''):
+    """Một phần MIME (email.message.Message) thành dict payload của Gmail"""
+    filename = part.get_filename() or ''
+    payload = {
+        'partId': part_id,
+        'mimeType': part.get_content_type(),
+        'filename': decode_header_value(filename) if filename else '',
+        'headers': [{'name': name, 'value': decode_header_value(value)}
+                    for name, value in part.items()],
+    }
+    if part.is_multipart():
+        payload['body'] = {'size': 0}
+        payload['parts'] = [
+            part_payload(child, f"{part_id}.{i}" if part_id else str(i))
+            for i, child in enumerate(part.get_payload())]
+        return payload
+
+    data = part.get_payload(decode=True) or b''
+    if filename:
+        payload['body'] = {'size': len(data), 'attachmentId': ''}
+    else:
+        payload['body'] = _encode_body(data)
+    return payload
+
+
+def takeout_labels(value):
+    """Danh sách nhãn từ header X-GM-LABELS của Google Takeout"""
+    labels = []
+    for name in decode_header_value(value).split(','):
+        name = name.strip().strip('"')
+        if not name or name.lower() in IGNORED_LABELS:
+            continue
+        labels.append(TAKEOUT_LABELS.get(name.lower(), name))
+    return labels
+
+
+def internal_date(message):
+    """Thời điểm theo header Date, dạng mili giây như internalDate của Gmail"""
+    try:
+        parsed = parsedate_to_datetime(message.get('Date', ''))
+    except (TypeError, ValueError, IndexError):
+        return None
+    if parsed is None:
+        return None
+    return str(int(parsed.timestamp() * 1000))
+
+
+def gmail_message(raw, msg_id=None, thread_id=None, label_ids=None):
+    """Email RFC 822 (bytes) thành dict giống messages().get(format='full')
+
+    Không có id/threadId/nhãn thì lấy từ header (Message-ID, X-GM-THRID và
+    X-GM-LABELS của Google Takeout).
+    """
+    message = message_from_bytes(raw)
+    if msg_id is None:
+        msg_id = message_id_for(raw, message.get('Message-ID'))
+    if thread_id is None:
+        thread_id = message.get('X-GM-THRID', '').strip()
+        if thread_id.isdigit():
+            # Takeout ghi id hội thoại dạng thập phân, Gmail API dạng hex
+            thread_id = format(int(thread_id), 'x')
+        thread_id = thread_id or msg_id
+    if label_ids is None:
+        label_ids = takeout_labels(message.get('X-GM-LABELS', ''))
+
+    result = {
+        'id': msg_id,
+        'threadId': thread_id,
+        'labelIds': list(label_ids),
+        'payload': part_payload(message),
+        'sizeEstimate': len(raw),
+    }
+    date = internal_date(message)
+    if date is not None:
+        result['internalDate'] = date
+    return result
+
+
+def from_raw_response(response):
+    """Kết quả messages().get(format='raw') thành dạng format='full'"""
+    message = gmail_message(
+        base64.urlsafe_b64decode(response['raw']), response['id'],
+        response.get('threadId', response['id']),
+        response.get('labelIds', ()))
+    for key in ('snippet', 'historyId', 'internalDate', 'sizeEstimate'):
+        if key in response:
+            message[key] = response[key]
+    return message
@@ -0,0 +1,146 @@
+"""Phân tích nhiều tài khoản Gmail song song, mỗi tài khoản một tiến trình.
+
+Mỗi file token trong thư mục tài khoản ứng với một hộp thư. Tiến trình của
+tài khoản nào tự làm mới token của tài khoản đó và ghi báo cáo riêng, sau
+đó các báo cáo được gộp thành một báo cáo chung.
+"""
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import gmail_client
+from body_stream import DEFAULT_MAX_BODY_CHARS
+from heavy_hitters import MailboxHeavyHitters
+
+DEFAULT_WORKERS = 4
+# Tổng số request song song cho tất cả tài khoản
+DEFAULT_CONCURRENCY = 32
+REPORTS_DIR = 'reports'
+
+
+def discover_accounts(accounts_dir):
+    """Danh sách (tên tài khoản, đường dẫn token) trong thư mục"""
+    accounts = []
+    for token_path in sorted(glob.glob(os.path.join(accounts_dir, '*.json'))):
+        name = os.path.splitext(os.path.basename(token_path))[0]
+        # File client secret nằm cùng thư mục thì không phải token
+        if name == 'credentials':
+            continue
+        accounts.append((name, token_path))
+    return accounts
+
+
+def run_account(account, token_path, credentials_path, max_emails,
+                report_path, max_concurrency, resume,
+                max_body_chars=DEFAULT_MAX_BODY_CHARS, threads=False,
+                mail_filter=None,
+                fetch_format=gmail_client.DEFAULT_FETCH_FORMAT,
+                store_path=None):
+    """Chạy toàn bộ pipeline cho một tài khoản (trong tiến trình con)
+
+    store_path là kho cục bộ riêng của tài khoản, để từ khoá và tần suất
+    tài liệu không lẫn giữa các hộp thư; mặc định cạnh file báo cáo.
+    """
+    from app import GmailSummarizer
+
+    if store_path is None:
+        store_path = os.path.splitext(report_path)[0] + '.db'
+    try:
+        summarizer = GmailSummarizer(
+            token_path=token_path,
+            credentials_path=credentials_path,
+            interactive=False,
+            max_concurrency=max_concurrency,
+            max_body_chars=max_body_chars,
+            mail_filter=mail_filter,
+            fetch_format=fetch_format,
+            store_path=store_path)
+        result = summarizer.process_emails(
+            max_emails, report_path, resume=resume, threads=threads)
+        failed = len(summarizer.failed)
+        heavy_hitters = summarizer.heavy_hitters.to_dict()
+    except Exception as e:
+        result = f"Lỗi: {str(e)}"
+        failed = None
+        heavy_hitters = None
+    return {
+        'account': account,
+        'report': report_path,
+        'result': result,
+        'failed': failed,
+        'heavy_hitters': heavy_hitters
+    }
+
+
+def merge_reports(results, output_path):
+    """Gộp báo cáo của các tài khoản thành một file"""
+    results = sorted(results, key=lambda item: item['account'])
+    with open(output_path, 'w', encoding='utf-8') as out:
+        out.write(f"""BÁO CÁO PHÂN TÍCH EMAIL NHIỀU TÀI KHOẢN
+Thời gian tạo: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+Số tài khoản: {len(results)}
+{'#'*80}
+""")
+        for item in results:
+            out.write(f"\nTÀI KHOẢN: {item['account']}\n{'#'*80}\n")
+            if os.path.exists(item['report']):
+                with open(item['report'], encoding='utf-8') as report:
+                    for line in report:
+                        out.write(line)
+            else:
+                out.write(f"{item['result']}\n")
+
+        out.write("\nTỔNG HỢP CÁC TÀI KHOẢN:\n" + "="*30 + "\n")
+        for item in results:
+            line = f"{item['account']}: {item['result']}"
+            if item['failed']:
+                line += f" ({item['failed']} email không tải được)"
+            out.write(line + "\n")
+
+        # Các bản tóm tắt cùng tham số nên gộp trực tiếp được
+        heavy_hitters = MailboxHeavyHitters()
+        for item in results:
+            if item.get('heavy_hitters'):
+                heavy_hitters.merge(
+                    MailboxHeavyHitters.from_dict(item['heavy_hitters']))
+        out.write(heavy_hitters.format())
+
+
+def run_accounts(accounts_dir, max_emails, output_path,
+                 reports_dir=REPORTS_DIR, workers=DEFAULT_WORKERS,
+                 concurrency=DEFAULT_CONCURRENCY, resume=False,
+                 credentials_path=None, max_body_chars=DEFAULT_MAX_BODY_CHARS,
+                 threads=False, mail_filter=None,
+                 fetch_format=gmail_client.DEFAULT_FETCH_FORMAT):
+    accounts = discover_accounts(accounts_dir)
+    if not accounts:
+        return f"Không tìm thấy token nào trong {accounts_dir}"
+
+    if credentials_path is None:
+        credentials_path = os.path.join(accounts_dir, 'credentials.json')
+        if not os.path.exists(credentials_path):
+            credentials_path = gmail_client.CREDENTIALS_PATH
+    os.makedirs(reports_dir, exist_ok=True)
+
+    workers = max(1, min(workers, len(accounts)))
+    # Chia đều ngân sách request song song cho các tiến trình chạy cùng lúc
+    per_account = max(1, concurrency // workers)
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                run_account, account, token_path, credentials_path,
+                max_emails, os.path.join(reports_dir, f"{account}.txt"),
+                per_account, resume, max_body_chars, threads, mail_filter,
+                fetch_format)
+            for account, token_path in accounts
+        ]
+        for future in as_completed(futures):
+            item = future.result()
+            print(f"[{item['account']}] {item['result']}")
+            results.append(item)
+
+    merge_reports(results, output_path)
+    return f"Đã gộp báo cáo của {len(results)} tài khoản vào {output_path}"
@@ -0,0 +1,298 @@
+"""Giới hạn tốc độ gọi Gmail API theo quota và điều chỉnh số luồng song song.
+
+- TokenBucket: mỗi lần gọi trừ số quota unit tương ứng với method.
+- AIMDController: tăng dần số request song song khi ổn định, giảm một nửa
+  khi gặp 429/rateLimitExceeded hoặc độ trễ tăng cao.
+- RetryPolicy: exponential backoff với full jitter cho các lỗi tạm thời.
+
+Request được chia thành hai lane: 'interactive' (email người dùng vừa chọn)
+lấy token quota trước mọi request 'bulk' đang chờ và có số luồng song song
+riêng, nên không phải xếp hàng sau lượt phân tích hàng trăm email; lane
+'bulk' vẫn chạy hết tốc độ khi không có request interactive nào.
+
+Mỗi request HTTP có timeout riêng (gmail_client.REQUEST_TIMEOUT); QuotaLimiter
+giới hạn thêm tổng thời gian của một lần gọi kể cả các lần thử lại, và dừng
+sớm khi lần chạy bị huỷ (run_control.CancelToken).
+"""
+import json
+import random
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+
+# Quota unit cho mỗi method (theo tài liệu Gmail API)
+QUOTA_COSTS = {
+    'messages.list': 5,
+    'messages.get': 5,
+    'threads.list': 10,
+    'threads.get': 10,
+    'history.list': 2,
+    'labels.list': 1,
+    'getProfile': 1,
+}
+DEFAULT_QUOTA_COST = 5
+
+# Quota mỗi người dùng: 250 unit/giây
+DEFAULT_QUOTA_PER_SECOND = 250
+# Tổng thời gian tối đa cho một lần gọi, kể cả các lần thử lại (giây)
+DEFAULT_DEADLINE = 300.0
+
+# Lane của request: thao tác người dùng đang chờ và công việc nền
+LANE_INTERACTIVE = 'interactive'
+LANE_BULK = 'bulk'
+# Số request interactive song song, không tính vào giới hạn của AIMD
+INTERACTIVE_CONCURRENCY = 4
+
+# QuotaLimiter.map gửi trước tối đa chừng này lần số luồng tối đa
+MAP_WINDOW_FACTOR = 2
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = {
+    'rateLimitExceeded',
+    'userRateLimitExceeded',
+    'quotaExceeded',
+    'backendError',
+}
+
+
+class TokenBucket:
+    """Token bucket tính theo quota unit, request ưu tiên được lấy trước"""
+
+    def __init__(self, rate=DEFAULT_QUOTA_PER_SECOND, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._priority_waiting = 0
+        self._cond = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity,
+                           self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, cost, priority=False):
+        """Chờ đến khi đủ token rồi trừ đi cost
+
+        Request không ưu tiên phải nhường khi còn request ưu tiên đang chờ.
+        """
+        with self._cond:
+            if priority:
+                self._priority_waiting += 1
+            try:
+                while True:
+                    self._refill()
+                    blocked = not priority and self._priority_waiting
+                    if not blocked and self._tokens >= cost:
+                        self._tokens -= cost
+                        return
+                    # Bị chặn vì ưu tiên thì chờ được đánh thức khi request
+                    # ưu tiên lấy xong token
+                    wait = (None if blocked and self._tokens >= cost
+                            else (cost - self._tokens) / self.rate)
+                    self._cond.wait(wait)
+            finally:
+                if priority:
+                    self._priority_waiting -= 1
+                    self._cond.notify_all()
+
+    def drain(self):
+        """Bỏ hết token hiện có (khi server báo đã vượt quota)"""
+        with self._cond:
+            self._refill()
+            self._tokens = 0
+
+
+class AIMDController:
+    """Giới hạn số request song song theo kiểu AIMD"""
+
+    def __init__(self, initial=4, minimum=1, maximum=32,
+                 target_latency=2.0, cooldown=1.0):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def slot(self):
+        """Giữ một chỗ trong giới hạn song song trong suốt một request"""
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+                self._cond.notify_all()
+
+    def on_success(self, latency):
+        with self._cond:
+            if latency > self.target_latency:
+                self._decrease()
+            else:
+                # Cộng thêm khoảng 1 sau mỗi "cửa sổ" limit request thành công
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def on_throttled(self):
+        with self._cond:
+            self._decrease()
+
+    def _decrease(self):
+        now = time.monotonic()
+        # Chỉ giảm một lần cho mỗi đợt lỗi dồn dập
+        if now - self._last_decrease >= self.cooldown:
+            self.limit = max(self.minimum, self.limit / 2)
+            self._last_decrease = now
+
+
+class RetryPolicy:
+    def __init__(self, max_retries=6, base_delay=0.5, max_delay=32.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt, retry_after=None):
+        """Thời gian chờ trước lần thử lại thứ attempt (full jitter)"""
+        backoff = random.uniform(
+            0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after is not None:
+            return max(backoff, retry_after)
+        return backoff
+
+
+def classify_error(error):
+    """Trả về (có thử lại được, có phải do vượt quota, Retry-After)"""
+    resp = getattr(error, 'resp', None)
+    if resp is None:
+        retryable = isinstance(error, (socket.timeout, ConnectionError,
+                                       TimeoutError))
+        return retryable, False, None
+
+    status = int(getattr(resp, 'status', 0) or 0)
+    reasons = set()
+    try:
+        content = json.loads(error.content.decode('utf-8'))
+        for item in content.get('error', {}).get('errors', []):
+            reasons.add(item.get('reason'))
+    except (AttributeError, ValueError):
+        pass
+
+    retry_after = None
+    try:
+        retry_after = float(resp.get('retry-after'))
+    except (TypeError, ValueError):
+        pass
+
+    throttled = status == 429 or bool(reasons & RATE_LIMIT_REASONS)
+    retryable = status in RETRYABLE_STATUS or throttled
+    return retryable, throttled, retry_after
+
+
+class QuotaLimiter:
+    """Thực thi request Gmail API trong giới hạn quota, có thử lại"""
+
+    def __init__(self, quota_per_second=DEFAULT_QUOTA_PER_SECOND,
+                 controller=None, retry=None, deadline=DEFAULT_DEADLINE,
+                 interactive_concurrency=INTERACTIVE_CONCURRENCY):
+        self.bucket = TokenBucket(quota_per_second)
+        self.controller = controller or AIMDController()
+        self.retry = retry or RetryPolicy()
+        self.deadline = deadline
+        self.interactive_slots = threading.Semaphore(interactive_concurrency)
+
+    @contextmanager
+    def slot(self, lane):
+        """Chỗ song song theo lane: interactive có số chỗ riêng"""
+        if lane == LANE_INTERACTIVE:
+            with self.interactive_slots:
+                yield
+        else:
+            with self.controller.slot():
+                yield
+
+    def execute(self, method, build_request, cancel=None, lane=LANE_BULK):
+        """Gọi build_request().execute(), thử lại với lỗi tạm thời
+
+        Hết số lần thử hoặc quá deadline mà vẫn lỗi thì ném lại exception
+        cuối cùng để người gọi ghi nhận, không để email biến mất khỏi báo
+        cáo. cancel bị huỷ thì ném RunCancelled trước lần gọi tiếp theo.
+        """
+        cost = QUOTA_COSTS.get(method, DEFAULT_QUOTA_COST)
+        attempt = 0
+        expires = (time.monotonic() + self.deadline
+                   if self.deadline is not None else None)
+        while True:
+            if cancel is not None:
+                cancel.check()
+            self.bucket.acquire(cost, priority=lane == LANE_INTERACTIVE)
+            with self.slot(lane):
+                start = time.monotonic()
+                try:
+                    result = build_request().execute()
+                except Exception as e:
+                    retryable, throttled, retry_after = classify_error(e)
+                    if throttled:
+                        self.controller.on_throttled()
+                        self.bucket.drain()
+                    if not retryable or attempt >= self.retry.max_retries:
+                        raise
+                    error = e
+                else:
+                    self.controller.on_success(time.monotonic() - start)
+                    return result
+
+            delay = self.retry.delay(attempt, retry_after)
+            if expires is not None and time.monotonic() + delay > expires:
+                raise error
+            print(f"Thử lại {method} sau {delay:.1f}s: {str(error)}")
+            if cancel is not None:
+                # Chờ thử lại nhưng dậy ngay khi bị huỷ
+                cancel.wait(delay)
+            else:
+                time.sleep(delay)
+            attempt += 1
+
+    def map(self, func, items, cancel=None):
+        """Chạy func cho từng item song song, trả kết quả theo đúng thứ tự
+
+        Số request thực sự đồng thời do AIMDController quyết định. Chỉ tối
+        đa MAP_WINDOW_FACTOR * maximum việc được gửi trước, thêm dần khi
+        trả kết quả, nên items có thể là iterator dài mà không bị đọc hết
+        và giữ kết quả trong bộ nhớ. cancel bị huỷ thì các item chưa bắt
+        đầu ném RunCancelled thay vì chạy.
+        """
+        if cancel is not None:
+            run = func
+
+            def func(item):
+                cancel.check()
+                return run(item)
+
+        window = MAP_WINDOW_FACTOR * self.controller.maximum
+        executor = ThreadPoolExecutor(max_workers=self.controller.maximum)
+        items = iter(items)
+        pending = deque()
+        try:
+            for item in islice(items, window):
+                pending.append(executor.submit(func, item))
+            while pending:
+                result = pending.popleft().result()
+                # Gửi thêm một việc thay cho việc vừa xong
+                for item in islice(items, 1):
+                    pending.append(executor.submit(func, item))
+                yield result
+        finally:
+            # Dừng giữa chừng (Ctrl-C, huỷ) thì bỏ các việc chưa bắt đầu
+            executor.shutdown(wait=False, cancel_futures=True)
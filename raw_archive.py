@@ -0,0 +1,453 @@
+"""Kho lưu trữ message Gmail thô (JSON) dạng nén, chỉ ghi nối thêm.
+
+Gồm hai file:
+
+- <path>.bin: header (mã nén và từ điển dùng chung) rồi các bản ghi nối
+  tiếp nhau, mỗi bản ghi là id message và JSON đã nén riêng từng bản ghi.
+  Nén bằng zstd nếu cài thư viện zstandard, nếu không thì dùng zlib; cả hai
+  đều dùng từ điển dùng chung (các khoá và header hay gặp trong JSON của
+  Gmail) nên từng message nhỏ vẫn nén tốt.
+- <path>.idx: bảng băm địa chỉ mở với các ô kích thước cố định
+  (id, vị trí, độ dài), mở bằng mmap. Tra một id là O(1) và không phải đọc
+  kho hay chỉ mục vào bộ nhớ.
+
+Mất file chỉ mục thì dựng lại bằng cách quét kho; bản ghi hỏng (ghi dở khi
+tiến trình bị dừng) được bỏ qua, các bản ghi hợp lệ phía sau vẫn được giữ.
+
+GUI và CLI có thể mở cùng một kho: mọi thao tác giữ khoá file <path>.lock
+(fcntl trên Unix, msvcrt trên Windows) và đọc lại header chỉ mục để thấy
+bản ghi hoặc bảng băm mới do tiến trình khác ghi.
+"""
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+DEFAULT_ARCHIVE_PATH = 'raw_archive'
+ARCHIVE_SUFFIX = '.bin'
+INDEX_SUFFIX = '.idx'
+LOCK_SUFFIX = '.lock'
+# Thời gian chờ tối đa khoá giữa các tiến trình (giây) và khoảng nghỉ giữa
+# các lần thử
+LOCK_TIMEOUT = 60.0
+LOCK_RETRY_SECONDS = 0.05
+
+ARCHIVE_MAGIC = b'GMRAW001'
+INDEX_MAGIC = b'GMIDX001'
+CODEC_ZLIB = 0
+CODEC_ZSTD = 1
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+# Header kho: magic, mã nén, độ dài từ điển
+ARCHIVE_HEADER = struct.Struct('<8sBI')
+# Đầu mỗi bản ghi: độ dài id, độ dài dữ liệu nén
+RECORD_HEADER = struct.Struct('<HI')
+# Header chỉ mục: magic, số ô, số id đã có
+INDEX_HEADER = struct.Struct('<8sQQ')
+# Một ô chỉ mục: id (đệm byte 0), vị trí bản ghi, độ dài bản ghi
+SLOT = struct.Struct('<32sQI')
+MAX_ID_BYTES = 32
+# Id message hợp lệ: ký tự ASCII in được
+ID_PATTERN = re.compile(rb'[\x21-\x7e]+')
+INITIAL_CAPACITY = 1024
+# Bảng băm được mở rộng gấp đôi khi vượt tỉ lệ lấp đầy này
+MAX_LOAD = 0.5
+
+# Từ điển dùng chung: các chuỗi hay gặp trong message Gmail (format='full')
+SHARED_DICTIONARY = (
+    '{"id":"","threadId":"","labelIds":["UNREAD","IMPORTANT",'
+    '"CATEGORY_PERSONAL","CATEGORY_UPDATES","CATEGORY_PROMOTIONS","INBOX"],'
+    '"snippet":"","payload":{"partId":"","mimeType":"multipart/alternative",'
+    '"filename":"","headers":[{"name":"Delivered-To","value":""},'
+    '{"name":"Received","value":"by 2002:a05: with SMTP id ; "},'
+    '{"name":"X-Google-Smtp-Source","value":""},'
+    '{"name":"ARC-Seal","value":"i=1; a=rsa-sha256; t=; cv=none; d=google.com; '
+    's=arc-20160816; b="},'
+    '{"name":"ARC-Message-Signature","value":"i=1; a=rsa-sha256; '
+    'c=relaxed/relaxed; d=google.com; s=arc-20160816; h=to:subject:'
+    'message-id:date:from:mime-version:dkim-signature; bh=; b="},'
+    '{"name":"ARC-Authentication-Results","value":"i=1; mx.google.com; '
+    'dkim=pass header.i=@; spf=pass (google.com: domain of designates '
+    'as permitted sender) smtp.mailfrom=; dmarc=pass (p=NONE sp=NONE '
+    'dis=NONE) header.from="},'
+    '{"name":"Return-Path","value":"<>"},'
+    '{"name":"Received-SPF","value":"pass (google.com: domain of '
+    'designates as permitted sender) client-ip=;"},'
+    '{"name":"Authentication-Results","value":"mx.google.com; dkim=pass"},'
+    '{"name":"DKIM-Signature","value":"v=1; a=rsa-sha256; c=relaxed/relaxed;'
+    ' d=; s=; h=; bh=; b="},'
+    '{"name":"MIME-Version","value":"1.0"},'
+    '{"name":"Date","value":""},{"name":"Message-ID","value":"<@mail.gmail.com>"},'
+    '{"name":"Subject","value":""},{"name":"From","value":""},'
+    '{"name":"To","value":""},{"name":"Content-Type","value":'
+    '"multipart/alternative; boundary=\\""}],'
+    '"body":{"size":0},"parts":[{"partId":"0","mimeType":"text/plain",'
+    '"filename":"","headers":[{"name":"Content-Type","value":'
+    '"text/plain; charset=\\"UTF-8\\""},{"name":"Content-Transfer-Encoding",'
+    '"value":"quoted-printable"}],"body":{"size":,"data":""}},'
+    '{"partId":"1","mimeType":"text/html","filename":"","headers":'
+    '[{"name":"Content-Type","value":"text/html; charset=\\"UTF-8\\""},'
+    '{"name":"Content-Transfer-Encoding","value":"base64"}],'
+    '"body":{"size":,"data":"PGRpdiBkaXI9Imx0ciI-PC9kaXY-PGh0bWw-PGhlYWQ-"'
+    '}}]},"sizeEstimate":,"historyId":"","internalDate":""}'
+).encode('utf-8')
+
+
+def _load_zstd():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+class _Codec:
+    """Nén/giải nén từng bản ghi với từ điển dùng chung"""
+
+    def __init__(self, codec, dictionary):
+        self.codec = codec
+        self.dictionary = dictionary
+        if codec == CODEC_ZSTD:
+            zstandard = _load_zstd()
+            if zstandard is None:
+                raise RuntimeError(
+                    "Kho được nén bằng zstd, cần cài thư viện zstandard")
+            self._zstd = zstandard
+            self._dict = zstandard.ZstdCompressionDict(
+                dictionary, dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+            self._compressor = zstandard.ZstdCompressor(
+                level=ZSTD_LEVEL, dict_data=self._dict)
+        elif codec != CODEC_ZLIB:
+            raise ValueError(f"Mã nén không hỗ trợ: {codec}")
+
+    def compress(self, data):
+        if self.codec == CODEC_ZSTD:
+            return self._compressor.compress(data)
+        compressor = zlib.compressobj(ZLIB_LEVEL, zdict=self.dictionary)
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data):
+        if self.codec == CODEC_ZSTD:
+            # ZstdDecompressor không dùng chung được giữa các thread
+            decompressor = self._zstd.ZstdDecompressor(dict_data=self._dict)
+            return decompressor.decompress(data)
+        decompressor = zlib.decompressobj(zdict=self.dictionary)
+        return decompressor.decompress(data) + decompressor.flush()
+
+
+class _ProcessLock:
+    """Khoá giữa các tiến trình trên một file khoá riêng"""
+
+    def __init__(self, path):
+        self._file = open(path, 'a+b')
+
+    @contextmanager
+    def hold(self, shared=False, timeout=LOCK_TIMEOUT):
+        """Giữ khoá, ném TimeoutError nếu chờ quá timeout giây"""
+        fd = self._file.fileno()
+        if fcntl is not None:
+            mode = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+            self._acquire(lambda: fcntl.flock(fd, mode | fcntl.LOCK_NB),
+                          timeout)
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            return
+        # msvcrt chỉ có khoá độc quyền trên một vùng byte
+        self._file.seek(0)
+        self._acquire(lambda: msvcrt.locking(fd, msvcrt.LK_NBLCK, 1), timeout)
+        try:
+            yield
+        finally:
+            self._file.seek(0)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+    def _acquire(self, try_lock, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                try_lock()
+                return
+            except OSError:
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(
+                        f"Kho đang bị tiến trình khác khoá quá {timeout:g} "
+                        f"giây: {self._file.name}") from None
+                time.sleep(LOCK_RETRY_SECONDS)
+
+    def close(self):
+        self._file.close()
+
+
+def _slot_hash(key):
+    return int.from_bytes(
+        hashlib.blake2b(key, digest_size=8).digest(), 'little')
+
+
+def _encode_id(msg_id):
+    key = msg_id.encode('ascii')
+    if not key or len(key) > MAX_ID_BYTES:
+        raise ValueError(f"Id message không hợp lệ cho kho: {msg_id!r}")
+    return key
+
+
+class RawArchive:
+    """Kho message thô, truy cập ngẫu nhiên theo id"""
+
+    def __init__(self, path=DEFAULT_ARCHIVE_PATH):
+        self.archive_path = path + ARCHIVE_SUFFIX
+        self.index_path = path + INDEX_SUFFIX
+        self._lock = threading.Lock()
+        self._process_lock = _ProcessLock(path + LOCK_SUFFIX)
+        self._file = None
+        self._index_file = None
+        self._index = None
+        with self._process_lock.hold():
+            self._open()
+
+    @contextmanager
+    def _locked(self, shared=False):
+        """Giữ khoá thread và khoá tiến trình, đồng bộ với tiến trình khác"""
+        with self._lock, self._process_lock.hold(shared):
+            self._sync()
+            yield
+
+    # --- Mở kho và chỉ mục ---
+
+    def _sync(self):
+        """Đọc lại chỉ mục nếu tiến trình khác đã thêm bản ghi hoặc mở rộng"""
+        if (os.stat(self.index_path).st_ino
+                != os.fstat(self._index_file.fileno()).st_ino):
+            # Bảng băm đã được thay bằng bảng lớn hơn
+            self._unmap_index()
+            self._map_index()
+        else:
+            _, self._capacity, self._count = INDEX_HEADER.unpack_from(
+                self._index, 0)
+
+    def _open(self):
+        if not os.path.exists(self.archive_path):
+            zstandard = _load_zstd()
+            codec = CODEC_ZSTD if zstandard is not None else CODEC_ZLIB
+            with open(self.archive_path, 'wb') as f:
+                f.write(ARCHIVE_HEADER.pack(
+                    ARCHIVE_MAGIC, codec, len(SHARED_DICTIONARY)))
+                f.write(SHARED_DICTIONARY)
+            if os.path.exists(self.index_path):
+                os.remove(self.index_path)
+
+        self._file = open(self.archive_path, 'r+b')
+        magic, codec, dict_size = ARCHIVE_HEADER.unpack(
+            self._file.read(ARCHIVE_HEADER.size))
+        if magic != ARCHIVE_MAGIC:
+            raise ValueError(f"Không phải kho message: {self.archive_path}")
+        self._codec = _Codec(codec, self._file.read(dict_size))
+        self._data_start = ARCHIVE_HEADER.size + dict_size
+
+        if not os.path.exists(self.index_path):
+            self._create_index(self.index_path, INITIAL_CAPACITY)
+            self._map_index()
+            self._rebuild_index()
+        else:
+            self._map_index()
+
+    def _create_index(self, path, capacity):
+        with open(path, 'wb') as f:
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, capacity, 0))
+            f.truncate(INDEX_HEADER.size + capacity * SLOT.size)
+
+    def _map_index(self):
+        self._index_file = open(self.index_path, 'r+b')
+        self._index = mmap.mmap(self._index_file.fileno(), 0)
+        magic, self._capacity, self._count = INDEX_HEADER.unpack_from(
+            self._index, 0)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"Chỉ mục không hợp lệ: {self.index_path}")
+
+    def _unmap_index(self):
+        if self._index is not None:
+            self._index.close()
+            self._index_file.close()
+            self._index = self._index_file = None
+
+    def _read_record(self, offset, file_size):
+        """(id, độ dài) nếu ở offset là một bản ghi hợp lệ, None nếu không
+
+        Bản ghi hợp lệ khi giải nén được và id trong JSON khớp với id ghi
+        ở đầu bản ghi.
+        """
+        self._file.seek(offset)
+        header = self._file.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return None
+        id_size, data_size = RECORD_HEADER.unpack(header)
+        length = RECORD_HEADER.size + id_size + data_size
+        if not 0 < id_size <= MAX_ID_BYTES or offset + length > file_size:
+            return None
+        key = self._file.read(id_size)
+        if not ID_PATTERN.fullmatch(key):
+            return None
+        try:
+            message = json.loads(self._codec.decompress(
+                self._file.read(data_size)))
+        except Exception:
+            return None
+        if not isinstance(message, dict) or message.get('id') != key.decode(
+                'ascii'):
+            return None
+        return key, length
+
+    def _rebuild_index(self):
+        """Dựng lại chỉ mục từ các bản ghi trong kho
+
+        Gặp dữ liệu hỏng thì dò từng byte đến bản ghi hợp lệ tiếp theo, không
+        cắt bỏ phần còn lại của kho.
+        """
+        file_size = os.path.getsize(self.archive_path)
+        offset = self._data_start
+        skipped = 0
+        while offset < file_size:
+            record = self._read_record(offset, file_size)
+            if record is None:
+                offset += 1
+                skipped += 1
+                continue
+            key, length = record
+            self._insert(key, offset, length)
+            offset += length
+        if skipped:
+            print(f"Bỏ qua {skipped} byte hỏng trong {self.archive_path}")
+
+    # --- Bảng băm trong mmap ---
+
+    def _slot_offset(self, position):
+        return INDEX_HEADER.size + position * SLOT.size
+
+    def _probe(self, key):
+        """Vị trí ô chứa key, hoặc ô trống đầu tiên nếu chưa có"""
+        padded = key.ljust(MAX_ID_BYTES, b'\0')
+        position = _slot_hash(key) % self._capacity
+        while True:
+            slot_key, offset, length = SLOT.unpack_from(
+                self._index, self._slot_offset(position))
+            if slot_key == padded or not slot_key[0]:
+                return position, slot_key == padded, offset, length
+            position = (position + 1) % self._capacity
+
+    def _insert(self, key, offset, length):
+        if (self._count + 1) > self._capacity * MAX_LOAD:
+            self._grow()
+        position, found, _, _ = self._probe(key)
+        SLOT.pack_into(self._index, self._slot_offset(position),
+                       key, offset, length)
+        if not found:
+            self._count += 1
+            INDEX_HEADER.pack_into(self._index, 0, INDEX_MAGIC,
+                                   self._capacity, self._count)
+
+    def _grow(self):
+        """Chuyển sang bảng gấp đôi số ô, ghi ra file tạm rồi thay thế"""
+        entries = []
+        for position in range(self._capacity):
+            slot_key, offset, length = SLOT.unpack_from(
+                self._index, self._slot_offset(position))
+            if slot_key[0]:
+                entries.append((slot_key.rstrip(b'\0'), offset, length))
+        capacity = self._capacity * 2
+        temp_path = self.index_path + '.tmp'
+        self._create_index(temp_path, capacity)
+        self._unmap_index()
+        os.replace(temp_path, self.index_path)
+        self._map_index()
+        for key, offset, length in entries:
+            self._insert(key, offset, length)
+
+    # --- API ---
+
+    def __len__(self):
+        with self._locked(shared=True):
+            return self._count
+
+    def __contains__(self, msg_id):
+        key = _encode_id(msg_id)
+        with self._locked(shared=True):
+            return self._probe(key)[1]
+
+    def append(self, message):
+        """Thêm message (dict từ Gmail API), bỏ qua nếu id đã có"""
+        key = _encode_id(message['id'])
+        data = json.dumps(message, ensure_ascii=False,
+                          separators=(',', ':')).encode('utf-8')
+        with self._locked():
+            if self._probe(key)[1]:
+                return False
+            compressed = self._codec.compress(data)
+            self._file.seek(0, os.SEEK_END)
+            offset = self._file.tell()
+            self._file.write(RECORD_HEADER.pack(len(key), len(compressed)))
+            self._file.write(key)
+            self._file.write(compressed)
+            self._file.flush()
+            self._insert(key, offset,
+                         RECORD_HEADER.size + len(key) + len(compressed))
+            return True
+
+    def get(self, msg_id):
+        """Message theo id, None nếu không có trong kho"""
+        key = _encode_id(msg_id)
+        with self._locked(shared=True):
+            _, found, offset, length = self._probe(key)
+            if not found:
+                return None
+            self._file.seek(offset)
+            record = self._file.read(length)
+        id_size, _ = RECORD_HEADER.unpack_from(record)
+        data = record[RECORD_HEADER.size + id_size:]
+        return json.loads(self._codec.decompress(data))
+
+    def ids(self):
+        """Id message theo thứ tự được ghi vào kho"""
+        with self._locked(shared=True):
+            slots = []
+            for position in range(self._capacity):
+                slot_key, offset, _ = SLOT.unpack_from(
+                    self._index, self._slot_offset(position))
+                if slot_key[0]:
+                    slots.append((offset, slot_key.rstrip(b'\0').decode(
+                        'ascii')))
+        slots.sort()
+        return [msg_id for _, msg_id in slots]
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._index.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._unmap_index()
+            self._process_lock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
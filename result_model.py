@@ -0,0 +1,146 @@
+"""Mô hình dữ liệu cho danh sách email với khoá sắp xếp tính sẵn.
+
+Mỗi cột của danh sách có một chỉ mục đã sắp xếp, nên việc sắp xếp không
+phải đọc lại Treeview hay parse lại header Date, còn lọc theo người gửi
+hoặc khoảng thời gian chỉ cần tìm nhị phân trên chỉ mục tương ứng.
+"""
+import bisect
+from email.utils import parseaddr, parsedate_to_datetime
+
+# Giá trị cho email không parse được ngày, luôn đứng đầu khi sắp tăng dần
+MISSING_TIMESTAMP = float('-inf')
+
+COLUMNS = ('No', 'From', 'Subject', 'Date')
+
+
+def parse_timestamp(date):
+    """Chuyển header Date (RFC 2822) thành epoch timestamp"""
+    try:
+        return parsedate_to_datetime(date).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return MISSING_TIMESTAMP
+
+
+def normalize_sender(sender):
+    """Tách địa chỉ và tên miền người gửi, đã chuẩn hoá chữ thường"""
+    address = parseaddr(sender)[1].casefold() or sender.casefold().strip()
+    domain = address.rpartition('@')[2]
+    return address, domain
+
+
+class EmailRow:
+    __slots__ = ('msg_id', 'index', 'sender', 'subject', 'date',
+                 'timestamp', 'address', 'domain', 'subject_key')
+
+    def __init__(self, msg_id, index, sender, subject, date,
+                 timestamp=None, address=None):
+        self.msg_id = msg_id
+        self.index = index
+        self.sender = sender
+        self.subject = subject
+        self.date = date
+        # Dùng lại giá trị đã parse sẵn nếu có (từ EmailRecord)
+        if timestamp is None:
+            timestamp = parse_timestamp(date)
+        self.timestamp = timestamp
+        if address is None:
+            self.address, self.domain = normalize_sender(sender)
+        else:
+            self.address, self.domain = address, address.rpartition('@')[2]
+        self.subject_key = subject.casefold()
+
+    def values(self):
+        """Giá trị hiển thị theo thứ tự các cột của Treeview"""
+        return (self.index, self.sender, self.subject, self.date)
+
+    def sort_key(self, column):
+        if column == 'No':
+            return self.index
+        if column == 'From':
+            return self.address
+        if column == 'Subject':
+            return self.subject_key
+        return self.timestamp
+
+
+class EmailResultModel:
+    """Tập kết quả trong bộ nhớ kèm chỉ mục sắp xếp cho từng cột"""
+
+    def __init__(self):
+        self.rows = {}
+        # Mỗi chỉ mục là danh sách (khoá, msg_id) đã sắp xếp
+        self._indexes = {column: [] for column in COLUMNS}
+        self._domains = []
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, msg_id):
+        return msg_id in self.rows
+
+    def get(self, msg_id):
+        return self.rows.get(msg_id)
+
+    def add(self, msg_id, index, sender, subject, date,
+            timestamp=None, address=None):
+        """Thêm một email, bỏ qua nếu đã có"""
+        if msg_id in self.rows:
+            return self.rows[msg_id]
+        row = EmailRow(msg_id, index, sender, subject, date,
+                       timestamp, address)
+        self.rows[msg_id] = row
+        for column, entries in self._indexes.items():
+            bisect.insort(entries, (row.sort_key(column), msg_id))
+        bisect.insort(self._domains, (row.domain, msg_id))
+        return row
+
+    def add_record(self, record, index):
+        """Thêm từ EmailRecord, không parse lại ngày và người gửi"""
+        return self.add(record.msg_id, index, record.sender, record.subject,
+                        record.date, record.timestamp, record.address)
+
+    def clear(self):
+        self.rows.clear()
+        for entries in self._indexes.values():
+            entries.clear()
+        self._domains.clear()
+
+    def sorted_ids(self, column, descending=False):
+        ids = [msg_id for _, msg_id in self._indexes[column]]
+        if descending:
+            ids.reverse()
+        return ids
+
+    def ids_by_sender(self, text):
+        """Email có địa chỉ hoặc tên miền người gửi bắt đầu bằng text"""
+        prefix = text.casefold().strip()
+        result = set(self._prefix_scan(self._indexes['From'], prefix))
+        if '@' not in prefix:
+            result.update(self._prefix_scan(self._domains, prefix))
+        return result
+
+    def ids_by_date(self, start=None, end=None):
+        """Email có timestamp trong khoảng [start, end]"""
+        entries = self._indexes['Date']
+        low = 0 if start is None else bisect.bisect_left(
+            entries, start, key=lambda entry: entry[0])
+        high = len(entries) if end is None else bisect.bisect_right(
+            entries, end, key=lambda entry: entry[0])
+        return {msg_id for _, msg_id in entries[low:high]}
+
+    def filter_ids(self, sender=None, start=None, end=None):
+        """Giao của các điều kiện lọc, trả về None nếu không lọc gì"""
+        result = None
+        if sender:
+            result = self.ids_by_sender(sender)
+        if start is not None or end is not None:
+            by_date = self.ids_by_date(start, end)
+            result = by_date if result is None else result & by_date
+        return result
+
+    @staticmethod
+    def _prefix_scan(entries, prefix):
+        position = bisect.bisect_left(entries, (prefix,))
+        while position < len(entries) and entries[position][0].startswith(prefix):
+            yield entries[position][1]
+            position += 1
@@ -0,0 +1,79 @@
+"""Huỷ và quản lý các lần chạy nền (phân tích, đồng bộ) của giao diện.
+
+- CancelToken: cờ huỷ dùng chung giữa main thread và worker. Worker kiểm
+  tra giữa các bước (liệt kê, tải từng email, render), QuotaLimiter kiểm
+  tra trước mỗi lần gọi API và khi chờ thử lại.
+- RunManager: mỗi cửa sổ chỉ có một lần chạy; bắt đầu lần chạy mới thì
+  lần chạy trước bị huỷ, đóng cửa sổ thì huỷ và chờ worker dừng.
+"""
+import threading
+
+# Thời gian chờ worker dừng khi đóng cửa sổ (giây)
+SHUTDOWN_TIMEOUT = 2.0
+
+
+class RunCancelled(Exception):
+    """Lần chạy đã bị huỷ (bấm Huỷ, chạy lại hoặc đóng cửa sổ)"""
+
+
+class CancelToken:
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        """Ném RunCancelled nếu đã bị huỷ, gọi giữa các bước của worker"""
+        if self._event.is_set():
+            raise RunCancelled()
+
+    def wait(self, timeout):
+        """Ngủ tối đa timeout giây, dậy sớm khi bị huỷ; True nếu bị huỷ"""
+        return self._event.wait(timeout)
+
+
+class RunManager:
+    """Lần chạy nền duy nhất của một cửa sổ"""
+
+    def __init__(self):
+        self.token = None
+        self.thread = None
+
+    @property
+    def active(self):
+        return (self.thread is not None and self.thread.is_alive()
+                and not self.token.cancelled)
+
+    def start(self, target, *args):
+        """Huỷ lần chạy trước rồi chạy target(token, *args) ở thread nền"""
+        self.cancel()
+        token = CancelToken()
+        self.token = token
+        self.thread = threading.Thread(
+            target=self._run, args=(target, token, args), daemon=True)
+        self.thread.start()
+        return token
+
+    @staticmethod
+    def _run(target, token, args):
+        try:
+            target(token, *args)
+        except RunCancelled:
+            pass
+
+    def cancel(self):
+        if self.token is not None:
+            self.token.cancel()
+
+    def shutdown(self, timeout=SHUTDOWN_TIMEOUT):
+        """Huỷ và chờ worker dừng; False nếu worker vẫn còn chạy"""
+        self.cancel()
+        if self.thread is None:
+            return True
+        self.thread.join(timeout)
+        return not self.thread.is_alive()
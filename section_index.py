@@ -0,0 +1,150 @@
+"""Chỉ mục các đoạn báo cáo để tạo lại báo cáo theo kiểu cập nhật dần.
+
+File chỉ mục đi kèm báo cáo (JSON lines), mỗi dòng là một đoạn "Email #i"
+(hoặc một hội thoại) với id, mã băm nội dung, vị trí byte trong báo cáo,
+trạng thái và chỉ số thống kê. Khi chạy lại, báo cáo cũ được chuyển sang
+file .prev; email có nội dung không đổi được chép nguyên văn đoạn cũ (chỉ
+đánh lại số thứ tự), chỉ email mới hoặc đã thay đổi mới được phân tích và
+format lại. Phần thống kê tổng quan luôn được tính lại.
+
+Chỉ đoạn có trạng thái 'ok' được dùng lại: đoạn email trùng lặp tham chiếu
+tới số thứ tự của email khác nên luôn được tạo lại.
+"""
+import hashlib
+import json
+import os
+import re
+from dataclasses import asdict, dataclass
+
+SECTIONS_SUFFIX = '.sections'
+# Chỉ mục đang ghi của lượt chạy hiện tại, thay chỉ mục cũ khi hoàn tất
+PENDING_SUFFIX = '.new'
+PREVIOUS_SUFFIX = '.prev'
+
+# Dòng tiêu đề đoạn chứa số thứ tự: "Email #3", "Email #3.2", "Hội thoại #3:"
+NUMBER_PATTERN = r'^((?:Email|Hội thoại) #){old}(?=[.:]|$)'
+
+
+@dataclass(slots=True)
+class SectionEntry:
+    item_id: str
+    digest: str
+    position: int
+    offset: int
+    length: int
+    status: str
+    metrics: object = None
+
+
+def content_digest(item):
+    """Mã băm nội dung của EmailRecord hoặc ThreadRecord"""
+    digest = hashlib.sha256()
+    for record in getattr(item, 'messages', None) or (item,):
+        for value in (record.msg_id, record.subject, record.sender,
+                      record.date, record.body):
+            digest.update(value.encode('utf-8', errors='replace'))
+            digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def renumber(section, old, new):
+    """Đổi số thứ tự trong các dòng tiêu đề của đoạn báo cáo"""
+    if old == new:
+        return section
+    pattern = re.compile(NUMBER_PATTERN.format(old=old), re.MULTILINE)
+    return pattern.sub(lambda match: f"{match.group(1)}{new}", section)
+
+
+def _read_entries(path):
+    """Đọc chỉ mục, bỏ qua dòng cuối ghi dở; id trùng thì lấy dòng sau"""
+    entries = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = SectionEntry(**json.loads(line))
+            except (ValueError, TypeError):
+                break
+            entries[entry.item_id] = entry
+    return entries
+
+
+class SectionIndex:
+    def __init__(self, report_path):
+        self.report_path = report_path
+        self.path = report_path + SECTIONS_SUFFIX
+        self.pending_path = self.path + PENDING_SUFFIX
+        self.previous_path = report_path + PREVIOUS_SUFFIX
+        # Đoạn của lượt chạy trước, tra theo id
+        self.cached = {}
+        self.reused = 0
+        self._previous = None
+        self._file = None
+
+    def start(self):
+        """Bắt đầu lượt chạy mới: chuyển báo cáo cũ sang .prev để chép lại"""
+        self.close()
+        if os.path.exists(self.path) and os.path.exists(self.report_path):
+            os.replace(self.report_path, self.previous_path)
+            os.replace(self.path, self.previous_path + SECTIONS_SUFFIX)
+        self._open_previous()
+        self._file = open(self.pending_path, 'w', encoding='utf-8')
+
+    def resume(self, offset):
+        """Chạy tiếp lượt bị dừng, bỏ các đoạn nằm sau vị trí offset"""
+        self.close()
+        self._open_previous()
+        entries = {}
+        if os.path.exists(self.pending_path):
+            entries = _read_entries(self.pending_path)
+        self._file = open(self.pending_path, 'w', encoding='utf-8')
+        for entry in entries.values():
+            if entry.offset + entry.length <= offset:
+                self._append(entry)
+
+    def _open_previous(self):
+        previous_index = self.previous_path + SECTIONS_SUFFIX
+        if os.path.exists(self.previous_path) and os.path.exists(
+                previous_index):
+            self.cached = _read_entries(previous_index)
+            self._previous = open(self.previous_path, 'rb')
+
+    def lookup(self, item_id, digest, position):
+        """Đoạn báo cáo cũ (entry, văn bản) nếu nội dung không đổi"""
+        entry = self.cached.get(item_id)
+        if (entry is None or self._previous is None or entry.digest != digest
+                or entry.status != 'ok'):
+            return None
+        self._previous.seek(entry.offset)
+        data = self._previous.read(entry.length)
+        if len(data) != entry.length:
+            return None
+        self.reused += 1
+        section = renumber(data.decode('utf-8'), entry.position, position)
+        return entry, section
+
+    def record(self, item_id, digest, position, offset, length, status,
+               metrics=None):
+        self._append(SectionEntry(item_id, digest, position, offset, length,
+                                  status, metrics))
+
+    def _append(self, entry):
+        self._file.write(json.dumps(asdict(entry), ensure_ascii=False) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def finish(self):
+        """Lượt chạy hoàn tất: dùng chỉ mục mới, xoá báo cáo cũ"""
+        self.close()
+        os.replace(self.pending_path, self.path)
+        for path in (self.previous_path,
+                     self.previous_path + SECTIONS_SUFFIX):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._previous is not None:
+            self._previous.close()
+            self._previous = None
@@ -0,0 +1,67 @@
+"""Ảnh chụp phiên làm việc gần nhất để GUI hiển thị ngay khi mở.
+
+Ảnh chụp gồm các dòng trong danh sách email và nội dung đã render (văn bản
+kèm tag spans), lưu dưới dạng JSON nén zlib trong một file duy nhất.
+"""
+import json
+import os
+import time
+import zlib
+
+from text_formatter import RENDERER_VERSION
+
+SNAPSHOT_VERSION = 1
+DEFAULT_SNAPSHOT_PATH = 'last_session.snapshot'
+
+
+def snapshot_entry(msg_id, index, subject, sender, date, view=None):
+    entry = {
+        'id': msg_id,
+        'index': index,
+        'subject': subject,
+        'from': sender,
+        'date': date
+    }
+    if view is not None:
+        entry['text'] = view.text
+        entry['spans'] = view.spans
+    return entry
+
+
+def save_snapshot(entries, path=DEFAULT_SNAPSHOT_PATH):
+    """Ghi ảnh chụp, thay thế file cũ một cách nguyên tử"""
+    data = json.dumps({
+        'version': SNAPSHOT_VERSION,
+        'renderer': RENDERER_VERSION,
+        'saved_at': time.time(),
+        'emails': entries
+    }, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(zlib.compress(data))
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path=DEFAULT_SNAPSHOT_PATH):
+    """Đọc ảnh chụp, trả về danh sách entry (rỗng nếu không có hoặc lỗi)"""
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path, 'rb') as f:
+            snapshot = json.loads(zlib.decompress(f.read()).decode('utf-8'))
+    except (OSError, ValueError, zlib.error) as e:
+        print(f"Không đọc được ảnh chụp phiên trước: {str(e)}")
+        return []
+
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+        return []
+    entries = snapshot.get('emails', [])
+    for entry in entries:
+        if snapshot.get('renderer') != RENDERER_VERSION:
+            # Nội dung render bằng phiên bản cũ thì bỏ, chỉ giữ dòng danh sách
+            entry.pop('text', None)
+            entry.pop('spans', None)
+        elif 'spans' in entry:
+            entry['spans'] = [tuple(span) for span in entry['spans']]
+    return entries
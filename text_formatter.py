@@ -0,0 +1,196 @@
+"""Engine định dạng nội dung email cho Text widget.
+
+Các khoảng định dạng được tính sẵn dưới dạng (dòng, cột) ngay khi chuyển
+HTML sang văn bản, sau đó văn bản và tag được chèn cùng nhau theo từng khối
+thay vì đọc lại widget và gọi tag_add cho từng match.
+"""
+import html
+import re
+from collections import Counter
+
+# Phiên bản renderer, tăng lên khi thay đổi cách format/tính tag
+RENDERER_VERSION = 1
+
+# Số ký tự tối đa chèn trong một lần gọi Tk (giữ mỗi lần dưới một frame)
+DEFAULT_CHUNK_CHARS = 20000
+
+HEADING_PATTERN = re.compile(r'^#.*$', re.MULTILINE)
+ITALIC_PATTERN = re.compile(r'\*(.*?)\*')
+LINK_PATTERN = re.compile(
+    r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
+BLANK_LINES_PATTERN = re.compile(r'\n\s*\n')
+
+TAG_PATTERNS = (
+    ('bold', HEADING_PATTERN),
+    ('italic', ITALIC_PATTERN),
+    ('link', LINK_PATTERN),
+)
+
+
+class RenderedView:
+    """Văn bản đã format cùng các khoảng tag (tag, dòng, cột, dòng, cột)"""
+    __slots__ = ('text', 'spans')
+
+    def __init__(self, text, spans):
+        self.text = text
+        self.spans = spans
+
+    def line_starts(self):
+        """Vị trí ký tự bắt đầu của từng dòng"""
+        starts = [0]
+        find = self.text.find
+        pos = find('\n')
+        while pos != -1:
+            starts.append(pos + 1)
+            pos = find('\n', pos + 1)
+        return starts
+
+    def segments(self):
+        """Chia văn bản thành các đoạn (text, tags) liên tiếp"""
+        text = self.text
+        if not self.spans:
+            return [(text, ())] if text else []
+
+        starts = self.line_starts()
+        opening = {}
+        closing = {}
+        for tag, start_line, start_col, end_line, end_col in self.spans:
+            start = starts[start_line - 1] + start_col
+            end = starts[end_line - 1] + end_col
+            opening.setdefault(start, []).append(tag)
+            closing.setdefault(end, []).append(tag)
+
+        points = sorted({0, len(text), *opening, *closing})
+        active = Counter()
+        segments = []
+        for start, end in zip(points, points[1:]):
+            for tag in closing.get(start, ()):
+                active[tag] -= 1
+            for tag in opening.get(start, ()):
+                active[tag] += 1
+            tags = tuple(sorted(tag for tag, count in active.items() if count))
+            if segments and segments[-1][1] == tags:
+                segments[-1] = (segments[-1][0] + text[start:end], tags)
+            else:
+                segments.append((text[start:end], tags))
+        return segments
+
+
+def find_spans(text):
+    """Tìm các khoảng cần định dạng, trả về theo (dòng, cột) của Tk"""
+    matches = []
+    for tag, pattern in TAG_PATTERNS:
+        for match in pattern.finditer(text):
+            if match.end() > match.start():
+                matches.append((match.start(), match.end(), tag))
+    if not matches:
+        return []
+
+    return _resolve_spans(text, matches)
+
+
+def _resolve_spans(text, matches):
+    """Quy đổi các bộ (start, end, tag) theo offset sang (dòng, cột)"""
+    matches.sort()
+    line = 1
+    line_start = 0
+    cursor = 0
+    # Các vị trí cần quy đổi được duyệt theo thứ tự tăng dần nên chỉ cần
+    # đếm số dòng một lần từ đầu đến cuối văn bản
+    positions = sorted({offset for start, end, _ in matches
+                        for offset in (start, end)})
+    resolved = {}
+    for offset in positions:
+        newlines = text.count('\n', cursor, offset)
+        if newlines:
+            line += newlines
+            line_start = text.rfind('\n', cursor, offset) + 1
+        cursor = offset
+        resolved[offset] = (line, offset - line_start)
+
+    return [(tag, *resolved[start], *resolved[end])
+            for start, end, tag in matches]
+
+
+def marked_view(text, start_marker, end_marker, tag):
+    """Bỏ các ký tự đánh dấu và gắn tag cho đoạn nằm giữa chúng"""
+    parts = []
+    matches = []
+    length = 0
+    start = None
+    for piece in re.split(f'({re.escape(start_marker)}|{re.escape(end_marker)})',
+                          text):
+        if piece == start_marker:
+            start = length
+        elif piece == end_marker:
+            if start is not None and length > start:
+                matches.append((start, length, tag))
+            start = None
+        else:
+            parts.append(piece)
+            length += len(piece)
+    plain = ''.join(parts)
+    return RenderedView(plain, _resolve_spans(plain, matches) if matches else [])
+
+
+def format_html(converter, content):
+    """Chuyển HTML thành văn bản có định dạng kèm các khoảng tag"""
+    # Chuyển đổi HTML thành Markdown
+    text = converter.handle(content)
+
+    # Xử lý các ký tự đặc biệt
+    text = html.unescape(text)
+
+    # Loại bỏ khoảng trắng thừa
+    text = BLANK_LINES_PATTERN.sub('\n\n', text)
+
+    return RenderedView(text, find_spans(text))
+
+
+def plain_view(content):
+    """Tạo view không qua html2text (dùng khi format lỗi)"""
+    return RenderedView(content, find_spans(content))
+
+
+class ChunkedTextRenderer:
+    """Chèn văn bản và tag vào Text widget theo từng khối"""
+
+    def __init__(self, widget, chunk_chars=DEFAULT_CHUNK_CHARS):
+        self.widget = widget
+        self.chunk_chars = chunk_chars
+        self._job = None
+
+    def cancel(self):
+        """Huỷ phần render còn dang dở"""
+        if self._job is not None:
+            self.widget.after_cancel(self._job)
+            self._job = None
+
+    def render(self, view):
+        """Xoá nội dung cũ và render view mới"""
+        self.cancel()
+        self.widget.delete('1.0', 'end')
+        self._insert_next(iter(self._chunked(view.segments())))
+
+    def _chunked(self, segments):
+        # Tách các đoạn quá dài để mỗi lần chèn không vượt quá chunk_chars
+        size = self.chunk_chars
+        for text, tags in segments:
+            for start in range(0, len(text), size):
+                yield text[start:start + size], tags
+
+    def _insert_next(self, pieces):
+        self._job = None
+        args = []
+        inserted = 0
+        for text, tags in pieces:
+            args.append(text)
+            args.append(tags)
+            inserted += len(text)
+            if inserted >= self.chunk_chars:
+                break
+        if args:
+            self.widget.insert('end', *args)
+        if inserted >= self.chunk_chars:
+            # Nhường event loop rồi chèn tiếp khối sau
+            self._job = self.widget.after(1, self._insert_next, pieces)
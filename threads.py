@@ -0,0 +1,144 @@
+"""Xử lý email theo cuộc hội thoại (thread) của Gmail.
+
+Mỗi thread được tải bằng một lần gọi threads().get thay vì gọi
+messages().get cho từng email. Phần trích dẫn thư cũ trong các email trả
+lời được bỏ đi trước khi phân tích, vì nội dung đó đã có trong email trước
+của cùng thread.
+"""
+import re
+
+# Dòng giới thiệu phần trích dẫn: "On ... wrote:", "Vào ... đã viết:"
+ATTRIBUTION_PATTERN = re.compile(
+    r'^\s*(On\b.+\bwrote:|Vào\b.+\bđã viết:)\s*$', re.IGNORECASE)
+# Thư gốc kiểu Outlook
+ORIGINAL_MESSAGE_PATTERN = re.compile(
+    r'^\s*(-{2,}\s*(Original Message|Thư gốc)\s*-{2,}|_{10,})\s*$',
+    re.IGNORECASE)
+# Khối header "From: ... / Sent: ..." của thư được trả lời (Outlook)
+HEADER_BLOCK_PATTERN = re.compile(r'^\s*(From|Từ):\s', re.IGNORECASE)
+HEADER_NEXT_PATTERN = re.compile(
+    r'^\s*(Sent|Date|Đã gửi|Ngày):\s', re.IGNORECASE)
+
+# Thẻ HTML bao phần trích dẫn của các ứng dụng email phổ biến
+HTML_QUOTE_PATTERN = re.compile(
+    r'<(?:div|blockquote)[^>]*\bclass="[^"]*\b(?:gmail_quote|yahoo_quoted|'
+    r'moz-cite-prefix)\b'
+    r'|<blockquote[^>]*\btype="cite"'
+    r'|<div[^>]*\bid="(?:divRplyFwdMsg|appendonsend)"',
+    re.IGNORECASE)
+# Thư chuyển tiếp cũng dùng gmail_quote nhưng là nội dung mới, không bỏ
+FORWARD_PATTERN = re.compile(
+    r'Forwarded message|Thư được chuyển tiếp', re.IGNORECASE)
+FORWARD_LOOKAHEAD = 400
+# Phần cuối đã nhận được giữ lại khi lọc theo luồng, để thẻ trích dẫn nằm
+# vắt qua hai khúc vẫn khớp
+HTML_QUOTE_OVERLAP = 1024
+
+
+def strip_quoted_text(text):
+    """Bỏ phần trích dẫn trong nội dung text/plain"""
+    lines = text.splitlines()
+    kept = []
+    for i, line in enumerate(lines):
+        if line.lstrip().startswith('>'):
+            continue
+        following = lines[i + 1] if i + 1 < len(lines) else ''
+        if (ATTRIBUTION_PATTERN.match(line)
+                or ORIGINAL_MESSAGE_PATTERN.match(line)
+                # "On ... <địa chỉ>" và "wrote:" bị ngắt thành hai dòng
+                or ATTRIBUTION_PATTERN.match(f"{line} {following}")
+                or (HEADER_BLOCK_PATTERN.match(line)
+                    and HEADER_NEXT_PATTERN.match(following))):
+            break
+        kept.append(line)
+    return '\n'.join(kept).rstrip()
+
+
+def strip_quoted_html(content):
+    """Cắt nội dung HTML tại khối trích dẫn đầu tiên (trừ thư chuyển tiếp)"""
+    for match in HTML_QUOTE_PATTERN.finditer(content):
+        window = content[match.end():match.end() + FORWARD_LOOKAHEAD]
+        if not FORWARD_PATTERN.search(window):
+            return content[:match.start()]
+    return content
+
+
+def strip_quoted(content, mime_type):
+    if 'text/html' in mime_type:
+        return strip_quoted_html(content)
+    return strip_quoted_text(content)
+
+
+def iter_unquoted(chunks, mime_type):
+    """strip_quoted cho văn bản đến theo từng khúc (phần nội dung rất lớn)
+
+    Dừng đọc chunks ngay khi gặp chỗ cắt.
+    """
+    if 'text/html' in mime_type:
+        return _iter_unquoted_html(chunks)
+    return _iter_unquoted_text(chunks)
+
+
+def _iter_unquoted_text(chunks):
+    def lines():
+        pending = ''
+        for chunk in chunks:
+            pending += chunk
+            complete, newline, pending = pending.rpartition('\n')
+            if newline:
+                yield from (complete + newline).splitlines()
+        if pending:
+            yield from pending.splitlines()
+
+    line = None
+    for following in lines():
+        if line is not None:
+            if _quote_starts(line, following):
+                return
+            if not line.lstrip().startswith('>'):
+                yield line + '\n'
+        line = following
+    if line is not None and not _quote_starts(line, ''):
+        if not line.lstrip().startswith('>'):
+            yield line
+
+
+def _quote_starts(line, following):
+    """Giống điều kiện cắt của strip_quoted_text"""
+    return bool(ATTRIBUTION_PATTERN.match(line)
+                or ORIGINAL_MESSAGE_PATTERN.match(line)
+                or ATTRIBUTION_PATTERN.match(f"{line} {following}")
+                or (HEADER_BLOCK_PATTERN.match(line)
+                    and HEADER_NEXT_PATTERN.match(following)))
+
+
+def _iter_unquoted_html(chunks):
+    buffer = ''
+    for chunk in chunks:
+        buffer += chunk
+        cut, safe = _html_quote_cut(buffer, final=False)
+        if cut is not None:
+            if cut:
+                yield buffer[:cut]
+            return
+        if safe:
+            yield buffer[:safe]
+            buffer = buffer[safe:]
+    cut, _ = _html_quote_cut(buffer, final=True)
+    buffer = buffer if cut is None else buffer[:cut]
+    if buffer:
+        yield buffer
+
+
+def _html_quote_cut(buffer, final):
+    """(vị trí cắt hoặc None, số ký tự đầu đã chắc chắn giữ lại)"""
+    for match in HTML_QUOTE_PATTERN.finditer(buffer):
+        end = match.end() + FORWARD_LOOKAHEAD
+        if end > len(buffer) and not final:
+            # Chưa đủ đoạn phía sau để biết có phải thư chuyển tiếp
+            return None, match.start()
+        if not FORWARD_PATTERN.search(buffer, match.end(), end):
+            return match.start(), None
+    if final:
+        return None, len(buffer)
+    return None, max(len(buffer) - HTML_QUOTE_OVERLAP, 0)
@@ -0,0 +1,117 @@
+"""Cache LRU giới hạn theo tổng dung lượng.
+
+- ByteBoundedLRU: phần chung, bỏ các mục dùng lâu nhất khi vượt max_bytes.
+- RenderedViewCache: nội dung email đã render cho giao diện.
+- CleanedPartCache: phần nội dung đã làm sạch của bản CLI, khoá theo digest.
+"""
+import sys
+import threading
+from collections import OrderedDict
+
+from text_formatter import RENDERER_VERSION, RenderedView
+
+# Ước lượng số byte cho mỗi khoảng tag (tuple 5 phần tử)
+SPAN_BYTES = 120
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_PART_CACHE_BYTES = 16 * 1024 * 1024
+
+
+def view_size(view):
+    """Ước lượng dung lượng bộ nhớ của một view"""
+    return sys.getsizeof(view.text) + len(view.spans) * SPAN_BYTES
+
+
+class ByteBoundedLRU:
+    """LRU an toàn giữa các thread, giới hạn theo tổng size(value)
+
+    Lớp con đổi _key để ánh xạ khoá của người gọi sang khoá lưu trữ.
+    """
+
+    def __init__(self, max_bytes, size):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _key(self, key):
+        return key
+
+    def get(self, key):
+        """Giá trị đã lưu, None nếu chưa có"""
+        key = self._key(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value):
+        key = self._key(key)
+        size = self._size(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+            # Giá trị lớn hơn cả giới hạn thì không lưu
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes and self._entries:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted
+
+
+class RenderedViewCache(ByteBoundedLRU):
+    """Lưu văn bản đã format kèm tag spans, khoá theo (msg_id, renderer)"""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, version=RENDERER_VERSION):
+        super().__init__(max_bytes, view_size)
+        self.version = version
+
+    def _key(self, msg_id):
+        return (msg_id, self.version)
+
+    def __contains__(self, msg_id):
+        key = self._key(msg_id)
+        with self._lock:
+            return key in self._entries
+
+    def get_or_render(self, msg_id, render):
+        """Lấy view từ cache, nếu chưa có thì gọi render() và lưu lại"""
+        view = self.get(msg_id)
+        if view is None:
+            view = render()
+            self.put(msg_id, view)
+        return view
+
+    def warm_up(self, entries):
+        """Nạp sẵn cache từ prefetcher hoặc kho lưu trữ cục bộ
+
+        entries là iterable các bộ (msg_id, text, spans)
+        """
+        count = 0
+        for msg_id, text, spans in entries:
+            if msg_id not in self:
+                self.put(msg_id, RenderedView(text, spans))
+                count += 1
+        return count
+
+
+class CleanedPartCache(ByteBoundedLRU):
+    """Phần nội dung đã làm sạch, khoá theo (mime, charset, digest, ...)
+
+    Giá trị là (văn bản, thống kê). Chỉ giữ các phần dùng gần đây trong
+    giới hạn dung lượng: phần lặp lại (thông báo, chữ ký, HTML giống hệt)
+    không phải làm sạch lại, nhưng bộ nhớ không tăng theo số email đã xử lý.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_PART_CACHE_BYTES):
+        super().__init__(max_bytes, lambda value: sys.getsizeof(value[0]))
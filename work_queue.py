@@ -0,0 +1,164 @@
+"""Hàng đợi công việc dùng file SQLite trên ổ dùng chung.
+
+Coordinator đưa id email vào hàng đợi, các worker (có thể ở nhiều máy)
+thuê (lease) từng lô id, xử lý rồi ghi kết quả ra file shard. Lease hết hạn
+thì lô đó được trả lại hàng đợi để worker khác nhận, nên worker chết giữa
+chừng không làm mất việc. Bước merge gộp các shard thành báo cáo cuối.
+"""
+import glob
+import json
+import os
+import socket
+import sqlite3
+import time
+import uuid
+
+DEFAULT_QUEUE_PATH = 'work_queue.db'
+SHARDS_DIR = 'shards'
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_LEASE_SECONDS = 300
+# Số lần thuê tối đa trước khi coi một id là lỗi
+MAX_ATTEMPTS = 5
+BUSY_TIMEOUT = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    msg_id TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    owner TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    status TEXT
+);
+CREATE INDEX IF NOT EXISTS items_state ON items (state, position);
+"""
+
+
+def store_path(queue_path):
+    """Kho cục bộ (local_store) dùng chung của các worker trên hàng đợi"""
+    return os.path.splitext(queue_path)[0] + '.store.db'
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class WorkQueue:
+    def __init__(self, path=DEFAULT_QUEUE_PATH):
+        self.path = path
+        # isolation_level=None để tự quản lý transaction (BEGIN IMMEDIATE)
+        self._conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT,
+                                     isolation_level=None)
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def _transaction(self):
+        return _Transaction(self._conn)
+
+    def enqueue(self, ids):
+        """Thêm id vào cuối hàng đợi, bỏ qua id đã có"""
+        with self._transaction() as conn:
+            start = conn.execute(
+                'SELECT COALESCE(MAX(position), 0) FROM items').fetchone()[0]
+            conn.executemany(
+                'INSERT OR IGNORE INTO items (msg_id, position) VALUES (?, ?)',
+                [(msg_id, start + offset)
+                 for offset, msg_id in enumerate(ids, 1)])
+
+    def lease(self, worker_id, batch_size=DEFAULT_BATCH_SIZE,
+              lease_seconds=DEFAULT_LEASE_SECONDS):
+        """Thuê một lô id, trả về danh sách (position, msg_id)"""
+        now = time.time()
+        with self._transaction() as conn:
+            # Thu hồi các lease đã hết hạn của worker đã chết
+            conn.execute("""
+                UPDATE items SET
+                    state = CASE WHEN attempts >= ? THEN 'failed'
+                                 ELSE 'pending' END,
+                    status = CASE WHEN attempts >= ? THEN 'expired'
+                                  ELSE status END,
+                    owner = NULL, lease_expires = NULL
+                WHERE state = 'leased' AND lease_expires < ?
+            """, (MAX_ATTEMPTS, MAX_ATTEMPTS, now))
+            rows = conn.execute("""
+                SELECT position, msg_id FROM items
+                WHERE state = 'pending'
+                ORDER BY position
+                LIMIT ?
+            """, (batch_size,)).fetchall()
+            conn.executemany("""
+                UPDATE items SET state = 'leased', owner = ?,
+                    lease_expires = ?, attempts = attempts + 1
+                WHERE msg_id = ?
+            """, [(worker_id, now + lease_seconds, msg_id)
+                  for _, msg_id in rows])
+        return rows
+
+    def renew(self, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """Gia hạn mọi lease đang giữ của worker"""
+        with self._transaction() as conn:
+            conn.execute("""
+                UPDATE items SET lease_expires = ?
+                WHERE state = 'leased' AND owner = ?
+            """, (time.time() + lease_seconds, worker_id))
+
+    def complete(self, worker_id, statuses):
+        """Đánh dấu xong các id (msg_id -> status) mà worker còn giữ lease"""
+        with self._transaction() as conn:
+            conn.executemany("""
+                UPDATE items SET state = 'done', status = ?,
+                    owner = NULL, lease_expires = NULL
+                WHERE msg_id = ? AND state = 'leased' AND owner = ?
+            """, [(status, msg_id, worker_id)
+                  for msg_id, status in statuses.items()])
+
+    def counts(self):
+        rows = self._conn.execute(
+            'SELECT state, COUNT(*) FROM items GROUP BY state').fetchall()
+        return dict(rows)
+
+
+class _Transaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+
+
+def write_shard(shards_dir, worker_id, records):
+    """Ghi một lô kết quả ra file shard mới (ghi file tạm rồi đổi tên)
+
+    Tên file gồm vị trí đầu lô và một hậu tố ngẫu nhiên nên không bao giờ
+    trùng shard đã ghi, kể cả khi worker chạy lại với cùng --worker.
+    """
+    os.makedirs(shards_dir, exist_ok=True)
+    first = min(record['position'] for record in records)
+    path = os.path.join(
+        shards_dir,
+        f"{worker_id}-{first:09d}-{uuid.uuid4().hex[:12]}.jsonl")
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_shards(shards_dir):
+    """Các bản ghi trong mọi shard, mỗi id chỉ lấy một lần, theo thứ tự"""
+    records = {}
+    for path in sorted(glob.glob(os.path.join(shards_dir, '*.jsonl'))):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                # Lô bị thu hồi có thể đã được xử lý hai lần
+                records.setdefault(record['id'], record)
+    return sorted(records.values(), key=lambda record: record['position'])